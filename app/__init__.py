@@ -41,6 +41,30 @@ def create_app():
     login_manager.init_app(app)
     migrate.init_app(app, db)
 
+    # Batched analytics inserts, flushed off the request thread and at exit
+    from .utils.write_behind import analytics_writer
+    from .utils.rollups import apply_rows
+    analytics_writer.init_app(app)
+    # Keep the daily/hourly rollups in step with every flushed batch
+    analytics_writer.add_flush_listener(apply_rows)
+
+    # Per-user analytics response cache, invalidated by committed writes and write-behind flushes
+    from .utils.response_cache import response_cache
+    response_cache.init_app(app)
+    analytics_writer.add_flush_listener(response_cache.invalidate_rows, after_commit=True)
+
+    # Edit/delete counters behind the conditional GET version tokens
+    from .utils import conditional
+    conditional.init_app(app)
+
+    # Background export jobs (run in-process in thread mode)
+    from .utils.export_jobs import export_jobs
+    export_jobs.init_app(app)
+
+    # CLI commands (flask seed, flask rollups, flask explain, flask export-worker)
+    from . import cli
+    cli.init_app(app)
+
     from .models import User
     @login_manager.user_loader
     def load_user(user_id):
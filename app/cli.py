@@ -0,0 +1,299 @@
+import secrets
+from datetime import date, datetime, time, timedelta
+from time import sleep
+
+import click
+import numpy as np
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import User, WeatherAnalytics, AirQualityAnalytics, DashboardData
+from app.utils import explain, retention, rollups
+from app.utils.export_jobs import export_jobs
+from app.utils.response_cache import response_cache
+from config import EXPORT_POLL_INTERVAL, RETENTION_BATCH_PAUSE, RETENTION_BATCH_SIZE
+
+
+def _insert_batches(table, rows, batch_size):
+    """Write rows with one executemany INSERT per batch, committing each batch"""
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[start:start + batch_size])
+        db.session.commit()
+
+
+def _create_seed_users(count):
+    """
+    Bulk-create `count` demo users sharing one password hash
+    The password is random and never shown, so nobody can log in as them.
+    Returns: list of the new user ids
+    """
+    password = generate_password_hash(secrets.token_urlsafe(32))
+    stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    emails = [f"seed-{stamp}-{i}@example.com" for i in range(count)]
+
+    db.session.execute(User.__table__.insert(), [{
+        'email': email,
+        'first_name': 'Seed',
+        'last_name': f"User {i}",
+        'name': f"Seed User {i}",
+        'password': password,
+        'avatar': 'default-avatar.png',
+        'user_rank': 1,
+        'progress': 0,
+        'guest': False,
+        'created_at': datetime.utcnow()
+    } for i, email in enumerate(emails)])
+    db.session.commit()
+
+    ids = []
+    for start in range(0, len(emails), 1000):
+        ids.extend(db.session.execute(
+            db.select(User.id).where(User.email.in_(emails[start:start + 1000]))
+        ).scalars())
+    return ids
+
+
+def generate_readings(rng, start_date, days, per_day):
+    """
+    Synthetic readings for one user: a daily temperature/humidity cycle plus
+    a slow seasonal drift and noise, and particulates that peak with traffic
+    Returns: dict of NumPy arrays keyed by 'day', 'minute', 'temperature',
+    'humidity', 'pm2_5', 'pm10' and 'light', one entry per reading
+    """
+    slots = np.arange(per_day)
+    day_index = np.repeat(np.arange(days), per_day)
+    minute = np.tile((slots * 1440 // per_day) + rng.integers(0, max(1440 // per_day, 1), per_day), days)
+    hour = minute / 60.0
+
+    base_temp = rng.uniform(12, 28)
+    base_humidity = rng.uniform(45, 75)
+    season = np.sin(2 * np.pi * (day_index + start_date.timetuple().tm_yday) / 365.25)
+    diurnal = np.sin(2 * np.pi * (hour - 9) / 24)
+    traffic = np.exp(-((hour - 8.5) ** 2) / 4) + np.exp(-((hour - 18) ** 2) / 6)
+    n = len(minute)
+
+    temperature = base_temp + 6 * season + 4 * diurnal + rng.normal(0, 1.2, n)
+    humidity = np.clip(base_humidity - 10 * diurnal + rng.normal(0, 5, n), 5, 100)
+    pm2_5 = np.clip(8 + 14 * traffic + rng.gamma(2.0, 3.0, n), 0, None)
+    pm10 = np.clip(pm2_5 * rng.uniform(1.6, 2.4, n) + rng.normal(0, 3, n), 0, None)
+    light = np.clip(11 * np.sin(np.pi * (hour - 6) / 12), 0, None) * rng.uniform(0.4, 1.0, n)
+
+    return {
+        'day': day_index,
+        'minute': minute,
+        'temperature': np.round(temperature, 1),
+        'humidity': np.round(humidity, 1),
+        'pm2_5': np.round(pm2_5, 1),
+        'pm10': np.round(pm10, 1),
+        'light': np.round(light, 1)
+    }
+
+
+def seed_user(user_id, rng, start_date, days, per_day, batch_size, until=None):
+    """
+    Insert weather, air quality and dashboard readings for one user
+    Readings after `until` (local time, e.g. later today) are left out.
+    Returns: number of rows written
+    """
+    readings = generate_readings(rng, start_date, days, per_day)
+    weather_rows = []
+    air_rows = []
+    dashboard_rows = []
+
+    for i in range(len(readings['day'])):
+        day = start_date + timedelta(days=int(readings['day'][i]))
+        minute = int(readings['minute'][i])
+        at_time = time(minute // 60, minute % 60)
+        recorded_at = datetime.combine(day, at_time)
+        if until is not None and recorded_at > until:
+            continue
+        temperature = float(readings['temperature'][i])
+        humidity = float(readings['humidity'][i])
+
+        weather_rows.append({
+            'user_id': user_id, 'temperature': temperature, 'humidity': humidity,
+            'date': day, 'time': at_time, 'created_at': recorded_at
+        })
+        air_rows.append({
+            'user_id': user_id, 'pm2_5': float(readings['pm2_5'][i]), 'pm10': float(readings['pm10'][i]),
+            'date': day, 'time': at_time, 'created_at': recorded_at
+        })
+        dashboard_rows.append({
+            'user_id': user_id, 'temperature': temperature, 'humidity': humidity,
+            'light': float(readings['light'][i]), 'ph': 7.0, 'recorded_at': recorded_at
+        })
+
+    _insert_batches(WeatherAnalytics.__table__, weather_rows, batch_size)
+    _insert_batches(AirQualityAnalytics.__table__, air_rows, batch_size)
+    _insert_batches(DashboardData.__table__, dashboard_rows, batch_size)
+
+    rollups.apply_rows(
+        [(WeatherAnalytics.__table__, row) for row in weather_rows]
+        + [(AirQualityAnalytics.__table__, row) for row in air_rows]
+        + [(DashboardData.__table__, row) for row in dashboard_rows]
+    )
+    db.session.commit()
+    return len(weather_rows) + len(air_rows) + len(dashboard_rows)
+
+
+@click.command('seed')
+@click.option('--users', 'new_users', type=int, default=0, help='Create this many demo users and seed them.')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Seed an existing user (repeatable).')
+@click.option('--days', type=int, default=30, show_default=True, help='Days of history ending now.')
+@click.option('--per-day', type=int, default=4, show_default=True, help='Readings per day and table.')
+@click.option('--batch-size', type=int, default=5000, show_default=True, help='Rows per multi-row INSERT.')
+@click.option('--random-seed', type=int, default=None, help='Make the generated data reproducible.')
+@with_appcontext
+def seed_command(new_users, user_ids, days, per_day, batch_size, random_seed):
+    """Bulk-generate analytics data (weather, air quality, dashboard readings)
+
+    Without --users or --user-id every existing user is seeded.
+    """
+    if days < 1 or per_day < 1 or batch_size < 1:
+        raise click.BadParameter('--days, --per-day and --batch-size must be positive')
+
+    ids = list(user_ids)
+    if new_users:
+        ids.extend(_create_seed_users(new_users))
+        click.echo(f"Created {new_users} demo users")
+    if not ids and not new_users:
+        ids = list(db.session.execute(db.select(User.id)).scalars())
+    if not ids:
+        click.echo('No users to seed')
+        return
+
+    rng = np.random.default_rng(random_seed)
+    start_date = date.today() - timedelta(days=days - 1)
+    started = datetime.now()
+    total = 0
+
+    with click.progressbar(ids, label='Seeding users') as bar:
+        for user_id in bar:
+            total += seed_user(user_id, rng, start_date, days, per_day, batch_size, until=started)
+    response_cache.clear()
+
+    elapsed = (datetime.now() - started).total_seconds()
+    click.echo(f"Inserted {total} rows for {len(ids)} users in {elapsed:.1f}s")
+
+
+@click.group('rollups')
+def rollups_group():
+    """Daily and hourly analytics rollups"""
+
+
+@rollups_group.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user (default: everyone).')
+@click.option('--all', 'all_days', is_flag=True,
+              help='Also rebuild days past the retention period (their compacted history is lost).')
+@with_appcontext
+def rebuild_rollups_command(user_id, all_days):
+    """Recompute rollups from the raw analytics tables
+
+    Days older than a table's retention period are kept as they are, since
+    `flask compact` may already have deleted their raw readings.
+    """
+    started = datetime.now()
+    daily, hourly = rollups.rebuild(user_id, None if all_days else retention.cutoffs())
+    response_cache.clear()
+    elapsed = (datetime.now() - started).total_seconds()
+    click.echo(f"Rebuilt {daily} daily and {hourly} hourly rollup rows in {elapsed:.1f}s")
+
+
+@click.command('explain')
+@click.option('--user-id', type=int, default=None, help='User to plan queries for (default: the first user).')
+@click.option('--article-id', type=int, default=1, show_default=True, help='Article for comment queries.')
+@with_appcontext
+def explain_command(user_id, article_id):
+    """EXPLAIN the per-user endpoint queries and fail on full table scans
+
+    Run it against a seeded database (see `flask seed`); on nearly empty
+    tables the planner may prefer a scan and report false regressions.
+    """
+    if user_id is None:
+        user_id = db.session.execute(db.select(User.id).order_by(User.id).limit(1)).scalar()
+        if user_id is None:
+            raise click.ClickException('No users found, run `flask seed` first')
+
+    results = explain.check_queries(user_id, article_id)
+    for result in results:
+        status = 'ok  ' if result['ok'] else 'SCAN'
+        click.echo(f"{status} {result['name']} ({result['table']})")
+        for scan in result['scans']:
+            click.echo(f"       {scan}")
+
+    failed = [result for result in results if not result['ok']]
+    if failed:
+        raise click.ClickException(f"{len(failed)} of {len(results)} queries scan a whole table")
+    click.echo(f"All {len(results)} queries use an index")
+
+
+@click.command('export-worker')
+@click.option('--once', is_flag=True, help='Run the queued jobs, then exit (e.g. from cron).')
+@click.option('--poll-interval', type=float, default=None, help='Seconds between queue polls.')
+@with_appcontext
+def export_worker_command(once, poll_interval):
+    """Run queued analytics export jobs and expire old export files
+
+    Use it with EXPORT_JOB_MODE=worker to keep exports out of the web
+    processes; in thread mode it also picks up jobs left by a crashed worker.
+    """
+    interval = EXPORT_POLL_INTERVAL if poll_interval is None else poll_interval
+
+    while True:
+        ran = export_jobs.run_pending()
+        expired = export_jobs.expire_files()
+        if ran or expired:
+            click.echo(f"Ran {ran} export jobs, expired {expired} files")
+        if once:
+            return
+        if not ran:
+            sleep(interval)
+
+
+@click.command('compact')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(sorted(retention.RETENTION_POLICIES)),
+              help='Only compact this table (repeatable).')
+@click.option('--batch-size', type=int, default=None, help='Raw rows deleted per transaction.')
+@click.option('--pause', type=float, default=None, help='Seconds to sleep between batches.')
+@click.option('--dry-run', is_flag=True, help='Only count the rows past their retention period.')
+@click.option('--every', type=float, default=None, help='Keep running, compacting every N seconds.')
+@with_appcontext
+def compact_command(tables, batch_size, pause, dry_run, every):
+    """Roll up and delete raw analytics readings past their retention period
+
+    Policies come from RETENTION_WEATHER_DAYS, RETENTION_AIR_QUALITY_DAYS and
+    RETENTION_DASHBOARD_DAYS (0 keeps a table's rows forever). Run it from
+    cron, or with --every as a long-running process.
+    """
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    pause = RETENTION_BATCH_PAUSE if pause is None else pause
+    if batch_size < 1:
+        raise click.BadParameter('--batch-size must be positive')
+
+    while True:
+        started = datetime.now()
+        reports = retention.compact(tables, batch_size, pause, dry_run)
+        for report in reports:
+            verb = 'would delete' if dry_run else 'deleted'
+            click.echo(f"{report['table']}: {verb} {report['rows_deleted']} rows before {report['cutoff']}"
+                       f" ({report['days']} days, {report['rollups_repaired']} rollups repaired)")
+        if not reports:
+            click.echo('No retention policies configured')
+        if any(report['rollups_repaired'] for report in reports):
+            # Repaired rollups can change what cached charts show for those days
+            response_cache.clear()
+        total = sum(report['rows_deleted'] for report in reports)
+        elapsed = (datetime.now() - started).total_seconds()
+        click.echo(f"{'Would reclaim' if dry_run else 'Reclaimed'} {total} rows in {elapsed:.1f}s")
+        if not every:
+            return
+        sleep(every)
+
+
+def init_app(app):
+    app.cli.add_command(seed_command)
+    app.cli.add_command(rollups_group)
+    app.cli.add_command(explain_command)
+    app.cli.add_command(export_worker_command)
+    app.cli.add_command(compact_command)
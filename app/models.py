@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, date, time
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
@@ -60,6 +61,10 @@ class User(db.Model, UserMixin):
 
 class Notification(db.Model):
     __tablename__ = 'notification'  # ← Added for consistency
+    __table_args__ = (
+        db.Index('ix_notification_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_notification_user_read_timestamp', 'user_id', 'is_read', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))  # ← Changed to 'users.id'
@@ -70,6 +75,11 @@ class Notification(db.Model):
 
 class DashboardData(db.Model):
     __tablename__ = 'dashboard_data'  # ← Added for consistency
+    __table_args__ = (
+        db.Index('ix_dashboard_data_user_recorded_at', 'user_id', 'recorded_at'),
+        # Lets the retention job find and delete old rows across all users
+        db.Index('ix_dashboard_data_recorded_at', 'recorded_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))  # ← Changed to 'users.id'
@@ -81,6 +91,9 @@ class DashboardData(db.Model):
 
 class CarbonLog(db.Model):
     __tablename__ = 'carbon_log'  # ← Added for consistency
+    __table_args__ = (
+        db.Index('ix_carbon_log_user_logged_at', 'user_id', 'logged_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))  # ← Changed to 'users.id'
@@ -91,6 +104,9 @@ class CarbonLog(db.Model):
 
 class VitaminLog(db.Model):
     __tablename__ = 'vitamin_log'
+    __table_args__ = (
+        db.Index('ix_vitamin_log_user_created_at', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))
@@ -103,6 +119,10 @@ class VitaminLog(db.Model):
 
 class WeatherAnalytics(db.Model):
     __tablename__ = 'weather_analytics'
+    __table_args__ = (
+        db.Index('ix_weather_analytics_user_date_time', 'user_id', 'date', 'time'),
+        db.Index('ix_weather_analytics_date', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))
@@ -125,6 +145,10 @@ class WeatherAnalytics(db.Model):
 
 class AirQualityAnalytics(db.Model):
     __tablename__ = 'air_quality_analytics'
+    __table_args__ = (
+        db.Index('ix_air_quality_analytics_user_date_time', 'user_id', 'date', 'time'),
+        db.Index('ix_air_quality_analytics_date', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))
@@ -147,8 +171,67 @@ class AirQualityAnalytics(db.Model):
     
     # Relationship removed - already defined in User model
 
+class DailyRollup(db.Model):
+    __tablename__ = 'daily_rollup'
+    # Per-user, per-metric daily count/sum/min/max kept up to date as readings are inserted
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'metric', 'day', name='uq_daily_rollup_user_metric_day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    metric = db.Column(db.String(32), nullable=False)  # a metric of rollups.ROLLUP_SOURCES, e.g. "temperature"
+    day = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+
+class HourlyRollup(db.Model):
+    __tablename__ = 'hourly_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'metric', 'day', 'hour', name='uq_hourly_rollup_user_metric_day_hour'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    metric = db.Column(db.String(32), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.SmallInteger, nullable=False)  # 0-23, local time of the readings
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+
+class ExportJob(db.Model):
+    __tablename__ = 'export_job'
+    # Background analytics exports; workers claim queued rows and write the file to EXPORT_DIR
+    __table_args__ = (
+        db.Index('ix_export_job_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_export_job_status_created_at', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    format = db.Column(db.String(16), nullable=False)  # "csv", "ndjson"
+    compression = db.Column(db.String(16))  # "gzip", "br"
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done, failed, expired
+    rows_total = db.Column(db.Integer)
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    file_name = db.Column(db.String(255))
+    file_size = db.Column(db.BigInteger)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # bumped with progress; a stale running job is picked up again
+    claim_token = db.Column(db.String(32))  # set by every claim; a runner whose token was replaced stops writing
+    finished_at = db.Column(db.DateTime)
+
 class VitaminDRecord(db.Model):
     __tablename__ = 'vitamin_d_record'  # ← Added for consistency
+    __table_args__ = (
+        db.Index('ix_vitamin_d_record_user_timestamp', 'user_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # ← Changed to 'users.id'
@@ -160,6 +243,9 @@ class VitaminDRecord(db.Model):
 
 class VitaminDHistory(db.Model):
     __tablename__ = 'vitamin_d_history'
+    __table_args__ = (
+        db.Index('ix_vitamin_d_history_user_timestamp', 'user_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))
@@ -176,15 +262,23 @@ class VitaminDHistory(db.Model):
 
 class Note(db.Model):
     __tablename__ = 'note'  # ← Added for consistency
+    __table_args__ = (
+        db.Index('ix_note_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_note_user_updated_at', 'user_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))  # ← Changed to 'users.id'
     title = db.Column(db.String(255))
     content = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Article(db.Model):
     __tablename__ = 'article'
+    __table_args__ = (
+        db.Index('ix_article_user_created_at', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"))
@@ -209,6 +303,9 @@ class Article(db.Model):
 
 class UserActivity(db.Model):
     __tablename__ = 'user_activity'  # ← Added for consistency
+    __table_args__ = (
+        db.Index('ix_user_activity_user_timestamp', 'user_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # ← Changed to 'users.id'
@@ -216,6 +313,32 @@ class UserActivity(db.Model):
     count = db.Column(db.Integer, default=1)
     timestamp = db.Column(db.DateTime, default=db.func.now())
 
+class DailyActivity(db.Model):
+    __tablename__ = 'daily_activity'
+    # One row per user, action and UTC day; the unique key makes "first of the day" a single upsert
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'action_type', 'day', name='uq_daily_activity_user_action_day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    action_type = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, default=1, nullable=False)
+    first_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    # Edits and deletes per user and table, part of the conditional GET version token
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'table_name', name='uq_data_version_user_table'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    table_name = db.Column(db.String(64), nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
 class UserProgress(db.Model):
     __tablename__ = 'user_progress'  # ← Added for consistency
     
@@ -249,6 +372,9 @@ class UserObjectiveProgress(db.Model):
 
 class ArticleComment(db.Model):
     __tablename__ = 'article_comment'
+    __table_args__ = (
+        db.Index('ix_article_comment_article_created_at', 'article_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete="CASCADE"))
@@ -311,40 +437,123 @@ def create_user(email, password, first_name, last_name):
     db.session.commit()
     return user
 
+def _record_daily_activity(user_id, action_type, day, now):
+    """
+    Count the action in the daily ledger
+    Returns: True if this is the user's first action of this type on `day`
+    """
+    table = DailyActivity.__table__
+    values = {'user_id': user_id, 'action_type': action_type, 'day': day, 'count': 1, 'first_at': now}
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_duplicate_key_update(count=table.c.count + 1)
+        # MySQL reports 1 affected row for an insert and 2 for an update
+        return db.session.execute(stmt).rowcount == 1
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=['user_id', 'action_type', 'day']
+        )
+        if db.session.execute(stmt).rowcount == 1:
+            return True
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(**values))
+            return True
+        except IntegrityError:
+            pass
+
+    db.session.execute(
+        table.update()
+        .where(table.c.user_id == user_id, table.c.action_type == action_type, table.c.day == day)
+        .values(count=table.c.count + 1)
+    )
+    return False
+
+def bump_data_versions(table_name, user_ids):
+    """Count an edit or delete of each user's rows in a table (see conditional.version)"""
+    table = DataVersion.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    for user_id in set(user_ids) - {None}:
+        values = {'user_id': user_id, 'table_name': table_name, 'version': 1}
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            db.session.execute(insert(table).values(**values).on_duplicate_key_update(version=table.c.version + 1))
+            continue
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            db.session.execute(insert(table).values(**values).on_conflict_do_update(
+                index_elements=['user_id', 'table_name'], set_={'version': table.c.version + 1}
+            ))
+            continue
+
+        updated = db.session.execute(
+            table.update()
+            .where(table.c.user_id == user_id, table.c.table_name == table_name)
+            .values(version=table.c.version + 1)
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(**values))
+
 def log_user_activity(user_id, action_type):
     """Log user activity and update progress"""
+    now = datetime.utcnow()
     activity = UserActivity(
         user_id=user_id,
-        action_type=action_type
+        action_type=action_type,
+        timestamp=now
     )
     db.session.add(activity)
     
-    # Check for existing activity today
-    today = datetime.utcnow().date()
-    existing = UserActivity.query.filter(
-        UserActivity.user_id == user_id,
-        UserActivity.action_type == action_type,
-        db.func.date(UserActivity.timestamp) == today
-    ).first()
-    
     # If this is first activity of this type today, update progress
-    if not existing or existing.id == activity.id:
-        user = User.query.get(user_id)
-        if user:
-            user.progress += 5  # Add 5 points for each new activity type per day
+    if _record_daily_activity(user_id, action_type, now.date(), now):
+        users = User.__table__
+        # Add 5 points for each new activity type per day, in one atomic UPDATE
+        added = db.session.execute(
+            users.update()
+            .where(users.c.id == user_id, users.c.progress + 5 < 100)
+            .values(progress=users.c.progress + 5)
+        ).rowcount
+        
+        # Otherwise the user levels up; the progress guard makes concurrent level-ups count once
+        if not added:
+            leveled_up = db.session.execute(
+                users.update()
+                .where(users.c.id == user_id, users.c.progress + 5 >= 100)
+                .values(user_rank=users.c.user_rank + 1, progress=0)
+            ).rowcount
             
-            # Check if user should level up
-            if user.progress >= 100:
-                user.user_rank += 1
-                user.progress = 0
+            if leveled_up:
+                new_rank = db.session.execute(
+                    db.select(users.c.user_rank).where(users.c.id == user_id)
+                ).scalar()
                 
                 # Create notification for level up
                 notification = Notification(
                     user_id=user_id,
                     title="Level Up!",
-                    message=f"Congratulations! You've reached rank {user.user_rank}!"
+                    message=f"Congratulations! You've reached rank {new_rank}!"
                 )
                 db.session.add(notification)
+            else:
+                # Another request just leveled the user up, so the points start the new rank
+                db.session.execute(
+                    users.update()
+                    .where(users.c.id == user_id)
+                    .values(progress=users.c.progress + 5)
+                )
     
     db.session.commit()
     return activity
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required, current_user
 from app.models import CarbonLog, log_user_activity
 from app import db
+from app.utils.conditional import conditional
 
 bp = Blueprint('carbon', __name__, url_prefix='/api/carbon')
 
@@ -51,6 +52,7 @@ def log_carbon():
 
 @bp.route('/api/history')
 @login_required
+@conditional((CarbonLog, 'logged_at'))
 def get_carbon_history():
     logs = CarbonLog.query.filter_by(user_id=current_user.id).order_by(CarbonLog.logged_at.desc()).limit(10).all()
     
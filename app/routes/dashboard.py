@@ -1,16 +1,32 @@
-from flask import Blueprint, render_template, jsonify, request, make_response
+from flask import Blueprint, render_template, jsonify, request, Response, send_file, stream_with_context, url_for
 from flask_login import login_required, current_user
-from app.models import DashboardData, User, WeatherAnalytics, AirQualityAnalytics
+from app.models import CarbonLog, DashboardData, ExportJob, User, WeatherAnalytics, AirQualityAnalytics
 from app import db
-import requests
+from app.utils.aqi import pm_aqi
+from app.utils.conditional import conditional
+from app.utils.downsample import MODES as DOWNSAMPLE_MODES, select_indices, take
+from app.utils.export import COMPRESSIONS, FORMATS, export_stream
+from app.utils.export_jobs import JOB_COMPRESSIONS, JOB_FORMATS, export_jobs, job_path, job_to_dict
+from app.utils.response_cache import response_cache
+from app.utils.rollups import apply_rows, period_averages
+from app.utils.series_stats import METRIC_MODELS as STATISTICS_METRICS, percentiles, rolling_statistics
+from app.utils.solar import get_sun_times, solar_elevation
+from app.utils.timerange import parse_range, previous_range, series
+from app.utils.trends import carbon_frame, environmental_trends
+from app.utils.upstream import UpstreamError
+from app.utils.weather_api import get_current_weather
+from app.utils.write_behind import analytics_writer
 import os
-import random
-import math
-from config import OPENWEATHER_API_KEY
-from datetime import datetime, timedelta, date, time
+from datetime import datetime, timedelta, timezone, date
+from config import (
+    CHART_DEFAULT_POINTS, CHART_MAX_POINTS, EXPORT_CHUNK_SIZE, STATISTICS_DEFAULT_WINDOW, STATISTICS_MAX_WINDOW,
+)
 
 bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
+# Tables the analytics endpoints read (readings are only ever added or compacted away)
+ANALYTICS_SOURCES = (WeatherAnalytics, AirQualityAnalytics, (DashboardData, 'recorded_at'), (CarbonLog, 'logged_at'))
+
 @bp.route('/')
 @login_required
 def index():
@@ -39,180 +55,85 @@ def get_dashboard_data():
 
 @bp.route('/api/analytics/temperature')
 @login_required
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
 def get_temperature_analytics():
-    # Get the timeframe from query parameters (day, week, month)
-    timeframe = request.args.get('timeframe', 'day')
-    
-    # Calculate the date range based on the timeframe
-    today = date.today()
-    if timeframe == 'day':
-        start_date = today
-    elif timeframe == 'week':
-        start_date = today - timedelta(days=7)
-    elif timeframe == 'month':
-        start_date = today - timedelta(days=30)
-    else:
-        return jsonify({'error': 'Invalid timeframe'}), 400
-    
-    # Check if we have any analytics data for this user
-    has_data = WeatherAnalytics.query.filter_by(user_id=current_user.id).first() is not None
-    
-    # If no data exists, create some sample data for testing
-    if not has_data:
-        create_sample_weather_analytics(current_user.id, start_date, today)
-        
-    # Query the database for temperature data within the date range
-    analytics_data = WeatherAnalytics.query.filter(
-        WeatherAnalytics.user_id == current_user.id,
-        WeatherAnalytics.date >= start_date,
-        WeatherAnalytics.date <= today
-    ).order_by(WeatherAnalytics.date, WeatherAnalytics.time).all()
-    
-    # Calculate average temperature for each day
-    daily_data = {}
-    for data in analytics_data:
-        day_str = data.date.strftime('%Y-%m-%d')
-        if day_str not in daily_data:
-            daily_data[day_str] = {
-                'temperature_values': [],
-                'date': day_str
-            }
-        daily_data[day_str]['temperature_values'].append(data.temperature)
+    # Range from a preset (timeframe=day|week|month|quarter|year|2y|5y) or start/end dates
+    try:
+        time_range = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Find the highest temperature for each day
-    result = []
-    for day, data in daily_data.items():
-        if data['temperature_values']:
-            max_temperature = max(data['temperature_values'])
-            result.append({
-                'date': data['date'],
-                'temperature': max_temperature
-            })
+    buckets = series(['temperature'], current_user.id, time_range)
+    prev_avgs = previous_averages(['temperature'], time_range)
+    return jsonify(peak_chart('temperature', buckets, prev_avgs['temperature'], time_range))
+
+def previous_averages(metrics, time_range):
+    """Average reading of each metric over the period of the same length before the range"""
+    previous = previous_range(time_range)
+    return period_averages(metrics, current_user.id, previous.start, previous.end)
+
+
+def peak_chart(column, buckets, prev_avg, time_range):
+    """
+    Temperature or humidity chart from series() buckets: the highest reading
+    per bucket, and the percentage change of the average bucket high against
+    the average reading of the previous period
+    """
+    buckets = [b for b in buckets if b.get(f'{column}_count')]
     
     # Calculate trend compared to previous period
     trend = 0
-    if result:
-        # Get previous period data for comparison
-        prev_start_date = start_date - timedelta(days=(today - start_date).days)
-        prev_end_date = start_date - timedelta(days=1)
-        
-        prev_analytics_data = WeatherAnalytics.query.filter(
-            WeatherAnalytics.user_id == current_user.id,
-            WeatherAnalytics.date >= prev_start_date,
-            WeatherAnalytics.date <= prev_end_date
-        ).all()
-        
-        # Calculate average temperature for previous period
-        current_avg = sum([r['temperature'] for r in result]) / len(result) if result else 0
-        prev_avg = sum([data.temperature for data in prev_analytics_data]) / len(prev_analytics_data) if prev_analytics_data else 0
+    if buckets:
+        current_avg = sum([b[f'{column}_max'] for b in buckets]) / len(buckets)
         
         # Calculate trend percentage
         if prev_avg > 0:
             trend = ((current_avg - prev_avg) / prev_avg) * 100
     
-    return jsonify({
-        'daily_data': result,
-        'trend': trend
-    })
-    
-    # Query the database for temperature data within the date range
-    analytics_data = WeatherAnalytics.query.filter(
-        WeatherAnalytics.user_id == current_user.id,
-        WeatherAnalytics.date >= start_date,
-        WeatherAnalytics.date <= today
-    ).order_by(WeatherAnalytics.date, WeatherAnalytics.time).all()
-    
-    # Calculate average temperature for each day
-    daily_data = {}
-    for data in analytics_data:
-        day_str = data.date.strftime('%Y-%m-%d')
-        if day_str not in daily_data:
-            daily_data[day_str] = {
-                'temperatures': [],
-                'date': day_str
-            }
-        daily_data[day_str]['temperatures'].append(data.temperature)
-    
-    # Find the highest temperature for each day
-    result = []
-    for day, data in daily_data.items():
-        if data['temperatures']:
-            max_temp = max(data['temperatures'])
-            result.append({
-                'date': data['date'],
-                'temperature': max_temp
-            })
-    
-    # Calculate the overall average temperature
-    all_temps = [data.temperature for data in analytics_data]
-    avg_temperature = sum(all_temps) / len(all_temps) if all_temps else 0
+    source_points = len(buckets)
+    buckets = take(buckets, chart_indices([[b[f'{column}_max'] for b in buckets]], _time_axis(buckets)))
     
-    # Calculate the trend (comparison with previous period)
-    prev_start_date = start_date - timedelta(days=(today - start_date).days)
-    prev_analytics_data = WeatherAnalytics.query.filter(
-        WeatherAnalytics.user_id == current_user.id,
-        WeatherAnalytics.date >= prev_start_date,
-        WeatherAnalytics.date < start_date
-    ).all()
-    
-    prev_temps = [data.temperature for data in prev_analytics_data]
-    prev_avg_temperature = sum(prev_temps) / len(prev_temps) if prev_temps else 0
-    
-    temperature_change = avg_temperature - prev_avg_temperature
-    trend = 'up' if temperature_change > 0 else 'down' if temperature_change < 0 else 'stable'
-    
-    # Format data for chart display
-    labels = []
-    values = []
-    for item in sorted(result, key=lambda x: x['date']):
-        labels.append(item['date'])
-        values.append(item['temperature'])
-    
-    return jsonify({
-        'average_temperature': round(avg_temperature, 1),
-        'temperature_change': round(temperature_change, 1),
+    return {
+        'daily_data': [{'date': b['label'], column: b[f'{column}_max']} for b in buckets],
+        'labels': [b['label'] for b in buckets],
+        'values': [b[f'{column}_max'] for b in buckets],
         'trend': trend,
-        'labels': labels,
-        'values': values
-    })
+        'source_points': source_points,
+        'range': time_range.to_dict()
+    }
 
-# Helper function to create sample weather analytics data
-def create_sample_weather_analytics(user_id, start_date, end_date):
-    # Generate sample data for each day in the range
-    current_date = start_date
-    while current_date <= end_date:
-        # Create 4 entries per day (morning, noon, evening, night)
-        for hour in [8, 12, 18, 22]:
-            # Generate random but realistic temperature and humidity values
-            temperature = 20 + 5 * (hour / 24) + (5 * (current_date.day % 3 - 1))  # 15-30°C range with daily pattern
-            humidity = 50 + 20 * (1 - hour / 24) + (10 * (current_date.day % 3 - 1))  # 40-80% range with daily pattern
-            
-            # Create a sample entry
-            sample_data = WeatherAnalytics(
-                user_id=user_id,
-                temperature=round(temperature, 1),
-                humidity=round(humidity, 1),
-                date=current_date,
-                time=time(hour, 0, 0)
-            )
-            db.session.add(sample_data)
-        
-        # Move to next day
-        current_date += timedelta(days=1)
-    
-    # Commit all sample data
-    try:
-        db.session.commit()
-        print(f"Created sample weather analytics data for user {user_id}")
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error creating sample data: {e}")
+
+def chart_indices(series, x=None, mode=None):
+    """
+    Points of a chart to send, from the request's max_points and downsample
+    (lttb or minmax) parameters unless a mode is given; series are lists of equal length
+    Returns: list of indices
+    """
+    max_points = request.args.get('max_points', CHART_DEFAULT_POINTS, type=int)
+    max_points = min(max(max_points, 3), CHART_MAX_POINTS)
+    mode = mode or request.args.get('downsample', 'lttb')
+    if mode not in DOWNSAMPLE_MODES:
+        mode = 'lttb'
+    return select_indices(series, max_points, mode, x)
+
+
+def _time_axis(buckets):
+    # Bucket start times (in hours) as the x axis, so gaps between buckets weigh in LTTB
+    return [b['start'].timestamp() / 3600 for b in buckets]
 
 
 @bp.route('/api/analytics/metrics')
 @login_required
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
 def get_analytics_metrics():
     """Get current metrics for analytics cards"""
+    return jsonify(analytics_metrics())
+
+
+def analytics_metrics():
+    """Values and day-over-day changes for the analytics cards"""
     # Get the latest data from the database
     latest_weather = WeatherAnalytics.query.filter_by(user_id=current_user.id).order_by(WeatherAnalytics.date.desc(), WeatherAnalytics.time.desc()).first()
     latest_dashboard = DashboardData.query.filter_by(user_id=current_user.id).order_by(DashboardData.recorded_at.desc()).first()
@@ -254,7 +175,7 @@ def get_analytics_metrics():
         if hasattr(latest_dashboard, 'water_changes'):
             water_changes = latest_dashboard.water_changes
     
-    return jsonify({
+    return {
         'temperature': temperature,
         'humidity': humidity,
         'light_hours': light_hours,
@@ -263,66 +184,45 @@ def get_analytics_metrics():
         'humidity_change': humidity_change,
         'light_hours_change': light_hours_change,
         'water_changes_change': water_changes_change
-    })
-
+    }
 
-# Helper function to calculate Air Quality Index (AQI) from PM2.5 and PM10 values
-def calculate_aqi(pm2_5, pm10):
-    """Calculate Air Quality Index from PM2.5 and PM10 values"""
-    # Simplified AQI calculation
-    aqi = (pm2_5 / 10) + (pm10 / 20)
-    return round(aqi, 2)
 
 @bp.route('/api/analytics/air-quality')
 @login_required
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
 def get_air_quality_data():
     """Get air quality data for charts"""
-    timeframe = request.args.get('timeframe', 'day')
-    
-    # Determine date range based on timeframe
-    today = datetime.now().date()
-    if timeframe == 'day':
-        start_date = today
-    elif timeframe == 'week':
-        start_date = today - timedelta(days=6)
-    elif timeframe == 'month':
-        start_date = today - timedelta(days=29)
-    else:
-        start_date = today
-    
-    # Query the database for air quality data
-    air_quality_data = AirQualityAnalytics.query.filter(
-        AirQualityAnalytics.user_id == current_user.id,
-        AirQualityAnalytics.date >= start_date,
-        AirQualityAnalytics.date <= today
-    ).order_by(AirQualityAnalytics.date, AirQualityAnalytics.time).all()
-    
-    # If no data exists, create sample data
-    if not air_quality_data:
-        create_sample_air_quality_data(current_user.id, start_date, today)
-        air_quality_data = AirQualityAnalytics.query.filter(
-            AirQualityAnalytics.user_id == current_user.id,
-            AirQualityAnalytics.date >= start_date,
-            AirQualityAnalytics.date <= today
-        ).order_by(AirQualityAnalytics.date, AirQualityAnalytics.time).all()
-    
-    # Format data for chart display
-    labels = []
-    values = []
-    
-    for data in air_quality_data:
-        date_str = data.date.strftime('%Y-%m-%d')
-        time_str = data.time.strftime('%H:%M')
-        labels.append(f"{date_str}T{time_str}")
-        
-        # Calculate air quality index
-        aqi = calculate_aqi(data.pm2_5, data.pm10)
-        values.append(aqi)
+    try:
+        time_range = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'labels': labels,
-        'values': values
-    })
+    # Average PM2.5 and PM10 per bucket; hourly or coarser buckets come from the rollups
+    buckets = series(['pm2_5', 'pm10'], current_user.id, time_range)
+    return jsonify(air_quality_chart(buckets, time_range))
+
+
+def air_quality_chart(buckets, time_range, mode=None):
+    """Air quality chart from series() buckets: US AQI and PM averages per bucket"""
+    buckets = [b for b in buckets if b.get('pm2_5_count') and b.get('pm10_count')]
+    
+    # US AQI (EPA breakpoints) for the whole series in one call
+    values = pm_aqi([b['pm2_5_avg'] for b in buckets], [b['pm10_avg'] for b in buckets])
+    
+    # Bound the number of points a long range sends to the chart
+    indices = chart_indices([values], _time_axis(buckets), mode)
+    buckets = take(buckets, indices)
+    
+    return {
+        'labels': [b['label'] for b in buckets],
+        'values': take(values, indices),
+        'pm2_5_values': [round(b['pm2_5_avg'], 1) for b in buckets],
+        'pm10_values': [round(b['pm10_avg'], 1) for b in buckets],
+        'source_points': len(values),
+        'range': time_range.to_dict()
+    }
+
 
 
 @bp.route('/api/analytics/export')
@@ -330,419 +230,274 @@ def get_air_quality_data():
 def export_analytics_data():
     """Export analytics data in various formats"""
     format_type = request.args.get('format', 'json')
-    
-    # Get all analytics data for the user
-    weather_data = WeatherAnalytics.query.filter_by(user_id=current_user.id).order_by(WeatherAnalytics.date, WeatherAnalytics.time).all()
-    air_quality_data = AirQualityAnalytics.query.filter_by(user_id=current_user.id).order_by(AirQualityAnalytics.date, AirQualityAnalytics.time).all()
-    dashboard_data = DashboardData.query.filter_by(user_id=current_user.id).order_by(DashboardData.recorded_at).all()
-    
-    # Format data for export
-    export_data = {
-        'weather': [{
-            'date': data.date.strftime('%Y-%m-%d'),
-            'time': data.time.strftime('%H:%M'),
-            'temperature': data.temperature,
-            'humidity': data.humidity
-        } for data in weather_data],
-        'air_quality': [{
-            'date': data.date.strftime('%Y-%m-%d'),
-            'time': data.time.strftime('%H:%M'),
-            'pm2_5': data.pm2_5,
-            'pm10': data.pm10
-        } for data in air_quality_data],
-        'dashboard': [{
-            'date': data.recorded_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'temperature': data.temperature,
-            'humidity': data.humidity,
-            'light': data.light,
-            'ph': data.ph
-        } for data in dashboard_data]
-    }
-    
-    if format_type == 'json':
-        return jsonify(export_data)
-    elif format_type == 'csv':
-        # Create CSV content
-        csv_content = "data_type,date,time,value1,value2,value3,value4\n"
-        
-        # Add weather data
-        for item in export_data['weather']:
-            csv_content += f"weather,{item['date']},{item['time']},{item['temperature']},{item['humidity']},,\n"
-        
-        # Add air quality data
-        for item in export_data['air_quality']:
-            csv_content += f"air_quality,{item['date']},{item['time']},{item['pm2_5']},{item['pm10']},,\n"
-        
-        # Add dashboard data
-        for item in export_data['dashboard']:
-            csv_content += f"dashboard,{item['date']},,{item['temperature']},{item['humidity']},{item['light']},{item['ph']}\n"
-        
-        response = make_response(csv_content)
-        response.headers["Content-Disposition"] = f"attachment; filename=ecosphere_analytics_{datetime.now().strftime('%Y-%m-%d')}.csv"
-        response.headers["Content-Type"] = "text/csv"
-        return response
-    else:
+    compression = request.args.get('compression') or None
+    
+    # ?async=1 queues a background job instead; poll its status URL and download the file when done
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        format_type = request.args.get('format', 'csv')
+        if format_type not in JOB_FORMATS:
+            return jsonify({'error': 'Background exports support csv and ndjson'}), 400
+        compression = compression or JOB_FORMATS[format_type]
+        if compression not in JOB_COMPRESSIONS:
+            return jsonify({'error': 'Unsupported compression'}), 400
+        
+        job = export_jobs.enqueue(current_user.id, format_type, compression)
+        status_url = url_for('dashboard.get_export_job', job_id=job.id)
+        payload = job_to_dict(job)
+        payload['status_url'] = status_url
+        return jsonify(payload), 202, {'Location': status_url}
+    
+    if format_type not in FORMATS:
         return jsonify({'error': 'Unsupported export format'}), 400
+    if compression not in COMPRESSIONS:
+        return jsonify({'error': 'Unsupported compression'}), 400
+    
+    # Stream the export: rows are read in chunks from server-side cursors and
+    # encoded as they go, so the download starts at once and memory stays flat
+    chunks, content_type, extension = export_stream(current_user.id, format_type, compression, EXPORT_CHUNK_SIZE)
+    response = Response(stream_with_context(chunks), content_type=content_type)
+    if format_type != 'json' or compression:
+        filename = f"ecosphere_analytics_{datetime.now().strftime('%Y-%m-%d')}{extension}"
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
 
-# Helper function to create sample air quality data
-def create_sample_air_quality_data(user_id, start_date, end_date):
-    # Generate sample data for each day in the range
-    current_date = start_date
-    while current_date <= end_date:
-        # Create 4 entries per day (morning, noon, evening, night)
-        for hour in [8, 12, 18, 22]:
-            # Generate random but realistic PM2.5 and PM10 values
-            pm2_5 = 15 + 5 * math.sin(hour / 24 * math.pi) + (random.random() * 5 - 2.5)
-            pm10 = 30 + 10 * math.sin(hour / 24 * math.pi) + (random.random() * 10 - 5)
-            
-            # Create a sample entry
-            sample_data = AirQualityAnalytics(
-                user_id=user_id,
-                pm2_5=round(max(0, pm2_5), 1),
-                pm10=round(max(0, pm10), 1),
-                date=current_date,
-                time=time(hour, 0, 0)
-            )
-            db.session.add(sample_data)
-        
-        # Move to next day
-        current_date += timedelta(days=1)
-    
-    # Commit all sample data
-    try:
-        db.session.commit()
-        print(f"Created sample air quality data for user {user_id}")
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error creating sample air quality data: {e}")
+
+def _job_payload(job):
+    payload = job_to_dict(job)
+    payload['status_url'] = url_for('dashboard.get_export_job', job_id=job.id)
+    if job.status == 'done':
+        payload['download_url'] = url_for('dashboard.download_export_job', job_id=job.id)
+    return payload
+
+
+@bp.route('/api/analytics/export/jobs')
+@login_required
+def list_export_jobs():
+    """The current user's most recent background exports"""
+    jobs = ExportJob.query.filter_by(user_id=current_user.id).order_by(ExportJob.created_at.desc()).limit(20).all()
+    return jsonify([_job_payload(job) for job in jobs])
+
+
+@bp.route('/api/analytics/export/jobs/<int:job_id>')
+@login_required
+def get_export_job(job_id):
+    """Status and progress of a background export"""
+    job = ExportJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    return jsonify(_job_payload(job))
+
+
+@bp.route('/api/analytics/export/jobs/<int:job_id>/download')
+@login_required
+def download_export_job(job_id):
+    """Serve a finished export file (supports Range and conditional requests)"""
+    job = ExportJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job.status not in ('done', 'expired'):
+        return jsonify({'error': f'Export is {job.status}', 'status': job.status}), 409
+    
+    path = job_path(job)
+    if job.status == 'expired' or not os.path.exists(path):
+        return jsonify({'error': 'Export file is no longer available'}), 410
+    
+    content_type = COMPRESSIONS[job.compression][0] or FORMATS[job.format][1]
+    extension = FORMATS[job.format][2] + COMPRESSIONS[job.compression][1]
+    filename = f"ecosphere_analytics_{job.created_at.strftime('%Y-%m-%d')}{extension}"
+    # conditional=True answers Range requests with 206 so interrupted downloads can resume
+    return send_file(path, mimetype=content_type, as_attachment=True, download_name=filename,
+                     conditional=True, max_age=0)
 
 
 @bp.route('/api/analytics/environmental-trends')
 @login_required
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
 def get_environmental_trends():
     """Get environmental trends data for the chart"""
-    # Get the last 30 days of data
-    today = datetime.now().date()
-    start_date = today - timedelta(days=30)
-    
-    # Get weather data for carbon footprint approximation
-    weather_data = WeatherAnalytics.query.filter(
-        WeatherAnalytics.user_id == current_user.id,
-        WeatherAnalytics.date >= start_date
-    ).order_by(WeatherAnalytics.date).all()
-    
-    # If no data exists, create sample data
-    if not weather_data:
-        create_sample_weather_analytics(current_user.id, start_date, today)
-        weather_data = WeatherAnalytics.query.filter(
-            WeatherAnalytics.user_id == current_user.id,
-            WeatherAnalytics.date >= start_date
-        ).order_by(WeatherAnalytics.date).all()
-    
-    # Group data by date
-    daily_data = {}
-    for data in weather_data:
-        day_str = data.date.strftime('%Y-%m-%d')
-        if day_str not in daily_data:
-            daily_data[day_str] = {
-                'temperatures': [],
-                'humidity': [],
-                'date': day_str
-            }
-        daily_data[day_str]['temperatures'].append(data.temperature)
-        daily_data[day_str]['humidity'].append(data.humidity)
-    
-    # Calculate daily averages and simulate carbon footprint and energy usage
-    dates = []
-    carbon_values = []
-    energy_values = []
-    
-    # Start with higher values and gradually decrease (simulating improvement)
-    base_carbon = 150
-    base_energy = 200
-    day_count = 0
+    # The last 30 days unless another range is asked for
+    try:
+        time_range = parse_range(request.args, default='month')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    for day, data in sorted(daily_data.items()):
-        if data['temperatures'] and data['humidity']:
-            avg_temp = sum(data['temperatures']) / len(data['temperatures'])
-            avg_humidity = sum(data['humidity']) / len(data['humidity'])
-            
-            # Simulate carbon footprint based on temperature and humidity
-            # Higher temperature and humidity generally mean more energy usage
-            carbon = base_carbon - (day_count * 0.8) + ((avg_temp - 20) * 0.5) + ((avg_humidity - 50) * 0.1)
-            energy = base_energy - (day_count * 0.7) + ((avg_temp - 20) * 0.7) + ((avg_humidity - 50) * 0.2)
-            
-            # Add some randomness
-            carbon += (random.random() * 10 - 5)
-            energy += (random.random() * 15 - 7.5)
-            
-            dates.append(day)
-            carbon_values.append(round(max(0, carbon), 1))
-            energy_values.append(round(max(0, energy), 1))
-            
-            day_count += 1
+    # Temperature and humidity averages per bucket for carbon footprint approximation
+    daily_data = series(['temperature', 'humidity'], current_user.id, time_range)
+    return jsonify(environmental_chart(daily_data, time_range))
+
+
+def environmental_chart(daily_data, time_range):
+    """
+    Environmental trends chart from series() buckets and the user's carbon logs
+    Buckets without a log are estimated from the weather (see app.utils.trends)
+    """
+    trends = environmental_trends(daily_data, carbon_frame(current_user.id, time_range.start, time_range.end),
+                                  time_range.resolution)
+    
+    # Every aligned series is cut down with the same indices
+    indices = chart_indices([trends['carbon_values'], trends['energy_values']])
+    chart = {
+        key: take(values, indices) for key, values in trends.items()
+        if key not in ('trend', 'model')
+    }
     
-    return jsonify({
-        'dates': dates,
-        'carbon_values': carbon_values,
-        'energy_values': energy_values
+    chart.update({
+        'trend': trends['trend'],
+        'model': trends['model'],
+        'source_points': len(trends['dates']),
+        'range': time_range.to_dict()
     })
+    return chart
 
 
-@bp.route('/api/analytics/humidity')
+@bp.route('/api/analytics/bundle')
 @login_required
-def get_humidity_analytics():
-    # Get the timeframe from query parameters (day, week, month)
-    timeframe = request.args.get('timeframe', 'day')
-    
-    # Calculate the date range based on the timeframe
-    today = date.today()
-    if timeframe == 'day':
-        start_date = today
-    elif timeframe == 'week':
-        start_date = today - timedelta(days=7)
-    elif timeframe == 'month':
-        start_date = today - timedelta(days=30)
-    else:
-        return jsonify({'error': 'Invalid timeframe'}), 400
-    
-    # Check if we have any analytics data for this user
-    has_data = WeatherAnalytics.query.filter_by(user_id=current_user.id).first() is not None
-    
-    # If no data exists, create some sample data for testing
-    if not has_data:
-        create_sample_weather_analytics(current_user.id, start_date, today)
-        
-    # Query the database for humidity data within the date range
-    analytics_data = WeatherAnalytics.query.filter(
-        WeatherAnalytics.user_id == current_user.id,
-        WeatherAnalytics.date >= start_date,
-        WeatherAnalytics.date <= today
-    ).order_by(WeatherAnalytics.date, WeatherAnalytics.time).all()
-    
-    # Calculate average humidity for each day
-    daily_data = {}
-    for data in analytics_data:
-        day_str = data.date.strftime('%Y-%m-%d')
-        if day_str not in daily_data:
-            daily_data[day_str] = {
-                'humidity_values': [],
-                'date': day_str
-            }
-        daily_data[day_str]['humidity_values'].append(data.humidity)
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
+def get_analytics_bundle():
+    """
+    Cards and every chart of the analytics page in one response
+    The temperature, humidity and air quality charts share one read of the
+    series for the range, and the previous-period averages one query.
+    """
+    try:
+        time_range = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Find the highest humidity for each day
-    result = []
-    for day, data in daily_data.items():
-        if data['humidity_values']:
-            max_humidity = max(data['humidity_values'])
-            result.append({
-                'date': data['date'],
-                'humidity': max_humidity
-            })
+    buckets = series(['temperature', 'humidity', 'pm2_5', 'pm10'], current_user.id, time_range)
+    prev_avgs = previous_averages(['temperature', 'humidity'], time_range)
     
-    # Calculate trend compared to previous period
-    trend = 0
-    if result:
-        # Get previous period data for comparison
-        prev_start_date = start_date - timedelta(days=(today - start_date).days)
-        prev_end_date = start_date - timedelta(days=1)
-        
-        prev_analytics_data = WeatherAnalytics.query.filter(
-            WeatherAnalytics.user_id == current_user.id,
-            WeatherAnalytics.date >= prev_start_date,
-            WeatherAnalytics.date <= prev_end_date
-        ).all()
-        
-        # Calculate average humidity for previous period
-        current_avg = sum([r['humidity'] for r in result]) / len(result) if result else 0
-        prev_avg = sum([data.humidity for data in prev_analytics_data]) / len(prev_analytics_data) if prev_analytics_data else 0
-        
-        # Calculate trend percentage
-        if prev_avg > 0:
-            trend = ((current_avg - prev_avg) / prev_avg) * 100
+    # The environmental chart always covers the last 30 days; reuse the buckets when that is the range
+    environmental_range = parse_range({}, default='month')
+    if environmental_range.to_dict() == dict(time_range.to_dict(), preset='month'):
+        environmental_data = buckets
+    else:
+        environmental_data = series(['temperature', 'humidity'], current_user.id, environmental_range)
     
     return jsonify({
-        'daily_data': result,
-        'trend': trend
+        'range': time_range.to_dict(),
+        'metrics': analytics_metrics(),
+        'temperature': peak_chart('temperature', buckets, prev_avgs['temperature'], time_range),
+        'humidity': peak_chart('humidity', buckets, prev_avgs['humidity'], time_range),
+        # Min/max keeps every pollution spike, as the air quality chart asks for on its own
+        'air_quality': air_quality_chart(buckets, time_range, 'minmax'),
+        'environmental': environmental_chart(environmental_data, environmental_range)
     })
 
-# Helper function to create sample air quality analytics data
-def create_sample_air_quality_analytics(user_id, start_date, end_date):
-    # Generate sample data for each day in the range
-    current_date = start_date
-    while current_date <= end_date:
-        # Create 4 entries per day (morning, noon, evening, night)
-        for hour in [8, 12, 18, 22]:
-            # Generate random but realistic PM2.5 and PM10 values
-            pm2_5 = 10 + 5 * (hour / 24) + (5 * (current_date.day % 3 - 1))  # 5-20 μg/m³ range with daily pattern
-            pm10 = 20 + 10 * (hour / 24) + (10 * (current_date.day % 3 - 1))  # 10-40 μg/m³ range with daily pattern
-            
-            # Create a sample entry
-            sample_data = AirQualityAnalytics(
-                user_id=user_id,
-                pm2_5=round(pm2_5, 1),
-                pm10=round(pm10, 1),
-                date=current_date,
-                time=time(hour, 0, 0)
-            )
-            db.session.add(sample_data)
-        
-        # Move to next day
-        current_date += timedelta(days=1)
-    
-    # Commit all sample data
+
+@bp.route('/api/analytics/statistics')
+@login_required
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
+def get_analytics_statistics():
+    """
+    Moving average, EWMA, rolling min/max and percentiles of one series
+    Query: metric (temperature, humidity, pm2_5, pm10, light, ph, or the sensor's own
+    sensor_temperature and sensor_humidity), a range
+    (timeframe or start/end, the last 30 days by default), window (buckets)
+    and span (EWMA, defaults to window)
+    """
+    metric = request.args.get('metric', 'temperature')
+    if metric not in STATISTICS_METRICS:
+        return jsonify({'error': f"Invalid metric, expected one of: {', '.join(STATISTICS_METRICS)}"}), 400
     try:
-        db.session.commit()
-        print(f"Created sample air quality analytics data for user {user_id}")
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error creating sample air quality data: {e}")
+        time_range = parse_range(request.args, default='month')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    window = request.args.get('window', STATISTICS_DEFAULT_WINDOW, type=int)
+    window = min(max(window, 1), STATISTICS_MAX_WINDOW)
+    span = request.args.get('span', window, type=float)
+    if span < 1:
+        return jsonify({'error': 'span must be at least 1'}), 400
+    
+    buckets = series([metric], current_user.id, time_range)
+    rolling, summary = rolling_statistics(buckets, metric, window, span)
+    summary['percentiles'] = percentiles(metric, current_user.id, time_range.start, time_range.end)
+    
+    # The rolling series are computed on every bucket, then thinned for the chart
+    indices = chart_indices([rolling['moving_average'], rolling['rolling_min'], rolling['rolling_max']])
+    result = {name: take(values, indices) for name, values in rolling.items()}
+    result.update({
+        'metric': metric,
+        'window': window,
+        'span': span,
+        'summary': summary,
+        'source_points': len(rolling['labels']),
+        'range': time_range.to_dict()
+    })
+    return jsonify(result)
+
+
+@bp.route('/api/analytics/cache-stats')
+@login_required
+def get_analytics_cache_stats():
+    # Hit/miss and invalidation counters for the per-user analytics response cache
+    return jsonify(response_cache.stats())
+
+
+@bp.route('/api/analytics/humidity')
+@login_required
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
+def get_humidity_analytics():
+    # Range from a preset (timeframe=day|week|month|quarter|year|2y|5y) or start/end dates
+    try:
+        time_range = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    buckets = series(['humidity'], current_user.id, time_range)
+    prev_avgs = previous_averages(['humidity'], time_range)
+    return jsonify(peak_chart('humidity', buckets, prev_avgs['humidity'], time_range))
 
 @bp.route('/api/analytics/air-quality')
 @login_required
+@response_cache.cached('analytics', daily=True)
+@conditional(*ANALYTICS_SOURCES, daily=True)
 def get_air_quality_analytics():
-    # Get the timeframe from query parameters (day, week, month)
-    timeframe = request.args.get('timeframe', 'day')
-    
-    # Calculate the date range based on the timeframe
-    today = date.today()
-    if timeframe == 'day':
-        start_date = today
-    elif timeframe == 'week':
-        start_date = today - timedelta(days=7)
-    elif timeframe == 'month':
-        start_date = today - timedelta(days=30)
-    else:
-        return jsonify({'error': 'Invalid timeframe'}), 400
-    
-    # Check if we have any air quality analytics data for this user
-    has_data = AirQualityAnalytics.query.filter_by(user_id=current_user.id).first() is not None
-    
-    # If no data exists, create some sample data for testing
-    if not has_data:
-        create_sample_air_quality_analytics(current_user.id, start_date, today)
-        
-    # Query the database for air quality data within the date range
-    analytics_data = AirQualityAnalytics.query.filter(
-        AirQualityAnalytics.user_id == current_user.id,
-        AirQualityAnalytics.date >= start_date,
-        AirQualityAnalytics.date <= today
-    ).order_by(AirQualityAnalytics.date, AirQualityAnalytics.time).all()
-    
-    # Calculate average PM2.5 and PM10 for each day
-    daily_data = {}
-    for data in analytics_data:
-        day_str = data.date.strftime('%Y-%m-%d')
-        if day_str not in daily_data:
-            daily_data[day_str] = {
-                'pm2_5_values': [],
-                'pm10_values': [],
-                'date': day_str
-            }
-        daily_data[day_str]['pm2_5_values'].append(data.pm2_5)
-        daily_data[day_str]['pm10_values'].append(data.pm10)
+    # Range from a preset (timeframe=day|week|month|quarter|year|2y|5y) or start/end dates
+    try:
+        time_range = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Find the highest PM2.5 and PM10 for each day
-    result = []
-    for day, data in daily_data.items():
-        if data['pm2_5_values'] and data['pm10_values']:
-            max_pm2_5 = max(data['pm2_5_values'])
-            max_pm10 = max(data['pm10_values'])
-            result.append({
-                'date': data['date'],
-                'pm2_5': max_pm2_5,
-                'pm10': max_pm10
-            })
+    # Find the highest PM2.5 and PM10 for each bucket
+    buckets = [
+        b for b in series(['pm2_5', 'pm10'], current_user.id, time_range)
+        if b.get('pm2_5_count') and b.get('pm10_count')
+    ]
     
     # Calculate trend compared to previous period
     pm2_5_trend = 0
     pm10_trend = 0
-    if result:
-        # Get previous period data for comparison
-        prev_start_date = start_date - timedelta(days=(today - start_date).days)
-        prev_end_date = start_date - timedelta(days=1)
-        
-        prev_analytics_data = AirQualityAnalytics.query.filter(
-            AirQualityAnalytics.user_id == current_user.id,
-            AirQualityAnalytics.date >= prev_start_date,
-            AirQualityAnalytics.date <= prev_end_date
-        ).all()
-        
-        # Calculate average PM2.5 and PM10 for previous period
-        current_pm2_5_avg = sum([r['pm2_5'] for r in result]) / len(result) if result else 0
-        current_pm10_avg = sum([r['pm10'] for r in result]) / len(result) if result else 0
+    if buckets:
+        # Average highs now against the average reading of the previous period
+        current_pm2_5_avg = sum([b['pm2_5_max'] for b in buckets]) / len(buckets)
+        current_pm10_avg = sum([b['pm10_max'] for b in buckets]) / len(buckets)
         
-        prev_pm2_5_avg = sum([data.pm2_5 for data in prev_analytics_data]) / len(prev_analytics_data) if prev_analytics_data else 0
-        prev_pm10_avg = sum([data.pm10 for data in prev_analytics_data]) / len(prev_analytics_data) if prev_analytics_data else 0
+        prev_avgs = previous_averages(['pm2_5', 'pm10'], time_range)
         
         # Calculate trend percentage
-        if prev_pm2_5_avg > 0:
-            pm2_5_trend = ((current_pm2_5_avg - prev_pm2_5_avg) / prev_pm2_5_avg) * 100
-        if prev_pm10_avg > 0:
-            pm10_trend = ((current_pm10_avg - prev_pm10_avg) / prev_pm10_avg) * 100
+        if prev_avgs['pm2_5'] > 0:
+            pm2_5_trend = ((current_pm2_5_avg - prev_avgs['pm2_5']) / prev_avgs['pm2_5']) * 100
+        if prev_avgs['pm10'] > 0:
+            pm10_trend = ((current_pm10_avg - prev_avgs['pm10']) / prev_avgs['pm10']) * 100
     
-    # Format data for chart display
-    labels = []
-    values = []
-    
-    # Sort result by date
-    sorted_result = sorted(result, key=lambda x: x['date'])
-    
-    for item in sorted_result:
-        labels.append(item['date'])
-        # Calculate AQI from PM2.5 and PM10 values
-        aqi_value = calculate_aqi(item['pm2_5'], item['pm10'])
-        values.append(aqi_value)
+    # US AQI (EPA breakpoints) from the PM2.5 and PM10 highs
+    values = pm_aqi([b['pm2_5_max'] for b in buckets], [b['pm10_max'] for b in buckets])
+    indices = chart_indices([values], _time_axis(buckets))
     
     return jsonify({
-        'labels': labels,
-        'values': values,
+        'labels': take([b['label'] for b in buckets], indices),
+        'values': take(values, indices),
+        'source_points': len(values),
+        'range': time_range.to_dict(),
         'pm2_5_trend': pm2_5_trend,
         'pm10_trend': pm10_trend
     })
-    
-    if day_str not in daily_data:
-        daily_data[day_str] = {
-            'humidities': [],
-            'date': day_str
-        }
-    daily_data[day_str]['humidities'].append(data.humidity)
-    
-    # Find the highest humidity for each day
-    result = []
-    for day, data in daily_data.items():
-        if data['humidities']:
-            max_humidity = max(data['humidities'])
-            result.append({
-                'date': data['date'],
-                'humidity': max_humidity
-            })
-    
-    # Calculate the overall average humidity
-    all_humidities = [data.humidity for data in analytics_data]
-    avg_humidity = sum(all_humidities) / len(all_humidities) if all_humidities else 0
-    
-    # Calculate the trend (comparison with previous period)
-    prev_start_date = start_date - timedelta(days=(today - start_date).days)
-    prev_analytics_data = WeatherAnalytics.query.filter(
-        WeatherAnalytics.user_id == current_user.id,
-        WeatherAnalytics.date >= prev_start_date,
-        WeatherAnalytics.date < start_date
-    ).all()
-    
-    prev_humidities = [data.humidity for data in prev_analytics_data]
-    prev_avg_humidity = sum(prev_humidities) / len(prev_humidities) if prev_humidities else 0
-    
-    humidity_change = avg_humidity - prev_avg_humidity
-    trend = 'up' if humidity_change > 0 else 'down' if humidity_change < 0 else 'stable'
-    
-    return jsonify({
-        'average_humidity': round(avg_humidity, 1),
-        'humidity_change': round(humidity_change, 1),
-        'trend': trend,
-        'daily_data': result
-    })
 
 @bp.route('/api/weather')
 def get_weather_data():
@@ -752,29 +507,17 @@ def get_weather_data():
     
     if not lat or not lon:
         return jsonify({'error': 'Missing location data'}), 400
-        
-    # Check if user is logged in to store analytics data
-    store_analytics = False
-    if current_user.is_authenticated:
-        store_analytics = True
     
     try:
-        # Call OpenWeather API - using current weather endpoint instead of onecall (which requires subscription)
-        response = requests.get(
-            f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-        )
-        
-        if response.status_code != 200:
-            # Try alternative endpoint if first one fails
-            response = requests.get(
-                f"https://api.weatherapi.com/v1/current.json?key={OPENWEATHER_API_KEY}&q={lat},{lon}&aqi=yes"
-            )
-            
-            if response.status_code != 200:
-                return jsonify({'error': f'Weather API error: {response.status_code}'}), 500
-            
+        # Current weather endpoint (onecall requires a subscription), cached per grid cell,
+        # with WeatherAPI.com as the alternative source if OpenWeather fails
+        try:
+            source, weather_data = get_current_weather(lat, lon)
+        except UpstreamError as e:
+            return jsonify({'error': f'Weather API error: {e.status_code}'}), 500
+
+        if source == 'weatherapi':
             # Parse WeatherAPI.com response
-            weather_data = response.json()
             current = weather_data.get('current', {})
             temperature = current.get('temp_c')
             feels_like = current.get('feelslike_c')
@@ -794,7 +537,6 @@ def get_weather_data():
             weather_description = condition.get('text', 'Unknown')
         else:
             # Parse OpenWeather response
-            weather_data = response.json()
             main = weather_data.get('main', {})
             temperature = main.get('temp')
             feels_like = main.get('feels_like')
@@ -817,56 +559,54 @@ def get_weather_data():
             weather_condition = weather.get('main', 'Unknown')
             weather_description = weather.get('description', 'Unknown')
         
-        # Save to database if user is logged in
-        if not current_user.is_anonymous:
-            dashboard_data = DashboardData(
+        # Queue the user's readings on the write-behind buffer; they are batched with
+        # other requests and inserted off the request thread
+        if current_user.is_authenticated:
+            now = datetime.now()
+            recorded_at = datetime.utcnow()
+            analytics_writer.add(
+                DashboardData,
                 user_id=current_user.id,
                 temperature=temperature,
                 humidity=humidity,
                 light=uv_index,  # Using UV index as a proxy for light
-                ph=7.0  # Default pH value as it's not available from weather API
+                ph=7.0,  # Default pH value as it's not available from weather API
+                recorded_at=recorded_at
             )
-            db.session.add(dashboard_data)
-            db.session.commit()
-        
-        # Store analytics data if user is logged in
-        if store_analytics and current_user.is_authenticated:
-            try:
-                # Store weather analytics data
-                weather_analytics = WeatherAnalytics(
+            
+            # Store weather analytics data
+            analytics_writer.add(
+                WeatherAnalytics,
+                user_id=current_user.id,
+                temperature=temperature,
+                humidity=humidity,
+                date=now.date(),
+                time=now.time(),
+                created_at=recorded_at
+            )
+            
+            # Store air quality analytics data if available
+            if 'air_quality' in weather_data and weather_data['air_quality']:
+                air_quality = weather_data.get('air_quality', {})
+                analytics_writer.add(
+                    AirQualityAnalytics,
                     user_id=current_user.id,
-                    temperature=temperature,
-                    humidity=humidity,
-                    date=date.today(),
-                    time=datetime.now().time()
+                    pm2_5=air_quality.get('pm2_5', 0),
+                    pm10=air_quality.get('pm10', 0),
+                    date=now.date(),
+                    time=now.time(),
+                    created_at=recorded_at
                 )
-                db.session.add(weather_analytics)
-                
-                # Store air quality analytics data if available
-                if 'air_quality' in weather_data and weather_data['air_quality']:
-                    air_quality = weather_data.get('air_quality', {})
-                    air_quality_analytics = AirQualityAnalytics(
-                        user_id=current_user.id,
-                        pm2_5=air_quality.get('pm2_5', 0),
-                        pm10=air_quality.get('pm10', 0),
-                        date=date.today(),
-                        time=datetime.now().time()
-                    )
-                    db.session.add(air_quality_analytics)
-                
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                print(f"Error storing analytics data: {e}")
         
         # Extract additional weather data with proper fallbacks
-        feels_like = main.get('feels_like') if response.status_code == 200 else current.get('feelslike_c')
-        wind_speed = weather_data.get('wind', {}).get('speed', 0) if response.status_code == 200 else current.get('wind_kph', 0) / 3.6
-        wind_deg = weather_data.get('wind', {}).get('deg', 0) if response.status_code == 200 else current.get('wind_degree', 0)
-        wind_gust = weather_data.get('wind', {}).get('gust', wind_speed) if response.status_code == 200 else current.get('gust_kph', 0) / 3.6
-        cloud_cover = weather_data.get('clouds', {}).get('all', 0) if response.status_code == 200 else current.get('cloud', 0)
-        rain_1h = weather_data.get('rain', {}).get('1h', 0) if response.status_code == 200 else current.get('precip_mm', 0)
-        visibility = weather_data.get('visibility', 0) / 1000 if response.status_code == 200 else current.get('vis_km', 0)
+        from_openweather = source == 'openweather'
+        feels_like = main.get('feels_like') if from_openweather else current.get('feelslike_c')
+        wind_speed = weather_data.get('wind', {}).get('speed', 0) if from_openweather else current.get('wind_kph', 0) / 3.6
+        wind_deg = weather_data.get('wind', {}).get('deg', 0) if from_openweather else current.get('wind_degree', 0)
+        wind_gust = weather_data.get('wind', {}).get('gust', wind_speed) if from_openweather else current.get('gust_kph', 0) / 3.6
+        cloud_cover = weather_data.get('clouds', {}).get('all', 0) if from_openweather else current.get('cloud', 0)
+        rain_1h = weather_data.get('rain', {}).get('1h', 0) if from_openweather else current.get('precip_mm', 0)
+        visibility = weather_data.get('visibility', 0) / 1000 if from_openweather else current.get('vis_km', 0)
         
         return jsonify({
             'temperature': temperature,
@@ -895,56 +635,8 @@ def get_sun_data():
         return jsonify({'error': 'Missing location data'}), 400
     
     try:
-        # Get OpenUV API keys from environment variables (primary and backups)
-        api_keys = [
-            os.environ.get('OPENUV_API_KEY'),
-            os.environ.get('OPENUV_API_KEY_BACKUP1'),
-            os.environ.get('OPENUV_API_KEY_BACKUP2')
-        ]
-        
-        # Filter out None values
-        api_keys = [key for key in api_keys if key]
-        
-        if not api_keys:
-            return jsonify({'error': 'No OpenUV API keys configured'}), 500
-        
-        response = None
-        last_error = None
-        
-        # Try each API key until one works
-        for api_key in api_keys:
-            try:
-                headers = {
-                    'x-access-token': api_key
-                }
-                
-                response = requests.get(
-                    f"https://api.openuv.io/api/v1/uv?lat={lat}&lng={lon}",
-                    headers=headers
-                )
-                
-                if response.status_code == 200:
-                    # Success! Break out of the loop
-                    break
-                else:
-                    last_error = f'OpenUV API error with key: {response.status_code}'
-            except Exception as e:
-                last_error = str(e)
-                continue
-        
-        # If we've tried all keys and none worked
-        if not response or response.status_code != 200:
-            return jsonify({'error': last_error or 'All OpenUV API keys failed'}), 500
-        
-        # Parse OpenUV response
-        sun_data = response.json()
-        result = sun_data.get('result', {})
-        sun_info = result.get('sun_info', {})
-        sun_times = sun_info.get('sun_times', {})
-        
-        # Format sunrise and sunset times
-        sunrise = sun_times.get('sunrise')
-        sunset = sun_times.get('sunset')
+        lat = float(lat)
+        lon = float(lon)
         
         # Get user's timezone offset from request
         timezone_offset = request.args.get('timezone_offset', '0')
@@ -953,97 +645,30 @@ def get_sun_data():
             timezone_offset = int(timezone_offset)
         except ValueError:
             timezone_offset = 0
-            
-        if sunrise:
-            # Parse the ISO format time and adjust for user's timezone
-            sunrise_time = datetime.fromisoformat(sunrise.replace('Z', '+00:00'))
-            # Apply timezone offset (converting from minutes to seconds)
-            # Note: getTimezoneOffset() returns minutes WEST of UTC, so we need to subtract
-            # Example: New York is UTC-5, so getTimezoneOffset() returns 300 (5 hours * 60)
-            sunrise_time = sunrise_time - timedelta(minutes=timezone_offset)
-            sunrise_formatted = sunrise_time.strftime('%I:%M %p')
-        else:
-            sunrise_formatted = 'N/A'
-            
-        if sunset:
-            # Parse the ISO format time and adjust for user's timezone
-            sunset_time = datetime.fromisoformat(sunset.replace('Z', '+00:00'))
-            # Apply timezone offset (converting from minutes to seconds)
-            sunset_time = sunset_time - timedelta(minutes=timezone_offset)
-            sunset_formatted = sunset_time.strftime('%I:%M %p')
-        else:
-            sunset_formatted = 'N/A'
         
-        return jsonify({
-            'sunrise': sunrise_formatted,
-            'sunset': sunset_formatted,
-            'raw_data': sun_data
-        })
+        # Note: getTimezoneOffset() returns minutes WEST of UTC, so we need to subtract
+        # Example: New York is UTC-5, so getTimezoneOffset() returns 300 (5 hours * 60)
+        now_utc = datetime.now(timezone.utc)
+        local_today = (now_utc - timedelta(minutes=timezone_offset)).date()
         
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    
-    try:
-        # Call OpenWeather API - using current weather endpoint instead of onecall (which requires subscription)
-        response = requests.get(
-            f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-        )
+        # Sun times are computed locally (no OpenUV quota spent), memoized per grid cell and date
+        sun_times = get_sun_times(lat, lon, local_today)
         
-        if response.status_code != 200:
-            # Try alternative endpoint if first one fails
-            response = requests.get(
-                f"https://api.weatherapi.com/v1/current.json?key={OPENWEATHER_API_KEY}&q={lat},{lon}&aqi=yes"
-            )
-            
-            if response.status_code != 200:
-                return jsonify({'error': f'Weather API error: {response.status_code}'}), 500
-            
-            # Parse WeatherAPI.com response
-            weather_data = response.json()
-            current = weather_data.get('current', {})
-            temperature = current.get('temp_c')
-            humidity = current.get('humidity')
-            uv_index = current.get('uv', 0)
-            condition = current.get('condition', {})
-            weather_condition = condition.get('text', 'Unknown')
-            weather_description = condition.get('text', 'Unknown')
-        else:
-            # Parse OpenWeather response
-            weather_data = response.json()
-            main = weather_data.get('main', {})
-            temperature = main.get('temp')
-            humidity = main.get('humidity')
-            # UV index not available in this endpoint, use 0 as default
-            uv_index = 0
-            weather = weather_data.get('weather', [{}])[0]
-            weather_condition = weather.get('main', 'Unknown')
-            weather_description = weather.get('description', 'Unknown')
-        
-        # Save to database if user is logged in
-        if not current_user.is_anonymous:
-            dashboard_data = DashboardData(
-                user_id=current_user.id,
-                temperature=temperature,
-                humidity=humidity,
-                light=uv_index,  # Using UV index as a proxy for light
-                ph=7.0  # Default pH value as it's not available from weather API
-            )
-            db.session.add(dashboard_data)
-            db.session.commit()
+        def format_local(event):
+            if not event:
+                return 'N/A'
+            return (event - timedelta(minutes=timezone_offset)).strftime('%I:%M %p')
         
         return jsonify({
-            'temperature': temperature,
-            'feels_like': feels_like,
-            'humidity': humidity,
-            'uv_index': uv_index,
-            'weather_condition': weather_condition,
-            'weather_description': weather_description,
-            'wind_speed': wind_speed,
-            'wind_deg': wind_deg,
-            'wind_gust': wind_gust,
-            'cloud_cover': cloud_cover,
-            'rain_1h': rain_1h,
-            'visibility': visibility
+            'sunrise': format_local(sun_times['sunrise']),
+            'sunset': format_local(sun_times['sunset']),
+            'solar_noon': format_local(sun_times['solar_noon']),
+            'day_length': sun_times['day_length'],
+            'solar_elevation': round(float(solar_elevation(lat, lon, now_utc.timestamp())), 2),
+            'sun_times': {
+                name: value.isoformat() if isinstance(value, datetime) else value
+                for name, value in sun_times.items()
+            }
         })
         
     except Exception as e:
@@ -1057,15 +682,20 @@ def add_dashboard_data():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    new_data = DashboardData(
+    values = dict(
         user_id=current_user.id,
         temperature=data.get('temperature'),
         humidity=data.get('humidity'),
         light=data.get('light'),
-        ph=data.get('ph')
+        ph=data.get('ph'),
+        recorded_at=datetime.utcnow()
     )
+    new_data = DashboardData(**values)
     
     db.session.add(new_data)
+    db.session.flush()
+    # Fold the reading into the rollups in the same transaction, as write-behind flushes do
+    apply_rows([(DashboardData.__table__, values)])
     db.session.commit()
     
     return jsonify({
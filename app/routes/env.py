@@ -1,8 +1,13 @@
 from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
-import requests
 import os
 from app.models import log_user_activity
+from app.utils import upstream
+from app.utils.aqi import describe as describe_aqi
+from app.utils.openuv import openuv_keys
+from app.utils.singleflight import upstream_flights
+from app.utils.upstream import UpstreamError
+from app.utils.weather_api import fetch_openweather_current, weather_cache, weather_refresher
 
 bp = Blueprint('env', __name__, url_prefix='/api/environment')
 
@@ -19,14 +24,12 @@ def get_weather():
     if not lat or not lon:
         return jsonify({'error': 'Latitude and longitude are required'}), 400
     
-    # Call OpenWeather API
+    # Call OpenWeather API (served from the grid cache when a nearby lookup is fresh)
     try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-        response = requests.get(url)
-        data = response.json()
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch weather data', 'details': data}), response.status_code
+        try:
+            data = fetch_openweather_current(lat, lon)
+        except UpstreamError as e:
+            return jsonify({'error': 'Failed to fetch weather data', 'details': e.details}), e.status_code
         
         # Extract relevant weather information
         weather_info = {
@@ -58,8 +61,11 @@ def get_air_quality():
     
     # Call OpenWeather Air Pollution API
     try:
-        url = f"https://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
-        response = requests.get(url)
+        response = upstream.get('openweather', '/data/2.5/air_pollution', params={
+            'lat': lat,
+            'lon': lon,
+            'appid': OPENWEATHER_API_KEY
+        })
         data = response.json()
         
         if response.status_code != 200:
@@ -82,10 +88,29 @@ def get_air_quality():
         
         air_quality['description'] = aqi_descriptions.get(air_quality['aqi'], 'Unknown')
         
+        # US AQI from the pollutant concentrations (OpenWeather's index above is its own 1-5 scale)
+        air_quality['us_aqi'] = describe_aqi(air_quality['components'])
+        
         # Log this activity
         log_user_activity(current_user.id, 'air_quality_check')
         
         return jsonify(air_quality)
     
     except Exception as e:
-        return jsonify({'error': 'Failed to fetch air quality data', 'details': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to fetch air quality data', 'details': str(e)}), 500
+
+@bp.route('/weather/cache-stats', methods=['GET'])
+@login_required
+def get_weather_cache_stats():
+    # Hit/miss counters for the current-weather grid cache, background refreshes and coalesced upstream fetches
+    return jsonify({
+        'cache': weather_cache.stats(),
+        'refresher': weather_refresher.stats(),
+        'single_flight': upstream_flights.stats()
+    })
+
+@bp.route('/openuv/keys', methods=['GET'])
+@login_required
+def get_openuv_key_metrics():
+    # Remaining quota, circuit state and request counters per OpenUV key
+    return jsonify(openuv_keys.metrics())
@@ -2,11 +2,13 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
 from app.models import Note, log_user_activity
 from app import db
+from app.utils.conditional import conditional
 
 bp = Blueprint('notes', __name__, url_prefix='/api/notes')
 
 @bp.route('/', methods=['GET'])
 @login_required
+@conditional((Note, 'updated_at'))
 def get_notes():
     notes = Note.query.filter_by(user_id=current_user.id).order_by(Note.created_at.desc()).all()
     
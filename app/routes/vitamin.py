@@ -2,13 +2,25 @@ from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required, current_user
 from app.models import VitaminLog, VitaminDRecord, VitaminDHistory, log_user_activity
 from app import db
-import requests
+from app.utils.conditional import conditional
+from app.utils.openuv import fetch_uv
+from app.utils.solar import get_sun_times
+from app.utils.upstream import UpstreamError
+from app.utils.uv_model import estimate_uv_index
+from app.utils.weather_api import fetch_openweather_current, cached_cloud_cover
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests import RequestException
+import math
 import os
-from datetime import datetime
-from config import OPENWEATHER_API_KEY, OPENUV_API_KEY, OPENUV_API_KEY_BACKUP1, OPENUV_API_KEY_BACKUP2
+import time
+from datetime import datetime, timedelta, timezone
+from config import VITAMIN_CHECK_DEADLINE, VITAMIN_FANOUT_WORKERS, VITAMIN_UV_WAIT
 
 bp = Blueprint('vitamin', __name__, url_prefix='/vitamin')
 
+# Bounded pool for the independent upstream lookups of a vitamin D check
+fanout_executor = ThreadPoolExecutor(max_workers=VITAMIN_FANOUT_WORKERS, thread_name_prefix='vitamin-fanout')
+
 @bp.route('/')
 @login_required
 def index():
@@ -21,100 +33,56 @@ def check_vitamin_d():
     if not data or not all(k in data for k in ['latitude', 'longitude']):
         return jsonify({'error': 'Missing location data'}), 400
     
-    latitude = data['latitude']
-    longitude = data['longitude']
-    
-    # Try to get UV data from OpenUV API first
     try:
-        uv_data = get_openuv_data(latitude, longitude)
-        if uv_data:
-            # Extract relevant data
-            uv_index = uv_data.get('uv', 0)
-            
-            # Get weather data for temperature and humidity
-            try:
-                weather_response = requests.get(
-                    f"https://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&appid={OPENWEATHER_API_KEY}&units=metric"
-                )
-                weather_data = weather_response.json()
-                temp = weather_data.get('main', {}).get('temp', 0)
-                humidity = weather_data.get('main', {}).get('humidity', 0)
-                city = weather_data.get('name', 'Unknown')
-                country = weather_data.get('sys', {}).get('country', 'Unknown')
-            except Exception:
-                # If weather API fails, use defaults
-                temp = 0
-                humidity = 0
-                city = 'Unknown'
-                country = 'Unknown'
-            
-            # Determine vitamin D status based on UV index
-            status = 'low'
-            if uv_index >= 3 and uv_index < 6:
-                status = 'moderate'
-            elif uv_index >= 6 and uv_index < 8:
-                status = 'high'
-            elif uv_index >= 8:
-                status = 'very high'
-            
-            # Get recommendation based on status and UV index
-            recommendation = get_recommendation(status, uv_index)
-            
-            # Save record
-            user_id = current_user.id if not current_user.is_anonymous else None
-            
-            record = VitaminDRecord(
-                user_id=user_id,
-                latitude=latitude,
-                longitude=longitude,
-                uv_index=uv_index,
-                status=status
-            )
-            
-            db.session.add(record)
-            
-            # Also log to vitamin_log table
-            if user_id:
-                log = VitaminLog(
-                    user_id=user_id,
-                    city=city,
-                    country=country,
-                    temp=temp,
-                    humidity=humidity,
-                    uvi=uv_index
-                )
-                db.session.add(log)
-                
-                # Log this activity for user progress
-                log_user_activity(user_id, 'vitamin_check')
-            
-            db.session.commit()
-            
-            return jsonify({
-                'uv_index': uv_index,
-                'status': status,
-                'recommendation': recommendation,
-                'temperature': temp,
-                'humidity': humidity
-            })
-    except Exception as e:
-        print(f"OpenUV API error: {str(e)}")
-        # Fall back to OpenWeather API if OpenUV fails
-        pass
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+        altitude = float(data.get('altitude') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid location data'}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and math.isfinite(altitude)):
+        return jsonify({'error': 'Invalid location data'}), 400
     
-    # Fallback to OpenWeather API
-    try:
-        response = requests.get(
-            f"https://api.openweathermap.org/data/2.5/onecall?lat={latitude}&lon={longitude}&exclude=minutely,hourly,daily,alerts&appid={OPENWEATHER_API_KEY}&units=metric"
+    # OpenUV and OpenWeather are independent, so query them at the same time
+    # and assemble the answer from whatever arrives before the deadline
+    started = time.monotonic()
+    deadline = started + VITAMIN_CHECK_DEADLINE
+    uv_future = fanout_executor.submit(get_openuv_data, latitude, longitude)
+    weather_future = fanout_executor.submit(fetch_openweather_current, latitude, longitude)
+    
+    weather_data = result_before(weather_future, deadline)
+    if weather_data:
+        temp = weather_data.get('main', {}).get('temp', 0)
+        humidity = weather_data.get('main', {}).get('humidity', 0)
+        city = weather_data.get('name', 'Unknown')
+        country = weather_data.get('sys', {}).get('country', 'Unknown')
+        cloud_cover = weather_data.get('clouds', {}).get('all')
+    else:
+        # If weather API fails, use defaults
+        temp = 0
+        humidity = 0
+        city = 'Unknown'
+        country = 'Unknown'
+        cloud_cover = cached_cloud_cover(latitude, longitude)
+    
+    # OpenUV gets at most VITAMIN_UV_WAIT seconds before the local estimate is used
+    uv_data = result_before(uv_future, min(deadline, started + VITAMIN_UV_WAIT))
+    if uv_data:
+        uv_index = uv_data.get('uv', 0)
+        uv_source = 'openuv'
+    else:
+        # OpenUV failed or is still running: answer with the local clear-sky estimate
+        # (corrected for cloud cover) instead of waiting on another remote call.
+        # A late OpenUV answer still lands in the UV cache for the next check
+        # (unless it never started and was cancelled).
+        uv_index = estimate_uv_index(
+            latitude,
+            longitude,
+            altitude_m=altitude,
+            cloud_cover=cloud_cover
         )
-        response.raise_for_status()
-        weather_data = response.json()
-        
-        # Extract relevant data
-        uv_index = weather_data.get('current', {}).get('uvi', 0)
-        temp = weather_data.get('current', {}).get('temp', 0)
-        humidity = weather_data.get('current', {}).get('humidity', 0)
-        
+        uv_source = 'estimate'
+    
+    try:
         # Determine vitamin D status based on UV index
         status = 'low'
         if uv_index >= 3 and uv_index < 6:
@@ -144,8 +112,8 @@ def check_vitamin_d():
         if user_id:
             log = VitaminLog(
                 user_id=user_id,
-                city=weather_data.get('name', 'Unknown'),
-                country=weather_data.get('sys', {}).get('country', 'Unknown'),
+                city=city,
+                country=country,
                 temp=temp,
                 humidity=humidity,
                 uvi=uv_index
@@ -162,55 +130,40 @@ def check_vitamin_d():
             'status': status,
             'recommendation': recommendation,
             'temperature': temp,
-            'humidity': humidity
+            'humidity': humidity,
+            'uv_source': uv_source
         })
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-# Function to get UV data from OpenUV API with fallback mechanism
-def get_openuv_data(latitude, longitude):
-    # Try with primary API key
+def result_before(future, deadline):
+    """
+    Wait for a fan-out lookup until the shared deadline
+    A lookup still queued behind other checks at the deadline is cancelled, so
+    the shared pool only works on answers someone may still use.
+    Returns: the lookup result, or None if it failed or did not finish in time
+    """
     try:
-        url = f"https://api.openuv.io/api/v1/uv?lat={latitude}&lng={longitude}"
-        headers = {
-            'x-access-token': OPENUV_API_KEY
-        }
-        
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        return data.get('result', {})
+        return future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeoutError:
+        if future.cancel():
+            print("Vitamin D check: upstream lookup cancelled, it had not started by the deadline")
+        else:
+            print("Vitamin D check: upstream lookup missed the deadline")
+        return None
     except Exception as e:
-        print(f"Primary OpenUV API error: {str(e)}")
-        # Try with first backup API key
-        try:
-            headers = {
-                'x-access-token': OPENUV_API_KEY_BACKUP1
-            }
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            return data.get('result', {})
-        except Exception as e:
-            print(f"First backup OpenUV API error: {str(e)}")
-            # Try with second backup API key
-            try:
-                headers = {
-                    'x-access-token': OPENUV_API_KEY_BACKUP2
-                }
-                
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                
-                return data.get('result', {})
-            except Exception as e:
-                print(f"Second backup OpenUV API error: {str(e)}")
-                return None
+        print(f"Vitamin D check: upstream lookup failed: {str(e)}")
+        return None
+
+# Function to get UV data from OpenUV API using the healthiest key in the key pool
+def get_openuv_data(latitude, longitude):
+    try:
+        return fetch_uv(latitude, longitude).get('result', {})
+    except (UpstreamError, RequestException) as e:
+        print(f"OpenUV API error: {str(e)}")
+        return None
 
 def get_recommendation(status, uv_index):
     if status == 'low':
@@ -232,39 +185,18 @@ def get_sun_data():
         if not latitude or not longitude:
             return jsonify({'error': 'Latitude and longitude are required'}), 400
         
-        # Try to get data from OpenUV API
-        openuv_data = get_openuv_data(latitude, longitude)
-        
-        if openuv_data:
-            # Extract sunrise and sunset times
-            sun_info = openuv_data.get('sun_info', {})
-            sunrise = sun_info.get('sun_times', {}).get('sunrise')
-            sunset = sun_info.get('sun_times', {}).get('sunset')
-            
-            return jsonify({
-                'sunrise': sunrise,
-                'sunset': sunset
-            })
-        
-        # Fallback to OpenWeather API if OpenUV fails
-        response = requests.get(
-            f"https://api.openweathermap.org/data/2.5/onecall?lat={latitude}&lon={longitude}&exclude=minutely,hourly,alerts&appid={OPENWEATHER_API_KEY}&units=metric"
-        )
-        response.raise_for_status()
-        weather_data = response.json()
-        
-        # Extract sunrise and sunset times from OpenWeather API
-        sunrise = weather_data.get('current', {}).get('sunrise')
-        sunset = weather_data.get('current', {}).get('sunset')
+        # Optional browser timezone offset (minutes west of UTC) to pick the user's calendar day
+        timezone_offset = request.args.get('timezone_offset', 0, type=int)
+        local_today = (datetime.now(timezone.utc) - timedelta(minutes=timezone_offset)).date()
         
-        if sunrise:
-            sunrise = datetime.fromtimestamp(sunrise).isoformat()
-        if sunset:
-            sunset = datetime.fromtimestamp(sunset).isoformat()
+        # Sunrise and sunset are computed locally, no upstream lookup needed
+        sun_times = get_sun_times(latitude, longitude, local_today)
+        sunrise = sun_times['sunrise']
+        sunset = sun_times['sunset']
         
         return jsonify({
-            'sunrise': sunrise,
-            'sunset': sunset
+            'sunrise': sunrise.isoformat() if sunrise else None,
+            'sunset': sunset.isoformat() if sunset else None
         })
         
     except Exception as e:
@@ -272,6 +204,7 @@ def get_sun_data():
 
 @bp.route('/api/history')
 @login_required
+@conditional((VitaminDRecord, 'timestamp'))
 def get_vitamin_history():
     records = VitaminDRecord.query.filter_by(user_id=current_user.id).order_by(VitaminDRecord.timestamp.desc()).limit(10).all()
     
@@ -23,9 +23,6 @@ let currentTimeframe = 'day';
 function initializeAnalytics() {
     console.log('Initializing analytics');
     
-    // Initialize metrics cards
-    updateMetricsCards();
-    
     // Setup timeframe buttons
     setupTimeframeButtons();
     
@@ -34,7 +31,7 @@ function initializeAnalytics() {
     initializeAirQualityChart();
     initializeEnvironmentalChart();
     
-    // Initial update of all charts
+    // Initial update of the metrics cards and all charts
     updateAllCharts(currentTimeframe);
     
     // Setup export button
@@ -42,7 +39,6 @@ function initializeAnalytics() {
     
     // Set up auto-refresh every 5 minutes
     setInterval(function() {
-        updateMetricsCards();
         updateAllCharts(currentTimeframe);
     }, 5 * 60 * 1000); // 5 minutes
 }
@@ -57,14 +53,33 @@ function updateAllCharts(timeframe) {
     // Update current timeframe
     currentTimeframe = timeframe;
     
-    // Update temperature chart
-    updateTemperatureChart(timeframe);
-    
-    // Update air quality chart
-    updateAirQualityChart(timeframe);
-    
-    // Update environmental chart (doesn't use timeframe)
-    updateEnvironmentalChart();
+    // Cards and every chart come from one request; the server reads the range once for all of them
+    const maxPoints = Math.max(chartMaxPoints('temperatureChart'), chartMaxPoints('airQualityChart'));
+    fetch(`/dashboard/api/analytics/bundle?timeframe=${timeframe}&max_points=${maxPoints}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Network response was not ok: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            console.log('Analytics bundle received:', data);
+            
+            renderMetricsCards(data.metrics);
+            renderTemperatureChart(data.temperature, timeframe);
+            renderAirQualityChart(data.air_quality, timeframe);
+            
+            // Environmental chart always covers the last 30 days
+            renderEnvironmentalChart(data.environmental);
+        })
+        .catch(error => {
+            console.error('Error fetching analytics bundle:', error);
+            // Use sample data if API fails
+            useFallbackMetricsData();
+            useSampleTemperatureData(timeframe);
+            useSampleAirQualityData(timeframe);
+            useSampleEnvironmentalData();
+        });
     
     // Update active class on all timeframe buttons
     document.querySelectorAll('.timeframe-btn').forEach(btn => {
@@ -99,21 +114,7 @@ function updateMetricsCards() {
             }
             return response.json();
         })
-        .then(data => {
-            console.log('Metrics data received:', data);
-            
-            // Update temperature card
-            updateMetricCard(1, data.temperature, data.temperature_change, '°C');
-            
-            // Update humidity card
-            updateMetricCard(2, data.humidity, data.humidity_change, '%');
-            
-            // Update light hours card
-            updateMetricCard(3, data.light_hours, data.light_hours_change, 'h');
-            
-            // Update water changes card
-            updateMetricCard(4, data.water_changes, data.water_changes_change, '');
-        })
+        .then(data => renderMetricsCards(data))
         .catch(error => {
             console.error('Error fetching metrics data:', error);
             // Use fallback data if API fails
@@ -121,6 +122,25 @@ function updateMetricsCards() {
         });
 }
 
+/**
+ * Fill the metrics cards from an analytics metrics response
+ */
+function renderMetricsCards(data) {
+    console.log('Metrics data received:', data);
+    
+    // Update temperature card
+    updateMetricCard(1, data.temperature, data.temperature_change, '°C');
+    
+    // Update humidity card
+    updateMetricCard(2, data.humidity, data.humidity_change, '%');
+    
+    // Update light hours card
+    updateMetricCard(3, data.light_hours, data.light_hours_change, 'h');
+    
+    // Update water changes card
+    updateMetricCard(4, data.water_changes, data.water_changes_change, '');
+}
+
 /**
  * Update a specific metric card
  */
@@ -291,44 +311,29 @@ function initializeTemperatureChart() {
     updateTemperatureChart('day');
 }
 
+/**
+ * Points worth requesting for a chart: about one per pixel of its canvas
+ */
+function chartMaxPoints(canvasId) {
+    const canvas = document.getElementById(canvasId);
+    const width = canvas ? canvas.clientWidth : 0;
+    return Math.max(Math.round(width) || 1000, 50);
+}
+
 /**
  * Update temperature chart with new data
  */
 function updateTemperatureChart(timeframe) {
     console.log(`Updating temperature chart for timeframe: ${timeframe}`);
     
-    fetch(`/dashboard/api/analytics/temperature?timeframe=${timeframe}`)
+    fetch(`/dashboard/api/analytics/temperature?timeframe=${timeframe}&max_points=${chartMaxPoints('temperatureChart')}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error(`Network response was not ok: ${response.status}`);
             }
             return response.json();
         })
-        .then(data => {
-            console.log('Temperature data received:', data);
-            
-            if (!temperatureChart) {
-                console.error('Temperature chart not initialized');
-                return;
-            }
-            
-            // Format labels based on timeframe
-            const labels = data.labels.map(date => {
-                const dateObj = new Date(date);
-                if (timeframe === 'day') {
-                    return dateObj.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-                } else if (timeframe === 'week') {
-                    return dateObj.toLocaleDateString([], { weekday: 'short' });
-                } else {
-                    return dateObj.toLocaleDateString([], { month: 'short', day: 'numeric' });
-                }
-            });
-            
-            // Update chart data
-            temperatureChart.data.labels = labels;
-            temperatureChart.data.datasets[0].data = data.values;
-            temperatureChart.update();
-        })
+        .then(data => renderTemperatureChart(data, timeframe))
         .catch(error => {
             console.error('Error fetching temperature data:', error);
             // Use sample data if API fails
@@ -336,6 +341,35 @@ function updateTemperatureChart(timeframe) {
         });
 }
 
+/**
+ * Draw a temperature analytics response on the temperature chart
+ */
+function renderTemperatureChart(data, timeframe) {
+    console.log('Temperature data received:', data);
+    
+    if (!temperatureChart) {
+        console.error('Temperature chart not initialized');
+        return;
+    }
+    
+    // Format labels based on timeframe
+    const labels = data.labels.map(date => {
+        const dateObj = new Date(date);
+        if (timeframe === 'day') {
+            return dateObj.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+        } else if (timeframe === 'week') {
+            return dateObj.toLocaleDateString([], { weekday: 'short' });
+        } else {
+            return dateObj.toLocaleDateString([], { month: 'short', day: 'numeric' });
+        }
+    });
+    
+    // Update chart data
+    temperatureChart.data.labels = labels;
+    temperatureChart.data.datasets[0].data = data.values;
+    temperatureChart.update();
+}
+
 /**
  * Use sample temperature data when API fails
  */
@@ -487,67 +521,14 @@ function initializeAirQualityChart() {
 function updateAirQualityChart(timeframe) {
     console.log(`Updating air quality chart for timeframe: ${timeframe}`);
     
-    fetch(`/dashboard/api/analytics/air-quality?timeframe=${timeframe}`)
+    fetch(`/dashboard/api/analytics/air-quality?timeframe=${timeframe}&max_points=${chartMaxPoints('airQualityChart')}&downsample=minmax`)
         .then(response => {
             if (!response.ok) {
                 throw new Error(`Network response was not ok: ${response.status}`);
             }
             return response.json();
         })
-        .then(data => {
-            console.log('Air quality data received:', data);
-            
-            if (!airQualityChart) {
-                console.error('Air quality chart not initialized');
-                return;
-            }
-            
-            // Format labels based on timeframe
-            const labels = data.labels.map(date => {
-                const dateObj = new Date(date);
-                if (timeframe === 'day') {
-                    return dateObj.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-                } else if (timeframe === 'week') {
-                    return dateObj.toLocaleDateString([], { weekday: 'short' });
-                } else {
-                    return dateObj.toLocaleDateString([], { month: 'short', day: 'numeric' });
-                }
-            });
-            
-            // Extract PM2.5 and PM10 values from the data
-            const pm25Values = [];
-            const pm10Values = [];
-            
-            // Check if we have the detailed PM data
-            if (data.pm2_5_values && data.pm10_values) {
-                // If we have separate arrays for PM2.5 and PM10
-                pm25Values.push(...data.pm2_5_values);
-                pm10Values.push(...data.pm10_values);
-            } else {
-                // If we have result array with pm2_5 and pm10 properties
-                data.result?.forEach(item => {
-                    if (item.pm2_5 !== undefined) pm25Values.push(item.pm2_5);
-                    if (item.pm10 !== undefined) pm10Values.push(item.pm10);
-                });
-            }
-            
-            // Update chart data
-            airQualityChart.data.labels = labels;
-            
-            // Update PM2.5 dataset
-            airQualityChart.data.datasets[0].data = pm25Values.length > 0 ? pm25Values : data.values;
-            
-            // Update PM10 dataset
-            if (pm10Values.length > 0) {
-                airQualityChart.data.datasets[1].data = pm10Values;
-            } else {
-                // If no PM10 data, use a modified version of PM2.5 or values for visualization
-                const fallbackData = data.values ? data.values.map(v => v * 1.5) : [];
-                airQualityChart.data.datasets[1].data = fallbackData;
-            }
-            
-            airQualityChart.update();
-        })
+        .then(data => renderAirQualityChart(data, timeframe))
         .catch(error => {
             console.error('Error fetching air quality data:', error);
             // Use sample data if API fails
@@ -555,6 +536,64 @@ function updateAirQualityChart(timeframe) {
         });
 }
 
+/**
+ * Draw an air quality analytics response on the air quality chart
+ */
+function renderAirQualityChart(data, timeframe) {
+    console.log('Air quality data received:', data);
+    
+    if (!airQualityChart) {
+        console.error('Air quality chart not initialized');
+        return;
+    }
+    
+    // Format labels based on timeframe
+    const labels = data.labels.map(date => {
+        const dateObj = new Date(date);
+        if (timeframe === 'day') {
+            return dateObj.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+        } else if (timeframe === 'week') {
+            return dateObj.toLocaleDateString([], { weekday: 'short' });
+        } else {
+            return dateObj.toLocaleDateString([], { month: 'short', day: 'numeric' });
+        }
+    });
+    
+    // Extract PM2.5 and PM10 values from the data
+    const pm25Values = [];
+    const pm10Values = [];
+    
+    // Check if we have the detailed PM data
+    if (data.pm2_5_values && data.pm10_values) {
+        // If we have separate arrays for PM2.5 and PM10
+        pm25Values.push(...data.pm2_5_values);
+        pm10Values.push(...data.pm10_values);
+    } else {
+        // If we have result array with pm2_5 and pm10 properties
+        data.result?.forEach(item => {
+            if (item.pm2_5 !== undefined) pm25Values.push(item.pm2_5);
+            if (item.pm10 !== undefined) pm10Values.push(item.pm10);
+        });
+    }
+    
+    // Update chart data
+    airQualityChart.data.labels = labels;
+    
+    // Update PM2.5 dataset
+    airQualityChart.data.datasets[0].data = pm25Values.length > 0 ? pm25Values : data.values;
+    
+    // Update PM10 dataset
+    if (pm10Values.length > 0) {
+        airQualityChart.data.datasets[1].data = pm10Values;
+    } else {
+        // If no PM10 data, use a modified version of PM2.5 or values for visualization
+        const fallbackData = data.values ? data.values.map(v => v * 1.5) : [];
+        airQualityChart.data.datasets[1].data = fallbackData;
+    }
+    
+    airQualityChart.update();
+}
+
 /**
  * Use sample air quality data when API fails
  */
@@ -730,33 +769,14 @@ function initializeEnvironmentalChart() {
 function updateEnvironmentalChart() {
     console.log('Updating environmental trends chart');
     
-    fetch('/dashboard/api/analytics/environmental')
+    fetch('/dashboard/api/analytics/environmental-trends')
         .then(response => {
             if (!response.ok) {
                 throw new Error(`Network response was not ok: ${response.status}`);
             }
             return response.json();
         })
-        .then(data => {
-            console.log('Environmental data received:', data);
-            
-            if (!environmentalChart) {
-                console.error('Environmental chart not initialized');
-                return;
-            }
-            
-            // Format dates for labels
-            const labels = data.dates.map(date => {
-                const dateObj = new Date(date);
-                return dateObj.toLocaleDateString([], { month: 'short', day: 'numeric' });
-            });
-            
-            // Update chart data
-            environmentalChart.data.labels = labels;
-            environmentalChart.data.datasets[0].data = data.carbon_values;
-            environmentalChart.data.datasets[1].data = data.energy_values;
-            environmentalChart.update();
-        })
+        .then(data => renderEnvironmentalChart(data))
         .catch(error => {
             console.error('Error fetching environmental data:', error);
             // Use sample data if API fails
@@ -764,6 +784,30 @@ function updateEnvironmentalChart() {
         });
 }
 
+/**
+ * Draw an environmental trends response on the environmental chart
+ */
+function renderEnvironmentalChart(data) {
+    console.log('Environmental data received:', data);
+    
+    if (!environmentalChart) {
+        console.error('Environmental chart not initialized');
+        return;
+    }
+    
+    // Format dates for labels
+    const labels = data.dates.map(date => {
+        const dateObj = new Date(date);
+        return dateObj.toLocaleDateString([], { month: 'short', day: 'numeric' });
+    });
+    
+    // Update chart data
+    environmentalChart.data.labels = labels;
+    environmentalChart.data.datasets[0].data = data.carbon_values;
+    environmentalChart.data.datasets[1].data = data.energy_values;
+    environmentalChart.update();
+}
+
 /**
  * Use sample environmental data when API fails
  */
@@ -807,16 +851,6 @@ function useSampleEnvironmentalData() {
     }
 }
 
-/**
- * Update all charts with the current timeframe
- */
-function updateAllCharts(timeframe) {
-    console.log('Updating all charts with timeframe:', timeframe);
-    updateTemperatureChart(timeframe);
-    updateAirQualityChart(timeframe);
-    updateEnvironmentalChart();
-}
-
 /**
  * Update a specific chart based on its ID
  */
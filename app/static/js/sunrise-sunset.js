@@ -2,7 +2,7 @@
  * Sunrise-Sunset Data Handler for EcoSphere Dashboard
  */
 
-// Function to fetch sunrise and sunset data using OpenUV API
+// Function to fetch sunrise and sunset data (computed server-side from location)
 async function fetchSunriseSunsetData() {
     try {
         console.log('Fetching sunrise/sunset data...');
@@ -17,7 +17,7 @@ async function fetchSunriseSunsetData() {
                 // Get user's timezone offset in minutes
                 const timezoneOffset = new Date().getTimezoneOffset();
                 
-                // Call the backend API which uses OpenUV API
+                // Call the backend API, which computes sun times locally
                 const response = await fetch(`/dashboard/api/sun?lat=${latitude}&lon=${longitude}&timezone_offset=${timezoneOffset}`);
                 
                 if (!response.ok) {
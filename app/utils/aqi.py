@@ -0,0 +1,171 @@
+"""
+US EPA Air Quality Index from pollutant concentrations
+Sub-indices use the EPA breakpoint tables (PM2.5 as revised in 2024) and
+linear interpolation within a band:
+
+    I = (I_hi - I_lo) / (C_hi - C_lo) * (C - C_lo) + I_lo
+
+The tables are turned into NumPy arrays once at import, and every function
+takes scalars or whole series, so a chart's worth of readings is converted
+in one call. Inputs are in µg/m³ as OpenWeather reports them; gases are
+converted to ppb/ppm at 25 °C. EPA defines the PM and CO indices on 24-hour
+and 8-hour averages, so indices from shorter windows are approximations.
+Ozone uses the 8-hour table up to 200 ppb and the 1-hour table from 125 ppb,
+the higher of the two where both apply, as EPA reports it; above 200 ppb the
+8-hour index stays at its 300 ceiling, so the index never falls as ozone rises.
+"""
+import numpy as np
+
+# (concentration low, concentration high, index low, index high) per band
+BREAKPOINTS = {
+    'pm2_5': ((0.0, 9.0, 0, 50), (9.1, 35.4, 51, 100), (35.5, 55.4, 101, 150),
+              (55.5, 125.4, 151, 200), (125.5, 225.4, 201, 300), (225.5, 325.4, 301, 500)),   # µg/m³, 24 h
+    'pm10': ((0, 54, 0, 50), (55, 154, 51, 100), (155, 254, 101, 150),
+             (255, 354, 151, 200), (355, 424, 201, 300), (425, 604, 301, 500)),                # µg/m³, 24 h
+    'o3': ((0, 54, 0, 50), (55, 70, 51, 100), (71, 85, 101, 150),
+           (86, 105, 151, 200), (106, 200, 201, 300)),                                         # ppb, 8 h
+    'co': ((0.0, 4.4, 0, 50), (4.5, 9.4, 51, 100), (9.5, 12.4, 101, 150),
+           (12.5, 15.4, 151, 200), (15.5, 30.4, 201, 300), (30.5, 50.4, 301, 500)),            # ppm, 8 h
+    'so2': ((0, 35, 0, 50), (36, 75, 51, 100), (76, 185, 101, 150),
+            (186, 304, 151, 200), (305, 604, 201, 300), (605, 1004, 301, 500)),                # ppb, 1 h
+    'no2': ((0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150),
+            (361, 649, 151, 200), (650, 1249, 201, 300), (1250, 2049, 301, 500)),              # ppb, 1 h
+}
+
+# Ozone's 1-hour bands, which start at 125 ppb and cover it above the 8-hour table
+O3_1H_BREAKPOINTS = ((125, 164, 101, 150), (165, 204, 151, 200), (205, 404, 201, 300),
+                     (405, 604, 301, 500))                                                     # ppb, 1 h
+
+# Decimal places concentrations are truncated to before the lookup
+TRUNCATE_DIGITS = {'pm2_5': 1, 'pm10': 0, 'o3': 0, 'co': 1, 'so2': 0, 'no2': 0}
+
+# µg/m³ -> table unit (ppb = µg/m³ * 24.45 / molecular weight; CO in ppm)
+UNIT_FACTORS = {
+    'pm2_5': 1.0,
+    'pm10': 1.0,
+    'o3': 24.45 / 48.00,
+    'no2': 24.45 / 46.01,
+    'so2': 24.45 / 64.07,
+    'co': 24.45 / 28.01 / 1000,
+}
+
+POLLUTANTS = tuple(BREAKPOINTS)
+
+CATEGORIES = ('Good', 'Moderate', 'Unhealthy for Sensitive Groups', 'Unhealthy', 'Very Unhealthy', 'Hazardous')
+_CATEGORY_LIMITS = np.array([50, 100, 150, 200, 300])
+
+
+def _compile(bands):
+    table = np.array(bands, dtype=float)
+    c_lo, c_hi, i_lo, i_hi = table.T
+    return {'c_lo': c_lo, 'c_hi': c_hi, 'i_lo': i_lo, 'i_hi': i_hi,
+            'slope': (i_hi - i_lo) / (c_hi - c_lo)}
+
+
+_TABLES = {pollutant: _compile(bands) for pollutant, bands in BREAKPOINTS.items()}
+_O3_1H_TABLE = _compile(O3_1H_BREAKPOINTS)
+
+
+def _as_array(values):
+    if isinstance(values, np.ndarray):
+        return values.astype(float)
+    if np.isscalar(values) or values is None:
+        values = [values]
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def _interpolate(table, values):
+    # Truncated readings always fall inside a band; those above the table give 500
+    band = np.minimum(np.searchsorted(table['c_hi'], values, side='left'), len(table['c_hi']) - 1)
+    index = table['i_lo'][band] + table['slope'][band] * (values - table['c_lo'][band])
+    return np.where(values > table['c_hi'][-1], 500.0, index)
+
+
+def sub_index(pollutant, concentrations, converted=False):
+    """
+    AQI sub-index of one pollutant
+    concentrations are in µg/m³ unless converted=True (already in the table's unit).
+    Missing or negative readings give NaN; readings above the table give 500.
+    Returns: NumPy array of indices (floats, not rounded)
+    """
+    table = _TABLES[pollutant]
+    values = _as_array(concentrations)
+    if not converted:
+        values = values * UNIT_FACTORS[pollutant]
+    scale = 10 ** TRUNCATE_DIGITS[pollutant]
+    values = np.floor(values * scale + 1e-9) / scale
+
+    valid = np.isfinite(values) & (values >= 0)
+    values = np.where(valid, values, 0)
+    index = _interpolate(table, values)
+    if pollutant == 'o3':
+        # The 8-hour table ends at 200 ppb with 300, which the 1-hour index only passes from 405 ppb
+        index = np.where(values > table['c_hi'][-1], table['i_hi'][-1], index)
+        one_hour = _interpolate(_O3_1H_TABLE, values)
+        index = np.where(values >= _O3_1H_TABLE['c_lo'][0], np.maximum(index, one_hour), index)
+    return np.where(valid, index, np.nan)
+
+
+def us_aqi(components):
+    """
+    Overall AQI of aligned series of pollutant concentrations (µg/m³)
+    components maps pollutant names (OpenWeather's: pm2_5, pm10, o3, co, so2,
+    no2; others such as no and nh3 are ignored) to scalars or equal-length series.
+    Returns: dict with 'aqi' (array of ints, -1 where nothing was measured),
+    'dominant' (list of pollutant names or None) and 'sub_indices' (pollutant -> array)
+    """
+    subs = {
+        pollutant: sub_index(pollutant, values)
+        for pollutant, values in components.items()
+        if pollutant in _TABLES
+    }
+    if not subs:
+        return {'aqi': np.array([], dtype=int), 'dominant': [], 'sub_indices': {}}
+
+    names = list(subs)
+    stacked = np.vstack([subs[name] for name in names])
+    measured = np.isfinite(stacked).any(axis=0)
+    filled = np.where(np.isfinite(stacked), stacked, -1.0)
+    overall = np.where(measured, np.rint(filled.max(axis=0)), -1).astype(int)
+    dominant = [names[i] if ok else None for i, ok in zip(filled.argmax(axis=0), measured)]
+    return {'aqi': overall, 'dominant': dominant, 'sub_indices': subs}
+
+
+def pm_aqi(pm2_5, pm10):
+    """
+    AQI from PM2.5 and PM10 series alone, as used by the analytics charts
+    Returns: list of ints (None where neither was measured)
+    """
+    overall = us_aqi({'pm2_5': pm2_5, 'pm10': pm10})['aqi']
+    return [int(value) if value >= 0 else None for value in overall]
+
+
+def category(aqi):
+    """
+    EPA category names for AQI values
+    Returns: list of names (None for missing values)
+    """
+    values = _as_array(aqi)
+    positions = np.searchsorted(_CATEGORY_LIMITS, values, side='left')
+    return [CATEGORIES[position] if np.isfinite(value) and value >= 0 else None
+            for position, value in zip(positions, values)]
+
+
+def describe(components):
+    """
+    AQI of a single set of concentrations (µg/m³), ready for a JSON response
+    Returns: dict with aqi, category, dominant and sub_indices, or None if no indexed pollutant was measured
+    """
+    result = us_aqi({pollutant: [value] for pollutant, value in components.items()})
+    if not len(result['aqi']) or result['aqi'][0] < 0:
+        return None
+    return {
+        'aqi': int(result['aqi'][0]),
+        'category': category(result['aqi'][0])[0],
+        'dominant': result['dominant'][0],
+        'sub_indices': {
+            pollutant: int(np.rint(values[0]))
+            for pollutant, values in result['sub_indices'].items()
+            if np.isfinite(values[0])
+        }
+    }
@@ -0,0 +1,119 @@
+"""
+Conditional GET for per-user JSON endpoints
+A view decorated with `conditional(...)` gets a weak ETag derived from a
+version token of the current user's rows in the tables it reads: the highest
+id, (when the table has one) the latest timestamp and the user's
+data_version counter for the table. MAX() over the leading (user_id, ...)
+indexes is a single index seek and the counter is one unique-key lookup, so
+the token costs the same however many rows the user has. A request whose
+If-None-Match still matches is answered 304 before the view runs; otherwise
+the view runs and its response carries the ETag.
+
+The highest id catches inserts; the counter, bumped in the same transaction
+by every ORM update or delete of a row in a table some view depends on (and
+by retention deletes), catches edits and deletes. Last-Modified is sent from
+the latest timestamp for clients and caches that display it, but only
+If-None-Match is used to answer 304: a delete does not move the latest
+timestamp.
+"""
+import hashlib
+from datetime import date, datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+from flask_login import current_user
+from sqlalchemy import DateTime, cast, event, func, literal, null, select, union_all
+
+from app import db
+from app.models import DataVersion, bump_data_versions
+
+# Tables some conditional view depends on; edits and deletes of their rows bump data_version
+VERSIONED_TABLES = set()
+
+
+def version(sources, user_id):
+    """
+    Version token of a user's rows in the given tables
+    sources is a list of (model, timestamp column name or None).
+    Returns: (token string, latest timestamp or None)
+    """
+    parts = []
+    for position, (model, column) in enumerate(sources):
+        latest = func.max(getattr(model, column)) if column else cast(null(), DateTime)
+        changes = (
+            select(DataVersion.version)
+            .where(DataVersion.user_id == user_id, DataVersion.table_name == model.__tablename__)
+            .scalar_subquery()
+        )
+        parts.append(
+            select(literal(position).label('position'), func.max(model.id).label('max_id'),
+                   latest.label('latest'), changes.label('changes'))
+            .where(model.user_id == user_id)
+        )
+    rows = sorted(db.session.execute(union_all(*parts)).all())
+
+    token = []
+    last_modified = None
+    for row in rows:
+        latest = row.latest
+        if isinstance(latest, str):
+            # SQLite hands back MAX() over a datetime column as text
+            latest = datetime.fromisoformat(latest)
+        token.append(f'{row.max_id}:{latest}:{row.changes or 0}')
+        if latest is not None:
+            last_modified = max(last_modified, latest) if last_modified else latest
+    return '|'.join(token), last_modified
+
+
+def _bump_on_flush(session, flush_context):
+    changed = {}
+    for obj in list(session.dirty) + list(session.deleted):
+        table_name = getattr(obj, '__tablename__', None)
+        if table_name in VERSIONED_TABLES and (obj in session.deleted or session.is_modified(obj)):
+            changed.setdefault(table_name, set()).add(getattr(obj, 'user_id', None))
+    for table_name, user_ids in changed.items():
+        bump_data_versions(table_name, user_ids)
+
+
+def init_app(app):
+    """Bump data_version whenever a session edits or deletes rows of a versioned table"""
+    if not event.contains(db.session, 'after_flush', _bump_on_flush):
+        event.listen(db.session, 'after_flush', _bump_on_flush)
+
+
+def conditional(*sources, daily=False):
+    """
+    Answer If-None-Match with 304 while the user's rows in `sources` are unchanged
+    sources are models or (model, timestamp column name) pairs. daily=True
+    adds today's date to the ETag, for views whose ranges are relative to today.
+    The query string is part of the ETag, so every variant of a URL validates
+    on its own.
+    """
+    sources = [source if isinstance(source, tuple) else (source, None) for source in sources]
+    VERSIONED_TABLES.update(model.__tablename__ for model, _ in sources)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            token, last_modified = version(sources, current_user.id)
+            key = [request.path, request.query_string.decode(), str(current_user.id), token]
+            if daily:
+                key.append(date.today().isoformat())
+            etag = hashlib.sha1('\n'.join(key).encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+            # Browsers keep the response but revalidate it on every use
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,116 @@
+"""
+Server-side downsampling for chart series
+Two modes:
+- lttb: Largest-Triangle-Three-Buckets, keeps the points that contribute
+  most to the visual shape of the line
+- minmax: the lowest and highest point of each bucket, so no peak or dip is
+  ever dropped
+Both return indices into the original series, so labels and every other
+series of the same chart can be sliced with them and stay aligned.
+"""
+import numpy as np
+
+MODES = ('lttb', 'minmax')
+
+
+def _as_array(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def lttb_indices(y, max_points, x=None):
+    """
+    Largest-Triangle-Three-Buckets over one series
+    x defaults to the position of each point; pass timestamps for uneven spacing.
+    Returns: sorted NumPy array of at most max_points indices (first and last always kept)
+    """
+    y = _as_array(y)
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else _as_array(x)
+    # Gaps would poison every triangle area in their bucket
+    y = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+
+    # The n - 2 inner points split into max_points - 2 buckets of at least one point
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Every bucket's mean point at once, from cumulative sums
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = ends - starts
+    mean_x = (cum_x[ends] - cum_x[starts]) / sizes
+    mean_y = (cum_y[ends] - cum_y[starts]) / sizes
+    # Each bucket is judged against the mean of the next one (the last against the final point)
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    anchor = 0
+    for i in range(max_points - 2):
+        start, end = starts[i], ends[i]
+        # Twice the triangle area (anchor, candidate, next bucket mean) for the whole bucket
+        area = np.abs(
+            (x[anchor] - next_x[i]) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (next_y[i] - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        selected[i + 1] = anchor
+    return selected
+
+
+def minmax_indices(y, max_points):
+    """
+    Minimum and maximum of each bucket over one series
+    Returns: sorted NumPy array of at most max_points indices (first and last always kept)
+    """
+    y = _as_array(y)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 4:
+        return lttb_indices(y, max_points)
+
+    buckets = (max_points - 2) // 2
+    size = -(-n // buckets)
+    # Pad to a (buckets, size) grid so every bucket is reduced in one call
+    grid = np.full(buckets * size, np.nan)
+    grid[:n] = y
+    grid = grid.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+
+    lows = offsets + np.where(np.isnan(grid), np.inf, grid).argmin(axis=1)
+    highs = offsets + np.where(np.isnan(grid), -np.inf, grid).argmax(axis=1)
+    indices = np.concatenate(([0, n - 1], lows, highs))
+    return np.unique(indices[indices < n])
+
+
+def select_indices(series, max_points, mode='lttb', x=None):
+    """
+    Indices to keep for a chart with one or more aligned series
+    Each series gets an equal share of max_points and the picks are merged,
+    so the peaks of every line survive and the total stays within budget.
+    Returns: sorted list of indices
+    """
+    series = [values for values in series if values is not None]
+    if not series:
+        return []
+    n = len(series[0])
+    if max_points is None or n <= max_points:
+        return list(range(n))
+
+    share = max(max_points // len(series), 3)
+    picked = []
+    for values in series:
+        if mode == 'minmax':
+            picked.append(minmax_indices(values, share))
+        else:
+            picked.append(lttb_indices(values, share, x))
+    return np.unique(np.concatenate(picked)).tolist()
+
+
+def take(values, indices):
+    """Elements of a list at the given indices"""
+    return [values[i] for i in indices]
@@ -0,0 +1,142 @@
+"""
+EXPLAIN checks for the per-user queries the blueprints run
+QUERY_CATALOG mirrors the filters and orderings used by the endpoints.
+`flask explain` runs EXPLAIN on each one against the configured (seeded)
+database and fails when a plan falls back to scanning the whole table.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from app import db
+from app.models import (
+    AirQualityAnalytics, Article, ArticleComment, CarbonLog, DailyActivity, DailyRollup,
+    DashboardData, DataVersion, HourlyRollup, Note, Notification, UserActivity, VitaminDHistory,
+    VitaminDRecord, VitaminLog, WeatherAnalytics,
+)
+
+
+def query_catalog(user_id, article_id=1):
+    """
+    Representative statement for each endpoint query
+    Returns: list of (name, table name, statement)
+    """
+    today = date.today()
+    week_ago = today - timedelta(days=7)
+    now = datetime.now()
+
+    def latest(model, column, limit=10):
+        return select(model).where(model.user_id == user_id).order_by(column.desc()).limit(limit)
+
+    return [
+        ('dashboard.data', 'dashboard_data', latest(DashboardData, DashboardData.recorded_at, 1)),
+        ('dashboard.metrics.latest_weather', 'weather_analytics',
+         select(WeatherAnalytics).where(WeatherAnalytics.user_id == user_id)
+         .order_by(WeatherAnalytics.date.desc(), WeatherAnalytics.time.desc()).limit(1)),
+        ('dashboard.metrics.yesterday', 'weather_analytics',
+         select(WeatherAnalytics).where(WeatherAnalytics.user_id == user_id,
+                                        WeatherAnalytics.date == today - timedelta(days=1))
+         .order_by(WeatherAnalytics.time.desc()).limit(1)),
+        ('dashboard.export.weather', 'weather_analytics',
+         select(WeatherAnalytics).where(WeatherAnalytics.user_id == user_id)
+         .order_by(WeatherAnalytics.date, WeatherAnalytics.time)),
+        ('dashboard.export.air_quality', 'air_quality_analytics',
+         select(AirQualityAnalytics).where(AirQualityAnalytics.user_id == user_id)
+         .order_by(AirQualityAnalytics.date, AirQualityAnalytics.time)),
+        ('dashboard.export.dashboard', 'dashboard_data',
+         select(DashboardData).where(DashboardData.user_id == user_id).order_by(DashboardData.recorded_at)),
+        ('dashboard.analytics.raw', 'weather_analytics',
+         select(WeatherAnalytics.date, WeatherAnalytics.time, WeatherAnalytics.temperature)
+         .where(WeatherAnalytics.user_id == user_id, WeatherAnalytics.date >= today, WeatherAnalytics.date <= today)
+         .order_by(WeatherAnalytics.date, WeatherAnalytics.time)),
+        ('dashboard.statistics.percentiles', 'dashboard_data',
+         select(DashboardData.ph).where(DashboardData.user_id == user_id, DashboardData.ph.isnot(None),
+                                        DashboardData.recorded_at >= datetime.combine(week_ago, datetime.min.time()))),
+        ('dashboard.analytics.daily_rollup', 'daily_rollup',
+         select(DailyRollup).where(DailyRollup.user_id == user_id, DailyRollup.metric.in_(['temperature']),
+                                   DailyRollup.day >= week_ago, DailyRollup.day <= today)),
+        ('dashboard.analytics.hourly_rollup', 'hourly_rollup',
+         select(HourlyRollup).where(HourlyRollup.user_id == user_id, HourlyRollup.metric.in_(['pm2_5', 'pm10']),
+                                    HourlyRollup.day >= week_ago, HourlyRollup.day <= today)),
+        ('retention.weather_day', 'weather_analytics',
+         select(WeatherAnalytics.id, WeatherAnalytics.user_id).where(WeatherAnalytics.date == today).limit(5000)),
+        ('retention.dashboard_day', 'dashboard_data',
+         select(DashboardData.id, DashboardData.user_id)
+         .where(DashboardData.recorded_at >= datetime.combine(today, datetime.min.time()),
+                DashboardData.recorded_at < datetime.combine(today + timedelta(days=1), datetime.min.time()))
+         .limit(5000)),
+        ('conditional.weather', 'weather_analytics',
+         select(func.max(WeatherAnalytics.id)).where(WeatherAnalytics.user_id == user_id)),
+        ('conditional.notes', 'note',
+         select(func.max(Note.id), func.max(Note.updated_at)).where(Note.user_id == user_id)),
+        ('conditional.data_version', 'data_version',
+         select(DataVersion.version).where(DataVersion.user_id == user_id, DataVersion.table_name == 'note')),
+        ('carbon.history', 'carbon_log', latest(CarbonLog, CarbonLog.logged_at)),
+        ('vitamin.history', 'vitamin_d_record', latest(VitaminDRecord, VitaminDRecord.timestamp)),
+        ('vitamin.calculator_history', 'vitamin_d_history', latest(VitaminDHistory, VitaminDHistory.timestamp)),
+        ('vitamin.log', 'vitamin_log', latest(VitaminLog, VitaminLog.created_at)),
+        ('notes.list', 'note', latest(Note, Note.created_at, 100)),
+        ('articles.mine', 'article', latest(Article, Article.created_at, 100)),
+        ('notifications.list', 'notification', latest(Notification, Notification.timestamp, 100)),
+        ('notifications.unread', 'notification',
+         select(Notification).where(Notification.user_id == user_id, Notification.is_read.is_(False))
+         .order_by(Notification.timestamp.desc())),
+        ('progress.activities', 'user_activity', latest(UserActivity, UserActivity.timestamp)),
+        ('progress.stats', 'user_activity',
+         select(UserActivity).where(UserActivity.user_id == user_id,
+                                    UserActivity.timestamp >= now - timedelta(days=7),
+                                    UserActivity.timestamp <= now)),
+        ('models.daily_activity', 'daily_activity',
+         select(DailyActivity).where(DailyActivity.user_id == user_id, DailyActivity.action_type == 'post',
+                                     DailyActivity.day == today)),
+        ('comments.list', 'article_comment',
+         select(ArticleComment).where(ArticleComment.article_id == article_id)
+         .order_by(ArticleComment.created_at.desc())),
+    ]
+
+
+def _plan(statement):
+    """
+    Run the dialect's EXPLAIN for a statement
+    Returns: (dialect name, list of plan rows as dicts)
+    """
+    dialect = db.session.get_bind().dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + sql)).mappings().all()
+    return dialect.name, [dict(row) for row in rows]
+
+
+def full_scans(dialect_name, plan, table):
+    """
+    Plan steps that read every row of `table`
+    Returns: list of human-readable descriptions (empty when the plan uses an index)
+    """
+    found = []
+    for row in plan:
+        if dialect_name == 'mysql':
+            # 'ALL' is a table scan, 'index' a scan of a whole index
+            if row.get('table') == table and row.get('type') in ('ALL', 'index'):
+                found.append(f"type={row.get('type')} key={row.get('key')} rows={row.get('rows')}")
+        elif dialect_name == 'sqlite':
+            detail = row.get('detail', '')
+            if detail.startswith(f'SCAN {table}'):
+                found.append(detail)
+        else:
+            line = str(next(iter(row.values()), ''))
+            if f'Seq Scan on {table}' in line:
+                found.append(line.strip())
+    return found
+
+
+def check_queries(user_id, article_id=1):
+    """
+    EXPLAIN every catalogued query
+    Returns: list of dicts with name, table, ok and the offending plan steps
+    """
+    results = []
+    for name, table, statement in query_catalog(user_id, article_id):
+        dialect_name, plan = _plan(statement)
+        scans = full_scans(dialect_name, plan, table)
+        results.append({'name': name, 'table': table, 'ok': not scans, 'scans': scans})
+    return results
@@ -0,0 +1,210 @@
+"""
+Streaming analytics export
+Rows are read with server-side cursors in chunks of `chunk_size` and encoded
+incrementally as CSV or JSON, optionally compressed with gzip or Brotli, so
+memory use does not depend on how much history a user has.
+"""
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import WeatherAnalytics, AirQualityAnalytics, DashboardData
+
+CSV_HEADER = ('data_type', 'date', 'time', 'value1', 'value2', 'value3', 'value4')
+
+# Content type and file suffix per compression
+COMPRESSIONS = {
+    None: (None, ''),
+    'gzip': ('application/gzip', '.gz'),
+    'br': ('application/x-brotli', '.br'),
+}
+
+# CSV characters / JSON records collected before a chunk is yielded
+FLUSH_SIZE = 64 * 1024
+FLUSH_RECORDS = 1000
+
+
+def _stream(statement, chunk_size, progress=None):
+    result = db.session.execute(
+        statement.execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    for partition in result.partitions():
+        yield from partition
+        if progress is not None:
+            progress(len(partition))
+
+
+def weather_rows(user_id, chunk_size=1000, progress=None):
+    return _stream(
+        select(WeatherAnalytics.date, WeatherAnalytics.time, WeatherAnalytics.temperature, WeatherAnalytics.humidity)
+        .where(WeatherAnalytics.user_id == user_id)
+        .order_by(WeatherAnalytics.date, WeatherAnalytics.time),
+        chunk_size, progress
+    )
+
+
+def air_quality_rows(user_id, chunk_size=1000, progress=None):
+    return _stream(
+        select(AirQualityAnalytics.date, AirQualityAnalytics.time, AirQualityAnalytics.pm2_5, AirQualityAnalytics.pm10)
+        .where(AirQualityAnalytics.user_id == user_id)
+        .order_by(AirQualityAnalytics.date, AirQualityAnalytics.time),
+        chunk_size, progress
+    )
+
+
+def dashboard_rows(user_id, chunk_size=1000, progress=None):
+    return _stream(
+        select(DashboardData.recorded_at, DashboardData.temperature, DashboardData.humidity,
+               DashboardData.light, DashboardData.ph)
+        .where(DashboardData.user_id == user_id)
+        .order_by(DashboardData.recorded_at),
+        chunk_size, progress
+    )
+
+
+def _fmt_date(value):
+    return value.strftime('%Y-%m-%d') if value else ''
+
+
+def _fmt_time(value):
+    return value.strftime('%H:%M') if value else ''
+
+
+def _weather_records(user_id, chunk_size, progress=None):
+    for row in weather_rows(user_id, chunk_size, progress):
+        yield {'date': _fmt_date(row.date), 'time': _fmt_time(row.time),
+               'temperature': row.temperature, 'humidity': row.humidity}
+
+
+def _air_quality_records(user_id, chunk_size, progress=None):
+    for row in air_quality_rows(user_id, chunk_size, progress):
+        yield {'date': _fmt_date(row.date), 'time': _fmt_time(row.time),
+               'pm2_5': row.pm2_5, 'pm10': row.pm10}
+
+
+def _dashboard_records(user_id, chunk_size, progress=None):
+    for row in dashboard_rows(user_id, chunk_size, progress):
+        yield {'date': row.recorded_at.strftime('%Y-%m-%d %H:%M:%S') if row.recorded_at else '',
+               'temperature': row.temperature, 'humidity': row.humidity,
+               'light': row.light, 'ph': row.ph}
+
+
+# Sections of the JSON export, in order
+EXPORT_SECTIONS = (
+    ('weather', _weather_records),
+    ('air_quality', _air_quality_records),
+    ('dashboard', _dashboard_records),
+)
+
+
+def csv_rows(user_id, chunk_size=1000, progress=None):
+    """Export rows in the CSV layout (data_type, date, time, value1..value4)"""
+    for row in weather_rows(user_id, chunk_size, progress):
+        yield ('weather', _fmt_date(row.date), _fmt_time(row.time), row.temperature, row.humidity, '', '')
+    for row in air_quality_rows(user_id, chunk_size, progress):
+        yield ('air_quality', _fmt_date(row.date), _fmt_time(row.time), row.pm2_5, row.pm10, '', '')
+    for row in dashboard_rows(user_id, chunk_size, progress):
+        recorded_at = row.recorded_at.strftime('%Y-%m-%d %H:%M:%S') if row.recorded_at else ''
+        yield ('dashboard', recorded_at, '', row.temperature, row.humidity, row.light, row.ph)
+
+
+def iter_csv(user_id, chunk_size=1000, progress=None):
+    """Yield the CSV export as text chunks of about FLUSH_SIZE characters"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_HEADER)
+
+    for row in csv_rows(user_id, chunk_size, progress):
+        writer.writerow(row)
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_json(user_id, chunk_size=1000, progress=None):
+    """Yield the JSON export ({"weather": [...], "air_quality": [...], "dashboard": [...]}) as text chunks"""
+    parts = ['{']
+    for index, (data_type, records) in enumerate(EXPORT_SECTIONS):
+        parts.append(('' if index == 0 else ',') + json.dumps(data_type) + ':[')
+        for position, record in enumerate(records(user_id, chunk_size, progress)):
+            parts.append(('' if position == 0 else ',') + json.dumps(record))
+            if len(parts) >= FLUSH_RECORDS:
+                yield ''.join(parts)
+                parts = []
+        parts.append(']')
+    parts.append('}')
+    yield ''.join(parts)
+
+
+def iter_ndjson(user_id, chunk_size=1000, progress=None):
+    """Yield one JSON object per line, tagged with its data_type"""
+    lines = []
+    for data_type, records in EXPORT_SECTIONS:
+        for record in records(user_id, chunk_size, progress):
+            lines.append(json.dumps(dict(data_type=data_type, **record)) + '\n')
+            if len(lines) >= FLUSH_RECORDS:
+                yield ''.join(lines)
+                lines = []
+    yield ''.join(lines)
+
+
+def compress(chunks, compression=None):
+    """
+    Encode text chunks as UTF-8 and compress them incrementally
+    Returns: generator of bytes
+    """
+    if compression is None:
+        for chunk in chunks:
+            if chunk:
+                yield chunk.encode('utf-8')
+        return
+
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+        process, finish = compressor.compress, compressor.flush
+    elif compression == 'br':
+        import brotli
+        compressor = brotli.Compressor(quality=5)
+        process, finish = compressor.process, compressor.finish
+    else:
+        raise ValueError(f"Unsupported compression: {compression}")
+
+    for chunk in chunks:
+        data = process(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield finish()
+
+
+# Encoder, content type and file extension per export format
+FORMATS = {
+    'csv': (iter_csv, 'text/csv', '.csv'),
+    'json': (iter_json, 'application/json', '.json'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson', '.ndjson'),
+}
+
+
+def export_stream(user_id, format_type='csv', compression=None, chunk_size=1000, progress=None):
+    """
+    Encoded (and optionally compressed) export for a user
+    progress, if given, is called with the number of rows read after every chunk.
+    Returns: (bytes generator, content type, file extension)
+    """
+    encoder, content_type, extension = FORMATS[format_type]
+    compressed_type, suffix = COMPRESSIONS[compression]
+    return compress(encoder(user_id, chunk_size, progress), compression), compressed_type or content_type, extension + suffix
+
+
+def count_rows(user_id):
+    """Number of rows a full export of this user contains"""
+    return sum(
+        db.session.execute(select(func.count()).select_from(model).where(model.user_id == user_id)).scalar() or 0
+        for model in (WeatherAnalytics, AirQualityAnalytics, DashboardData)
+    )
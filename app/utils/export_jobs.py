@@ -0,0 +1,297 @@
+"""
+Background analytics export jobs
+A job is a row in export_job. Whoever runs it first claims it with a
+conditional UPDATE (queued -> running), so web-process threads and
+`flask export-worker` processes can share one table without running a job
+twice. The export is streamed from the database into a compressed file under
+EXPORT_DIR, with progress written back as it goes, and the finished file is
+served by the download endpoint (which supports range requests).
+
+Every claim stores a new claim token. A runner writes to a temp file named
+after its token and only updates the job, or moves the file into place,
+while the token is still its own, so a slow runner whose job was reclaimed
+stops without touching the new runner's work.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from app import db
+from app.models import ExportJob
+from app.utils.export import count_rows, export_stream
+from config import (
+    EXPORT_CHUNK_SIZE, EXPORT_DIR, EXPORT_FILE_TTL, EXPORT_JOB_MODE, EXPORT_JOB_WORKERS,
+    EXPORT_MAINTENANCE_INTERVAL, EXPORT_STALE_AFTER,
+)
+
+# Formats offered as background jobs and the compression used when none is asked for
+JOB_FORMATS = {'csv': 'gzip', 'ndjson': 'br'}
+JOB_COMPRESSIONS = ('gzip', 'br')
+
+# Seconds between progress writes while a job runs
+PROGRESS_INTERVAL = 1.0
+
+
+def job_to_dict(job):
+    """Status payload for the job endpoints"""
+    progress = None
+    if job.status == 'done':
+        progress = 100.0
+    elif job.rows_total:
+        progress = round(min(job.rows_written * 100.0 / job.rows_total, 99.9), 1)
+
+    return {
+        'id': job.id,
+        'format': job.format,
+        'compression': job.compression,
+        'status': job.status,
+        'rows_total': job.rows_total,
+        'rows_written': job.rows_written,
+        'progress': progress,
+        'file_size': job.file_size,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def job_path(job):
+    """Absolute path of a job's output file"""
+    return os.path.join(EXPORT_DIR, job.file_name)
+
+
+class JobReclaimed(Exception):
+    """The job was claimed by another runner while this one was running it"""
+
+
+def _set(job_id, token=None, **values):
+    # Job state is written on its own connection and committed at once: the
+    # export itself holds a streaming cursor open on the session's connection
+    table = ExportJob.__table__
+    conditions = [table.c.id == job_id]
+    if token is not None:
+        conditions.append(table.c.claim_token == token)
+    with db.engine.begin() as connection:
+        return connection.execute(update(table).where(*conditions).values(**values)).rowcount
+
+
+class ExportJobRunner:
+    """
+    Runs export jobs on a small thread pool (mode "thread") or leaves them for
+    `flask export-worker` (mode "worker"). Jobs whose heartbeat is older than
+    `stale_after` seconds are treated as abandoned and may be claimed again.
+    In thread mode a timer also expires old files and hands abandoned jobs to
+    the pool every `maintenance_interval` seconds, as the worker does.
+    """
+
+    def __init__(self, mode='thread', workers=2, stale_after=300, file_ttl=86400, maintenance_interval=60):
+        self.mode = mode
+        self.workers = workers
+        self.stale_after = stale_after
+        self.file_ttl = file_ttl
+        self.maintenance_interval = maintenance_interval
+        self.app = None
+        self.completed = 0
+        self.failed = 0
+        self.reclaimed = 0
+        self._executor = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        if self.mode == 'thread':
+            self._schedule_maintenance()
+
+    def _schedule_maintenance(self):
+        with self._lock:
+            self._timer = threading.Timer(self.maintenance_interval, self._maintain)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _maintain(self):
+        try:
+            with self.app.app_context():
+                expired = self.expire_files()
+                job_ids = self.next_job_ids()
+            for job_id in job_ids:
+                # run() claims first, so a job another process picks up as well only runs once
+                self._pool().submit(self._run_in_app, job_id)
+            if expired:
+                print(f"Expired {expired} export files")
+        except Exception as e:
+            print(f"Export job maintenance failed: {str(e)}")
+        finally:
+            self._schedule_maintenance()
+
+    def enqueue(self, user_id, format_type, compression):
+        """
+        Queue an export for a user and, in thread mode, start it in the background
+        Returns: the new ExportJob
+        """
+        job = ExportJob(user_id=user_id, format=format_type, compression=compression,
+                        status='queued', rows_written=0, created_at=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+
+        if self.mode == 'thread' and self.app is not None:
+            self._pool().submit(self._run_in_app, job.id)
+        return job
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export-job')
+            return self._executor
+
+    def _run_in_app(self, job_id):
+        with self.app.app_context():
+            self.run(job_id)
+
+    def claim(self, job_id):
+        """
+        Move a queued (or abandoned) job to running
+        Returns: the new claim token, or None if someone else has the job
+        """
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        table = ExportJob.__table__
+        with db.engine.begin() as connection:
+            result = connection.execute(
+                update(table)
+                .where(table.c.id == job_id, or_(
+                    table.c.status == 'queued',
+                    and_(table.c.status == 'running',
+                         table.c.heartbeat_at < now - timedelta(seconds=self.stale_after))
+                ))
+                .values(status='running', started_at=now, heartbeat_at=now, rows_written=0, error=None,
+                        claim_token=token)
+            )
+        return token if result.rowcount == 1 else None
+
+    def next_job_ids(self, limit=10):
+        """Oldest jobs that can be claimed now"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        return list(db.session.execute(
+            select(ExportJob.id)
+            .where(or_(ExportJob.status == 'queued',
+                       and_(ExportJob.status == 'running', ExportJob.heartbeat_at < cutoff)))
+            .order_by(ExportJob.created_at)
+            .limit(limit)
+        ).scalars())
+
+    def run(self, job_id):
+        """
+        Claim and run one job
+        Returns: True if this call ran the job to completion
+        """
+        token = self.claim(job_id)
+        if token is None:
+            return False
+
+        job = db.session.get(ExportJob, job_id)
+        db.session.refresh(job)
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        temp_path = None
+
+        try:
+            total = count_rows(job.user_id)
+            if not _set(job_id, token, rows_total=total):
+                raise JobReclaimed()
+
+            written = [0]
+            last_report = [time.monotonic()]
+
+            def progress(rows):
+                written[0] += rows
+                now = time.monotonic()
+                if now - last_report[0] >= PROGRESS_INTERVAL:
+                    last_report[0] = now
+                    if not _set(job_id, token, rows_written=written[0], heartbeat_at=datetime.utcnow()):
+                        raise JobReclaimed()
+
+            chunks, _, extension = export_stream(job.user_id, job.format, job.compression,
+                                                 EXPORT_CHUNK_SIZE, progress)
+            file_name = f"{job.user_id}-{job_id}{extension}"
+            temp_path = os.path.join(EXPORT_DIR, f'{file_name}.{token}.part')
+            with open(temp_path, 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+            db.session.rollback()  # end the read transaction before reporting
+
+            # The file only appears under its final name once it is complete, and only from the job's owner
+            if not _set(job_id, token, heartbeat_at=datetime.utcnow()):
+                raise JobReclaimed()
+            os.replace(temp_path, os.path.join(EXPORT_DIR, file_name))
+            _set(job_id, token, status='done', rows_written=written[0], rows_total=max(total, written[0]),
+                 file_name=file_name, file_size=os.path.getsize(os.path.join(EXPORT_DIR, file_name)),
+                 heartbeat_at=datetime.utcnow(), finished_at=datetime.utcnow())
+            self.completed += 1
+            return True
+        except JobReclaimed:
+            db.session.rollback()
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.reclaimed += 1
+            print(f"Export job {job_id} was reclaimed by another runner, stopping")
+            return False
+        except Exception as e:
+            db.session.rollback()
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            _set(job_id, token, status='failed', error=str(e)[:1000], finished_at=datetime.utcnow())
+            self.failed += 1
+            print(f"Export job {job_id} failed: {str(e)}")
+            return False
+
+    def run_pending(self, limit=10):
+        """
+        Run queued jobs one after another in this thread
+        Returns: number of jobs run
+        """
+        ran = 0
+        for job_id in self.next_job_ids(limit):
+            if self.run(job_id):
+                ran += 1
+        return ran
+
+    def expire_files(self):
+        """
+        Delete files of jobs finished more than file_ttl seconds ago
+        Returns: number of jobs expired
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.file_ttl)
+        jobs = db.session.execute(
+            select(ExportJob).where(ExportJob.status == 'done', ExportJob.finished_at < cutoff)
+        ).scalars().all()
+        for job in jobs:
+            path = job_path(job)
+            if os.path.exists(path):
+                os.remove(path)
+            job.status = 'expired'
+        db.session.commit()
+        return len(jobs)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'completed': self.completed,
+            'failed': self.failed,
+            'reclaimed': self.reclaimed
+        }
+
+
+export_jobs = ExportJobRunner(
+    mode=EXPORT_JOB_MODE,
+    workers=EXPORT_JOB_WORKERS,
+    stale_after=EXPORT_STALE_AFTER,
+    file_ttl=EXPORT_FILE_TTL,
+    maintenance_interval=EXPORT_MAINTENANCE_INTERVAL
+)
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class GeoCache:
+    """
+    In-process LRU cache with a TTL for upstream responses
+    Keys are (provider, lat cell, lon cell) where lat/lon are snapped to a
+    grid of `cell_size` degrees, so nearby users share one entry. Entries are
+    kept for `max_stale` seconds past their TTL so `lookup` can serve them
+    while a refresh runs.
+    """
+
+    def __init__(self, cell_size=0.05, ttl=600, max_entries=2048, max_stale=0):
+        self.cell_size = cell_size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cell(self, lat, lon):
+        return (round(float(lat) / self.cell_size), round(float(lon) / self.cell_size))
+
+    def key(self, provider, lat, lon):
+        return (provider,) + self.cell(lat, lon)
+
+    def lookup(self, provider, lat, lon):
+        """
+        Cached value for the cell, including entries up to `max_stale` seconds past their TTL
+        Returns: (value, fresh), or (None, False) on a miss
+        """
+        key = self.key(provider, lat, lon)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + self.max_stale <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None, False
+
+            self._entries.move_to_end(key)
+            if entry[0] > now:
+                self.hits += 1
+                return entry[1], True
+
+            self.stale_hits += 1
+            return entry[1], False
+
+    def get(self, provider, lat, lon):
+        """Return the cached value for the cell, or None on a miss or expired entry"""
+        value, fresh = self.lookup(provider, lat, lon)
+        return value if fresh else None
+
+    def expires_in(self, provider, lat, lon):
+        """Seconds until the cell's entry expires (negative once stale), or None if not cached"""
+        with self._lock:
+            entry = self._entries.get(self.key(provider, lat, lon))
+            return None if entry is None else entry[0] - time.monotonic()
+
+    def set(self, provider, lat, lon, value, ttl=None):
+        key = self.key(provider, lat, lon)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0,
+                'cell_size': self.cell_size,
+                'ttl': self.ttl,
+                'max_stale': self.max_stale
+            }
@@ -0,0 +1,222 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from app.utils import upstream
+from app.utils.geo_cache import GeoCache
+from app.utils.singleflight import upstream_flights
+from app.utils.upstream import UpstreamError
+from app.utils.weather_api import cell_key
+from config import (
+    OPENUV_API_KEY,
+    OPENUV_API_KEY_BACKUP1,
+    OPENUV_API_KEY_BACKUP2,
+    OPENUV_DAILY_QUOTA,
+    OPENUV_FAILURE_THRESHOLD,
+    OPENUV_COOLDOWN,
+    OPENUV_MAX_COOLDOWN,
+    OPENUV_CACHE_TTL,
+    WEATHER_CACHE_CELL_SIZE,
+    WEATHER_CACHE_MAX_ENTRIES,
+)
+
+# Answers that mean the key itself is unusable until the quota resets
+# (401 rejected key, 403 quota exceeded, 429 rate limited)
+QUOTA_STATUSES = (401, 403, 429)
+
+
+def _next_quota_reset(now):
+    tomorrow = (now + timedelta(days=1)).date()
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc)
+
+
+class KeyState:
+    def __init__(self, name, key, daily_quota):
+        self.name = name
+        self.key = key
+        self.daily_quota = daily_quota
+        self.quota_day = None
+        self.used = 0
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.open_reason = None
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.quota_rejections = 0
+
+    @property
+    def remaining(self):
+        return max(self.daily_quota - self.used, 0)
+
+    def is_open(self, now):
+        return self.open_until is not None and now < self.open_until
+
+    def to_dict(self, now):
+        return {
+            'name': self.name,
+            'remaining_quota': self.remaining,
+            'used_today': self.used,
+            'circuit': 'open' if self.is_open(now) else 'closed',
+            'open_reason': self.open_reason if self.is_open(now) else None,
+            'open_until': self.open_until.isoformat() if self.is_open(now) else None,
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'quota_rejections': self.quota_rejections
+        }
+
+
+class OpenUVKeyPool:
+    """
+    Tracks quota and health of each OpenUV key and hands out the best one
+    Keys that report an exhausted quota are skipped until the next 00:00 UTC
+    reset; keys that keep failing are skipped for an exponentially growing
+    cooldown. Quota use is counted per process, so it is a conservative
+    estimate when several workers share the same keys.
+    """
+
+    def __init__(self, keys, daily_quota=50, failure_threshold=3, cooldown=60, max_cooldown=900):
+        self.keys = [KeyState(name, key, daily_quota) for name, key in keys if key]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+
+    def _roll_day(self, state, now):
+        if state.quota_day != now.date():
+            state.quota_day = now.date()
+            state.used = 0
+            if state.open_reason == 'quota':
+                state.open_until = None
+                state.open_reason = None
+
+    def acquire(self, exclude=()):
+        """
+        Reserve one request on the healthiest key
+        Returns: KeyState, or None if every key is exhausted or open
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            candidates = []
+            for position, state in enumerate(self.keys):
+                self._roll_day(state, now)
+                if state.name in exclude or state.is_open(now) or state.remaining <= 0:
+                    continue
+                # Prefer keys in configured order, skipping ones that have been failing
+                candidates.append((state.consecutive_failures, position, state))
+
+            if not candidates:
+                return None
+
+            state = min(candidates, key=lambda c: (c[0], c[1]))[2]
+            state.used += 1
+            state.requests += 1
+            return state
+
+    def record_success(self, state):
+        with self._lock:
+            state.successes += 1
+            state.consecutive_failures = 0
+            if state.open_reason == 'errors':
+                state.open_until = None
+                state.open_reason = None
+
+    def record_quota_exhausted(self, state):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            state.quota_rejections += 1
+            state.used = state.daily_quota
+            state.open_until = _next_quota_reset(now)
+            state.open_reason = 'quota'
+
+    def record_failure(self, state):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            state.failures += 1
+            state.consecutive_failures += 1
+            overflow = state.consecutive_failures - self.failure_threshold
+            if overflow >= 0:
+                delay = min(self.cooldown * (2 ** overflow), self.max_cooldown)
+                state.open_until = now + timedelta(seconds=delay)
+                state.open_reason = 'errors'
+
+    def metrics(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for state in self.keys:
+                self._roll_day(state, now)
+            return [state.to_dict(now) for state in self.keys]
+
+
+openuv_keys = OpenUVKeyPool(
+    [
+        ('primary', OPENUV_API_KEY),
+        ('backup1', OPENUV_API_KEY_BACKUP1),
+        ('backup2', OPENUV_API_KEY_BACKUP2),
+    ],
+    daily_quota=OPENUV_DAILY_QUOTA,
+    failure_threshold=OPENUV_FAILURE_THRESHOLD,
+    cooldown=OPENUV_COOLDOWN,
+    max_cooldown=OPENUV_MAX_COOLDOWN
+)
+
+uv_cache = GeoCache(
+    cell_size=WEATHER_CACHE_CELL_SIZE,
+    ttl=OPENUV_CACHE_TTL,
+    max_entries=WEATHER_CACHE_MAX_ENTRIES
+)
+
+
+def _request_uv(lat, lon, pool):
+    if not pool.keys:
+        raise UpstreamError('openuv', None, message='No OpenUV API keys configured')
+
+    tried = set()
+    last_error = None
+    while True:
+        state = pool.acquire(exclude=tried)
+        if state is None:
+            raise UpstreamError('openuv', None, last_error,
+                                message=last_error or 'All OpenUV API keys are exhausted or unavailable')
+        tried.add(state.name)
+
+        try:
+            response = upstream.get(
+                'openuv',
+                '/api/v1/uv',
+                params={'lat': lat, 'lng': lon},
+                headers={'x-access-token': state.key}
+            )
+        except requests.RequestException as e:
+            pool.record_failure(state)
+            last_error = str(e)
+            continue
+
+        if response.status_code == 200:
+            pool.record_success(state)
+            return response.json()
+
+        if response.status_code in QUOTA_STATUSES:
+            pool.record_quota_exhausted(state)
+        else:
+            pool.record_failure(state)
+        last_error = f'OpenUV API error with key {state.name}: {response.status_code}'
+        print(last_error)
+
+
+def fetch_uv(lat, lon, pool=openuv_keys):
+    """
+    UV and sun data from OpenUV using the healthiest key in the pool
+    Answers are cached per grid cell and concurrent lookups for the same cell
+    share one request.
+    Returns: full OpenUV JSON payload (raises UpstreamError if no key succeeds)
+    """
+    cached = uv_cache.get('openuv', lat, lon)
+    if cached is not None:
+        return cached
+
+    data = upstream_flights.do(cell_key('openuv', lat, lon), lambda: _request_uv(lat, lon, pool))
+    uv_cache.set('openuv', lat, lon, data)
+    return data
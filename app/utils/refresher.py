@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HotCellRefresher:
+    """
+    Keeps the most requested grid cells of a GeoCache warm
+    Every `interval` seconds the `top_n` most requested cells whose entry
+    expires within `lead_time` seconds are refetched in the background with
+    `refresh_fn(provider, lat, lon)`. Request counts are halved on each pass
+    so cells that stop being requested cool down and are dropped.
+    """
+
+    def __init__(self, cache, refresh_fn, interval=30, lead_time=60, top_n=50, workers=4, enabled=True):
+        self.cache = cache
+        self.refresh_fn = refresh_fn
+        self.interval = interval
+        self.lead_time = lead_time
+        self.top_n = top_n
+        self.enabled = enabled
+        self.refreshes = 0
+        self.failures = 0
+        self._counts = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-refresh')
+
+    def track(self, provider, lat, lon):
+        """Count a request for the cell; starts the refresher thread on first use"""
+        key = self.cache.key(provider, lat, lon)
+        with self._lock:
+            count, _ = self._counts.get(key, (0, None))
+            # Keep the latest coordinates so refreshes query a real point in the cell
+            self._counts[key] = (count + 1, (provider, lat, lon))
+
+        if self.enabled and self._thread is None:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='cache-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh_async(self, provider, lat, lon):
+        """Queue a background refresh of the cell unless one is already pending"""
+        key = self.cache.key(provider, lat, lon)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._refresh, key, provider, lat, lon)
+
+    def _refresh(self, key, provider, lat, lon):
+        try:
+            self.refresh_fn(provider, lat, lon)
+            self.refreshes += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"Background refresh failed for {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Cache refresher pass failed: {str(e)}")
+
+    def run_once(self):
+        """Refresh the hottest cells that are about to expire and decay the request counts"""
+        with self._lock:
+            hottest = sorted(self._counts.values(), key=lambda item: item[0], reverse=True)[:self.top_n]
+            self._counts = {
+                key: (count / 2, location)
+                for key, (count, location) in self._counts.items()
+                if count / 2 >= 0.5
+            }
+
+        for _, (provider, lat, lon) in hottest:
+            remaining = self.cache.expires_in(provider, lat, lon)
+            # Cells that were never cached (or were evicted) are left to the next request
+            if remaining is not None and remaining <= self.lead_time:
+                self.refresh_async(provider, lat, lon)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'tracked_cells': len(self._counts),
+                'pending': len(self._pending),
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+                'interval': self.interval,
+                'lead_time': self.lead_time,
+                'top_n': self.top_n
+            }
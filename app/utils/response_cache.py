@@ -0,0 +1,185 @@
+"""
+Server-side cache of per-user JSON responses
+Entries are keyed by user, endpoint and query string and stored in a
+cachelib backend (FileSystemCache or RedisCache, shared by every process,
+or SimpleCache for a single one). Each cached view belongs to a group of
+tables, and each user has a generation number per group that is part of
+every key. Writing a row for a user in one of the group's tables replaces
+that user's generation, so their old entries are never read again and age
+out by TTL, while everyone else's entries stay valid.
+
+Writes are picked up from committed ORM sessions and from write-behind
+flushes. Bulk writes that bypass both (seeding, rollup rebuilds) clear the
+cache. A hit is answered from the cache alone, stored ETag included, without
+querying the database; that is only safe while every process shares the
+backend, which is why "simple" is for a single worker.
+"""
+import os
+import time
+from datetime import date
+from functools import wraps
+
+from cachelib import FileSystemCache, NullCache, RedisCache, SimpleCache
+from flask import make_response, request
+from flask_login import current_user
+from sqlalchemy import event
+
+from app import db
+from config import (
+    RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_REDIS_URL,
+    RESPONSE_CACHE_TTL,
+)
+
+# Group name -> tables whose writes invalidate the group's entries
+CACHE_GROUPS = {
+    'analytics': ('weather_analytics', 'air_quality_analytics', 'dashboard_data', 'carbon_log'),
+}
+
+# Headers stored with a cached body
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+
+def make_backend(name):
+    """cachelib cache for a RESPONSE_CACHE_BACKEND name"""
+    if name == 'simple':
+        return SimpleCache(threshold=RESPONSE_CACHE_MAX_ENTRIES, default_timeout=RESPONSE_CACHE_TTL)
+    if name == 'filesystem':
+        os.makedirs(RESPONSE_CACHE_DIR, exist_ok=True)
+        return FileSystemCache(RESPONSE_CACHE_DIR, threshold=RESPONSE_CACHE_MAX_ENTRIES,
+                               default_timeout=RESPONSE_CACHE_TTL)
+    if name == 'redis':
+        # Needs the redis package; any Redis-compatible server works
+        import redis
+        return RedisCache(host=redis.from_url(RESPONSE_CACHE_REDIS_URL), key_prefix='ecosphere:',
+                          default_timeout=RESPONSE_CACHE_TTL)
+    if name == 'null':
+        return NullCache()
+    raise ValueError(f'Unknown response cache backend: {name}')
+
+
+class ResponseCache:
+    """Per-user response cache with generation-based invalidation (see module docstring)"""
+
+    def __init__(self):
+        self.cache = NullCache()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._groups_by_table = {
+            table: group for group, tables in CACHE_GROUPS.items() for table in tables
+        }
+
+    def init_app(self, app):
+        try:
+            self.cache = make_backend(RESPONSE_CACHE_BACKEND)
+        except Exception as e:
+            print(f"Response cache disabled, {RESPONSE_CACHE_BACKEND} backend unavailable: {str(e)}")
+            self.cache = NullCache()
+
+        if RESPONSE_CACHE_BACKEND == 'simple':
+            print("Response cache is per process; use the filesystem or redis backend with several workers")
+
+        # Writes are collected per session on flush and applied once the transaction commits
+        for name, fn in (('after_flush', self._collect_flush), ('after_commit', self._apply_pending),
+                         ('after_rollback', self._drop_pending)):
+            if not event.contains(db.session, name, fn):
+                event.listen(db.session, name, fn)
+
+    def generation(self, group, user_id):
+        """Current generation of a user's entries in a group, started on first use"""
+        key = f'generation:{group}:{user_id}'
+        value = self.cache.get(key)
+        if value is None:
+            # A clock reading, so a generation that was evicted never comes back with an old number
+            self.cache.add(key, time.time_ns(), timeout=0)
+            value = self.cache.get(key) or 0
+        return value
+
+    def invalidate(self, group, user_ids):
+        """Start a new generation for each user, dropping their entries in the group"""
+        for user_id in set(user_ids):
+            if user_id is None:
+                continue
+            self.cache.set(f'generation:{group}:{user_id}', time.time_ns(), timeout=0)
+            self.invalidations += 1
+
+    def invalidate_rows(self, rows):
+        """Invalidate the groups touched by (table, values) pairs, as write-behind flushes hand them over"""
+        touched = {}
+        for table, values in rows:
+            group = self._groups_by_table.get(table.name)
+            if group:
+                touched.setdefault(group, set()).add(values.get('user_id'))
+        for group, user_ids in touched.items():
+            self.invalidate(group, user_ids)
+
+    def clear(self):
+        self.cache.clear()
+
+    def _collect_flush(self, session, flush_context):
+        pending = session.info.setdefault('response_cache_pending', {})
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            group = self._groups_by_table.get(getattr(obj, '__tablename__', None))
+            if group:
+                pending.setdefault(group, set()).add(getattr(obj, 'user_id', None))
+
+    def _apply_pending(self, session):
+        pending = session.info.pop('response_cache_pending', None)
+        for group, user_ids in (pending or {}).items():
+            self.invalidate(group, user_ids)
+
+    def _drop_pending(self, session):
+        session.info.pop('response_cache_pending', None)
+
+    def cached(self, group, daily=False):
+        """
+        Serve a view's 200 responses from the cache until the user's rows in the group change
+        daily=True adds today's date to the key, for views whose ranges are relative to today.
+        Put it above @conditional, so hits skip the version query; the cached
+        ETag still answers a matching If-None-Match with 304.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                user_id = current_user.id
+                key = [
+                    'response', group, str(user_id), str(self.generation(group, user_id)),
+                    request.endpoint, request.query_string.decode()
+                ]
+                if daily:
+                    key.append(date.today().isoformat())
+                key = ':'.join(key)
+
+                entry = self.cache.get(key)
+                if entry is None:
+                    self.misses += 1
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code == 200 and not response.direct_passthrough:
+                        self.cache.set(key, {
+                            'body': response.get_data(),
+                            'mimetype': response.mimetype,
+                            'headers': {name: response.headers[name] for name in CACHED_HEADERS
+                                        if name in response.headers}
+                        })
+                    return response
+
+                self.hits += 1
+                etag = entry['headers'].get('ETag')
+                if etag and request.if_none_match.contains_raw(etag):
+                    return make_response('', 304, entry['headers'])
+                response = make_response(entry['body'], 200, entry['headers'])
+                response.mimetype = entry['mimetype']
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            'backend': type(self.cache).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+response_cache = ResponseCache()
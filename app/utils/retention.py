@@ -0,0 +1,148 @@
+"""
+Retention for the raw analytics tables
+Raw readings older than a table's retention are compacted one day at a
+time, oldest first. The day's rollups are checked against the raw rows and
+recomputed for any user whose rollups are missing readings. Then the raw
+rows are deleted in batches of `batch_size` ids, each committed on its own,
+so no statement holds locks for long. A day that was interrupted part-way
+has fewer raw rows than its rollups count and is simply finished on the next
+run.
+"""
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import DailyRollup, bump_data_versions
+from app.utils.rollups import ROLLUP_SOURCES, day_range, delete_rollups, insert_from_raw, metric_column
+from config import (
+    RETENTION_AIR_QUALITY_DAYS, RETENTION_BATCH_PAUSE, RETENTION_BATCH_SIZE, RETENTION_DASHBOARD_DAYS,
+    RETENTION_WEATHER_DAYS,
+)
+
+# Days of raw rows kept per table (0 keeps everything)
+RETENTION_POLICIES = {
+    'weather_analytics': RETENTION_WEATHER_DAYS,
+    'air_quality_analytics': RETENTION_AIR_QUALITY_DAYS,
+    'dashboard_data': RETENTION_DASHBOARD_DAYS,
+}
+
+
+def cutoffs(today=None):
+    """
+    First day whose raw rows are kept, per table with a retention policy
+    Returns: dict of table name -> date
+    """
+    today = today or date.today()
+    return {
+        name: today - timedelta(days=days)
+        for name, days in RETENTION_POLICIES.items()
+        if days > 0
+    }
+
+
+def oldest_day(model):
+    """Day of the oldest raw reading in a table, or None if it is empty"""
+    column = model.recorded_at if hasattr(model, 'recorded_at') else model.date
+    oldest = db.session.execute(select(func.min(column))).scalar()
+    if oldest is None:
+        return None
+    if isinstance(oldest, str):
+        # SQLite hands back MIN() over a date column as text
+        return date.fromisoformat(oldest[:10])
+    return oldest.date() if hasattr(oldest, 'date') else oldest
+
+
+def count_before(model, cutoff):
+    """Raw rows older than the cutoff"""
+    return db.session.execute(
+        select(func.count()).select_from(model).where(*day_range(model, end_date=cutoff - timedelta(days=1)))
+    ).scalar()
+
+
+def reconcile_day(model, metrics, day):
+    """
+    Make sure a day's rollups cover every raw reading before the raw rows go
+    Rollups are recomputed from the raw rows for each user and metric whose
+    rollup count is lower than the raw count (caller commits).
+    Returns: number of (user, metric) rollups recomputed
+    """
+    raw = db.session.execute(
+        select(model.user_id, *[func.count(metric_column(model, metric)).label(metric) for metric in metrics])
+        .where(model.user_id.isnot(None), *day_range(model, day, day))
+        .group_by(model.user_id)
+    ).all()
+    rolled = {
+        (row.user_id, row.metric): row.count
+        for row in db.session.execute(
+            select(DailyRollup.user_id, DailyRollup.metric, DailyRollup.count)
+            .where(DailyRollup.day == day, DailyRollup.metric.in_(metrics))
+        )
+    }
+
+    repaired = 0
+    for row in raw:
+        for metric in metrics:
+            if getattr(row, metric) > rolled.get((row.user_id, metric), 0):
+                delete_rollups([metric], row.user_id, day, day)
+                insert_from_raw(model, metric, row.user_id, day, day)
+                repaired += 1
+    return repaired
+
+
+def delete_day(model, day, batch_size, pause):
+    """
+    Delete a day's raw rows in batches, one short transaction per batch
+    Each batch bumps its users' data_version, so their conditional GET tokens change.
+    Returns: rows deleted
+    """
+    deleted = 0
+    while True:
+        rows = db.session.execute(
+            select(model.id, model.user_id).where(*day_range(model, day, day)).limit(batch_size)
+        ).all()
+        if not rows:
+            return deleted
+        ids = [row.id for row in rows]
+        db.session.execute(model.__table__.delete().where(model.id.in_(ids)))
+        bump_data_versions(model.__tablename__, [row.user_id for row in rows])
+        db.session.commit()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def compact_table(name, cutoff, batch_size=RETENTION_BATCH_SIZE, pause=RETENTION_BATCH_PAUSE, dry_run=False):
+    """
+    Roll up and delete one table's raw rows from before the cutoff day
+    Returns: dict with table, cutoff, days, rows_deleted and rollups_repaired
+    (with dry_run, rows_deleted is the number of rows that would go)
+    """
+    model, metrics = ROLLUP_SOURCES[name]
+    report = {'table': name, 'cutoff': cutoff.isoformat(), 'days': 0, 'rows_deleted': 0, 'rollups_repaired': 0}
+    if dry_run:
+        report['rows_deleted'] = count_before(model, cutoff)
+        return report
+
+    day = oldest_day(model)
+    while day is not None and day < cutoff:
+        report['rollups_repaired'] += reconcile_day(model, metrics, day)
+        db.session.commit()
+        report['rows_deleted'] += delete_day(model, day, batch_size, pause)
+        report['days'] += 1
+        day = oldest_day(model)
+    return report
+
+
+def compact(tables=None, batch_size=RETENTION_BATCH_SIZE, pause=RETENTION_BATCH_PAUSE, dry_run=False, today=None):
+    """
+    Apply every retention policy (or only those of `tables`)
+    Returns: list of per-table reports (see compact_table)
+    """
+    reports = []
+    for name, cutoff in cutoffs(today).items():
+        if tables and name not in tables:
+            continue
+        reports.append(compact_table(name, cutoff, batch_size, pause, dry_run))
+    return reports
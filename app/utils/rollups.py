@@ -0,0 +1,321 @@
+"""
+Daily and hourly rollups of the analytics readings
+Each (user, metric, day) and (user, metric, day, hour) row holds count, sum,
+min and max, so charts read one row per bucket however much raw history a
+user has. Rollups are updated in the same transaction as the raw inserts
+(see apply_rows) and can be rebuilt from the raw tables with
+`flask rollups rebuild`.
+"""
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import case, extract, func, literal, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import WeatherAnalytics, AirQualityAnalytics, DashboardData, DailyRollup, HourlyRollup
+
+# Raw tables and the metrics rolled up from each
+ROLLUP_SOURCES = {
+    'weather_analytics': (WeatherAnalytics, ('temperature', 'humidity')),
+    'air_quality_analytics': (AirQualityAnalytics, ('pm2_5', 'pm10')),
+    # dashboard_data's own temperature and humidity (POSTed sensor readings among them) are
+    # rolled up apart from the weather readings, under their own metric names
+    'dashboard_data': (DashboardData, ('light', 'ph', 'sensor_temperature', 'sensor_humidity')),
+}
+
+# Rollup metrics named differently from the raw column they are read from
+METRIC_COLUMNS = {'sensor_temperature': 'temperature', 'sensor_humidity': 'humidity'}
+
+
+def metric_column(model, metric):
+    """Raw column of `model` a rollup metric is read from"""
+    return getattr(model, METRIC_COLUMNS.get(metric, metric))
+
+
+def _reading_day_hour(values):
+    """(day, hour or None) of a raw row's values; dashboard_data has recorded_at instead of date/time"""
+    recorded_at = values.get('recorded_at')
+    if recorded_at is not None:
+        return recorded_at.date(), recorded_at.hour
+    at_time = values.get('time')
+    return values.get('date'), at_time.hour if at_time is not None else None
+
+
+def day_column(model):
+    """SQL expression for the day of a raw reading"""
+    if hasattr(model, 'recorded_at'):
+        return func.date(model.recorded_at)
+    return model.date
+
+
+def hour_column(model):
+    """SQL expression for the hour of a raw reading"""
+    return extract('hour', model.recorded_at if hasattr(model, 'recorded_at') else model.time)
+
+
+def day_range(model, start_date=None, end_date=None):
+    """
+    WHERE conditions for raw readings from start_date to end_date (both
+    inclusive, either may be None), written so an index on the column applies
+    Returns: list of conditions
+    """
+    conditions = []
+    if hasattr(model, 'recorded_at'):
+        if start_date is not None:
+            conditions.append(model.recorded_at >= datetime.combine(start_date, time()))
+        if end_date is not None:
+            conditions.append(model.recorded_at < datetime.combine(end_date + timedelta(days=1), time()))
+    else:
+        if start_date is not None:
+            conditions.append(model.date >= start_date)
+        if end_date is not None:
+            conditions.append(model.date <= end_date)
+    return conditions
+
+
+def _merge(buckets, key, value):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = {'count': 1, 'total': value, 'min_value': value, 'max_value': value}
+    else:
+        bucket['count'] += 1
+        bucket['total'] += value
+        bucket['min_value'] = min(bucket['min_value'], value)
+        bucket['max_value'] = max(bucket['max_value'], value)
+
+
+def _upsert(model, key_columns, rows):
+    """Add partial aggregates to existing rollup rows, inserting missing ones, in one executemany"""
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            count=table.c.count + stmt.inserted.count,
+            total=table.c.total + stmt.inserted.total,
+            min_value=func.least(table.c.min_value, stmt.inserted.min_value),
+            max_value=func.greatest(table.c.max_value, stmt.inserted.max_value)
+        )
+    elif dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            smallest, largest = func.least, func.greatest
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+            # SQLite's multi-argument min()/max() are scalar functions
+            smallest, largest = func.min, func.max
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={
+                'count': table.c.count + stmt.excluded.count,
+                'total': table.c.total + stmt.excluded.total,
+                'min_value': smallest(table.c.min_value, stmt.excluded.min_value),
+                'max_value': largest(table.c.max_value, stmt.excluded.max_value)
+            }
+        )
+    else:
+        _update_or_insert(table, key_columns, rows)
+        return
+
+    db.session.execute(stmt, rows)
+
+
+def _update_or_insert(table, key_columns, rows):
+    """Row-by-row upsert for databases without an upsert statement: update, else insert"""
+    for row in rows:
+        key = [table.c[column] == row[column] for column in key_columns]
+        update = (
+            table.update().where(*key).values(
+                count=table.c.count + row['count'],
+                total=table.c.total + row['total'],
+                min_value=case((table.c.min_value <= row['min_value'], table.c.min_value), else_=row['min_value']),
+                max_value=case((table.c.max_value >= row['max_value'], table.c.max_value), else_=row['max_value'])
+            )
+        )
+        if db.session.execute(update).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(**row))
+        except IntegrityError:
+            # Inserted by someone else since the update
+            db.session.execute(update)
+
+
+def apply_rows(rows):
+    """
+    Fold newly inserted raw readings into the rollups (caller commits)
+    `rows` is a list of (table, values) pairs as queued on the write-behind
+    buffer; tables without rollups are ignored.
+    """
+    daily = {}
+    hourly = {}
+    for table, values in rows:
+        source = ROLLUP_SOURCES.get(table.name)
+        if source is None or values.get('user_id') is None:
+            continue
+        day, hour = _reading_day_hour(values)
+        if day is None:
+            continue
+        for metric in source[1]:
+            value = values.get(METRIC_COLUMNS.get(metric, metric))
+            if value is None:
+                continue
+            _merge(daily, (values['user_id'], metric, day), value)
+            if hour is not None:
+                _merge(hourly, (values['user_id'], metric, day, hour), value)
+
+    _upsert(DailyRollup, ['user_id', 'metric', 'day'], [
+        dict(user_id=user_id, metric=metric, day=day, **bucket)
+        for (user_id, metric, day), bucket in daily.items()
+    ])
+    _upsert(HourlyRollup, ['user_id', 'metric', 'day', 'hour'], [
+        dict(user_id=user_id, metric=metric, day=day, hour=hour, **bucket)
+        for (user_id, metric, day, hour), bucket in hourly.items()
+    ])
+
+
+def insert_from_raw(model, metric, user_id=None, start_date=None, end_date=None):
+    """Add daily and hourly rollup rows for one metric computed from the raw table with INSERT ... SELECT"""
+    column = metric_column(model, metric)
+    day = day_column(model)
+    hour = hour_column(model)
+    aggregates = [func.count(column), func.sum(column), func.min(column), func.max(column)]
+    conditions = [model.user_id.isnot(None), column.isnot(None)] + day_range(model, start_date, end_date)
+    if user_id is not None:
+        conditions.append(model.user_id == user_id)
+
+    daily = select(model.user_id, literal(metric), day, *aggregates).where(*conditions)
+    hourly = select(model.user_id, literal(metric), day, hour, *aggregates).where(*conditions)
+    if hasattr(model, 'time'):
+        hourly = hourly.where(model.time.isnot(None))
+
+    db.session.execute(DailyRollup.__table__.insert().from_select(
+        ['user_id', 'metric', 'day', 'count', 'total', 'min_value', 'max_value'],
+        daily.group_by(model.user_id, day)
+    ))
+    db.session.execute(HourlyRollup.__table__.insert().from_select(
+        ['user_id', 'metric', 'day', 'hour', 'count', 'total', 'min_value', 'max_value'],
+        hourly.group_by(model.user_id, day, hour)
+    ))
+
+
+def delete_rollups(metrics, user_id=None, start_date=None, end_date=None):
+    """Delete daily and hourly rollup rows of the given metrics (caller commits)"""
+    for model in (DailyRollup, HourlyRollup):
+        stmt = model.__table__.delete().where(model.metric.in_(metrics))
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        if start_date is not None:
+            stmt = stmt.where(model.day >= start_date)
+        if end_date is not None:
+            stmt = stmt.where(model.day <= end_date)
+        db.session.execute(stmt)
+
+
+def rebuild(user_id=None, keep_before=None):
+    """
+    Recompute the rollups from the raw tables with INSERT ... SELECT ... GROUP BY
+    keep_before maps raw table names to a date: rollups of earlier days are
+    left as they are, since their raw rows may have been compacted away.
+    Returns: (daily rows, hourly rows) in the rollup tables afterwards
+    """
+    keep_before = keep_before or {}
+    for name, (model, metrics) in ROLLUP_SOURCES.items():
+        since = keep_before.get(name)
+        delete_rollups(metrics, user_id, since)
+        for metric in metrics:
+            insert_from_raw(model, metric, user_id, since)
+
+    db.session.commit()
+
+    counts = []
+    for model in (DailyRollup, HourlyRollup):
+        stmt = select(func.count()).select_from(model)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        counts.append(db.session.execute(stmt).scalar())
+    return tuple(counts)
+
+
+def _pivot(rows, key_fields):
+    """Turn one row per (bucket, metric) into one dict per bucket with '<metric>_<agg>' keys"""
+    buckets = {}
+    for row in rows:
+        key = tuple(getattr(row, field) for field in key_fields)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = dict(zip(['date'] + key_fields[1:], key))
+        metric = row.metric
+        bucket[f'{metric}_count'] = row.count
+        bucket[f'{metric}_sum'] = row.total
+        bucket[f'{metric}_min'] = row.min_value
+        bucket[f'{metric}_max'] = row.max_value
+        bucket[f'{metric}_avg'] = row.total / row.count if row.count else None
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def daily_rollups(metrics, user_id, start_date, end_date, prev_start_date=None):
+    """
+    Daily aggregates from the rollup table, from prev_start_date when given so the
+    previous period comes back in the same query
+    Returns: list of dicts ordered by date ('date' plus '<metric>_<max|min|avg|sum|count>')
+    """
+    lower = start_date if prev_start_date is None else min(prev_start_date, start_date)
+    rows = db.session.execute(
+        select(DailyRollup.day, DailyRollup.metric, DailyRollup.count, DailyRollup.total,
+               DailyRollup.min_value, DailyRollup.max_value)
+        .where(
+            DailyRollup.user_id == user_id,
+            DailyRollup.metric.in_(metrics),
+            DailyRollup.day >= lower,
+            DailyRollup.day <= end_date
+        )
+    ).all()
+    return _pivot(rows, ['day'])
+
+
+def hourly_rollups(metrics, user_id, start_date, end_date):
+    """
+    Hourly aggregates from the rollup table
+    Returns: list of dicts ordered by date and hour ('date', 'hour' plus '<metric>_<agg>')
+    """
+    rows = db.session.execute(
+        select(HourlyRollup.day, HourlyRollup.hour, HourlyRollup.metric, HourlyRollup.count,
+               HourlyRollup.total, HourlyRollup.min_value, HourlyRollup.max_value)
+        .where(
+            HourlyRollup.user_id == user_id,
+            HourlyRollup.metric.in_(metrics),
+            HourlyRollup.day >= start_date,
+            HourlyRollup.day <= end_date
+        )
+    ).all()
+    return _pivot(rows, ['day', 'hour'])
+
+
+def period_averages(metrics, user_id, start_date, end_date):
+    """
+    Average reading of each metric over a date range, summed in the database from the daily rollups
+    Returns: dict of metric -> average (0 when the range has no readings)
+    """
+    rows = db.session.execute(
+        select(DailyRollup.metric, func.sum(DailyRollup.count), func.sum(DailyRollup.total))
+        .where(
+            DailyRollup.user_id == user_id,
+            DailyRollup.metric.in_(metrics),
+            DailyRollup.day >= start_date,
+            DailyRollup.day <= end_date
+        )
+        .group_by(DailyRollup.metric)
+    ).all()
+    averages = dict.fromkeys(metrics, 0)
+    for metric, count, total in rows:
+        if count:
+            averages[metric] = float(total) / count
+    return averages
@@ -0,0 +1,177 @@
+"""
+Rolling statistics and percentiles for the analytics series
+Rolling series (moving average, EWMA, rolling min/max) are computed with
+pandas over the buckets timerange.series() returns, so any range costs one
+rollup read. Percentiles need the individual readings: up to
+STATISTICS_EXACT_MAX_ROWS of them are loaded and ranked exactly, longer
+histories are streamed in chunks into a QuantileSketch, whose memory use
+depends on the spread of the values, not on how many there are. Raw
+readings compacted away by the retention job are no longer counted.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from app import db
+from app.utils.rollups import ROLLUP_SOURCES, day_range, metric_column
+from config import STATISTICS_CHUNK_SIZE, STATISTICS_EXACT_MAX_ROWS, STATISTICS_SKETCH_ACCURACY
+
+# Percentiles reported for every series
+PERCENTILES = (50, 90, 99)
+
+# Metric -> raw table model it is read from
+METRIC_MODELS = {
+    metric: model for model, metrics in ROLLUP_SOURCES.values() for metric in metrics
+}
+
+# Magnitudes below this count as zero in the sketch
+SKETCH_MIN_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch with relative error (DDSketch)
+    Values are counted in logarithmic bins, gamma = (1 + a) / (1 - a) apart,
+    with separate bins for negative values and a counter for zeros; every
+    quantile it returns is within a fraction `relative_accuracy` (a) of a
+    value at that rank. add() bins a whole array at a time.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def _bin(self, store, magnitudes):
+        keys, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64),
+                                 return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def add(self, values):
+        """Count an array (or list) of values; NaN and None are skipped"""
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        self._bin(self.positive, values[values > SKETCH_MIN_VALUE])
+        self._bin(self.negative, -values[values < -SKETCH_MIN_VALUE])
+        self.zeros += int((np.abs(values) <= SKETCH_MIN_VALUE).sum())
+        self.count += len(values)
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        """Add another sketch's counts (both must use the same relative accuracy)"""
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def quantiles(self, qs):
+        """
+        Values at the given quantiles (0..1)
+        Returns: list of floats (None for an empty sketch)
+        """
+        if not self.count:
+            return [None for _ in qs]
+
+        # Bin representative values in ascending order with their counts
+        negative = sorted(self.negative, reverse=True)
+        positive = sorted(self.positive)
+        middle = 2 / (self.gamma + 1)
+        values = np.concatenate([
+            -middle * self.gamma ** np.array(negative, dtype=float),
+            [0.0] if self.zeros else [],
+            middle * self.gamma ** np.array(positive, dtype=float),
+        ])
+        counts = np.concatenate([
+            [self.negative[key] for key in negative],
+            [self.zeros] if self.zeros else [],
+            [self.positive[key] for key in positive],
+        ])
+        ranks = np.asarray(qs, dtype=float) * (self.count - 1)
+        positions = np.searchsorted(np.cumsum(counts), ranks, side='right')
+        return np.clip(values[positions], self.min, self.max).tolist()
+
+
+def percentiles(metric, user_id, start_date, end_date):
+    """
+    PERCENTILES of a metric's raw readings between two dates (inclusive)
+    Returns: dict with p50/p90/p99, count, method ('exact' or 'sketch') and
+    relative_accuracy (None when exact)
+    """
+    model = METRIC_MODELS[metric]
+    column = metric_column(model, metric)
+    conditions = [model.user_id == user_id, column.isnot(None), *day_range(model, start_date, end_date)]
+    count = db.session.execute(select(func.count(column)).where(*conditions)).scalar()
+
+    qs = [p / 100 for p in PERCENTILES]
+    if count <= STATISTICS_EXACT_MAX_ROWS:
+        values = np.array(db.session.execute(select(column).where(*conditions)).scalars().all(), dtype=float)
+        results = np.percentile(values, PERCENTILES).tolist() if len(values) else [None for _ in qs]
+        method, accuracy = 'exact', None
+    else:
+        sketch = QuantileSketch(STATISTICS_SKETCH_ACCURACY)
+        result = db.session.execute(
+            select(column).where(*conditions)
+            .execution_options(stream_results=True, yield_per=STATISTICS_CHUNK_SIZE)
+        )
+        for partition in result.partitions():
+            sketch.add([row[0] for row in partition])
+        results = sketch.quantiles(qs)
+        method, accuracy = 'sketch', STATISTICS_SKETCH_ACCURACY
+
+    report = {f'p{p}': None if value is None else round(value, 2) for p, value in zip(PERCENTILES, results)}
+    report.update({'count': count, 'method': method, 'relative_accuracy': accuracy})
+    return report
+
+
+def rolling_statistics(buckets, metric, window, span):
+    """
+    Rolling series of one metric over series() buckets
+    The moving average is weighted by readings (rolling sum / rolling count),
+    the EWMA runs over the bucket averages and the rolling min/max over the
+    bucket minima and maxima; windows are `window` buckets with data.
+    Returns: (dict of aligned lists: labels, mean, moving_average, ewma,
+    rolling_min, rolling_max; summary dict with count, mean, min and max)
+    """
+    frame = pd.DataFrame(
+        [(b['label'], b[f'{metric}_count'], b[f'{metric}_sum'], b[f'{metric}_min'], b[f'{metric}_max'])
+         for b in buckets if b.get(f'{metric}_count')],
+        columns=['label', 'count', 'sum', 'min', 'max']
+    )
+    frame[['count', 'sum', 'min', 'max']] = frame[['count', 'sum', 'min', 'max']].astype(float)
+    mean = frame['sum'] / frame['count']
+    rolled = frame[['count', 'sum']].rolling(window, min_periods=1).sum()
+
+    columns = {
+        'mean': mean,
+        'moving_average': rolled['sum'] / rolled['count'],
+        'ewma': mean.ewm(span=span, adjust=False).mean(),
+        'rolling_min': frame['min'].rolling(window, min_periods=1).min(),
+        'rolling_max': frame['max'].rolling(window, min_periods=1).max(),
+    }
+    result = {'labels': frame['label'].tolist()}
+    result.update({name: values.round(2).tolist() for name, values in columns.items()})
+
+    total = frame['count'].sum()
+    summary = {
+        'count': int(total),
+        'mean': round(float(frame['sum'].sum() / total), 2) if total else None,
+        'min': round(float(frame['min'].min()), 2) if total else None,
+        'max': round(float(frame['max'].max()), 2) if total else None,
+    }
+    return result, summary
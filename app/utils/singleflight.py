@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import UPSTREAM_LOCK_DIR, UPSTREAM_LOCK_TIMEOUT, UPSTREAM_SHARE_TTL
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one execution
+    Within a process, callers for a key that is already in flight wait for the
+    leader and share its result (or exception). When `lock_dir` is set, leaders
+    in different processes also serialize on a file lock and the first one
+    publishes its result for `share_ttl` seconds, so other workers reuse it
+    instead of repeating the upstream request. Shared results must be JSON.
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=15, share_ttl=5):
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self.share_ttl = share_ttl
+        self.executions = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(self.lock_timeout):
+                # Leader is stuck longer than we are willing to wait, go on our own
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _run(self, key, fn):
+        if not self.lock_dir:
+            self.executions += 1
+            return fn()
+
+        from filelock import FileLock, Timeout
+
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        lock_path = os.path.join(self.lock_dir, f"{name}.lock")
+        result_path = os.path.join(self.lock_dir, f"{name}.json")
+
+        try:
+            with FileLock(lock_path, timeout=self.lock_timeout):
+                shared = self._read_shared(result_path)
+                if shared is not None:
+                    return shared['value']
+
+                self.executions += 1
+                value = fn()
+                self._write_shared(result_path, value)
+                return value
+        except Timeout:
+            self.executions += 1
+            return fn()
+
+    def _read_shared(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.share_ttl:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_shared(self, path, value):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'value': value}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Single-flight could not share result: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'shared_across_workers': bool(self.lock_dir)
+            }
+
+
+upstream_flights = SingleFlight(
+    lock_dir=UPSTREAM_LOCK_DIR,
+    lock_timeout=UPSTREAM_LOCK_TIMEOUT,
+    share_ttl=UPSTREAM_SHARE_TTL
+)
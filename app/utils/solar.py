@@ -0,0 +1,153 @@
+"""
+Local solar position and sun event calculations
+Implements the NOAA solar calculator equations (accurate to about a minute
+between +/-72 degrees latitude), so sunrise, sunset, twilight and solar
+elevation need no network lookups. Functions accept NumPy arrays as well as
+plain floats.
+"""
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+import numpy as np
+
+from config import SOLAR_CELL_SIZE, SOLAR_CACHE_SIZE
+
+# Sun zenith angles (degrees) that define each event
+ZENITH_SUNRISE = 90.833  # includes refraction and the solar disc radius
+ZENITH_CIVIL = 96.0
+ZENITH_NAUTICAL = 102.0
+ZENITH_ASTRONOMICAL = 108.0
+
+UNIX_EPOCH_JD = 2440587.5
+J2000_JD = 2451545.0
+
+
+def _julian_century(jd):
+    return (jd - J2000_JD) / 36525.0
+
+
+def _sun_geometry(t):
+    """
+    Solar declination (degrees) and equation of time (minutes) for Julian century t
+    Returns: (declination, equation_of_time)
+    """
+    mean_long = np.mod(280.46646 + t * (36000.76983 + t * 0.0003032), 360.0)
+    mean_anom = 357.52911 + t * (35999.05029 - 0.0001537 * t)
+    eccent = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+
+    m = np.radians(mean_anom)
+    center = (np.sin(m) * (1.914602 - t * (0.004817 + 0.000014 * t))
+              + np.sin(2 * m) * (0.019993 - 0.000101 * t)
+              + np.sin(3 * m) * 0.000289)
+    true_long = mean_long + center
+    omega = np.radians(125.04 - 1934.136 * t)
+    app_long = true_long - 0.00569 - 0.00478 * np.sin(omega)
+
+    mean_obliq = 23.0 + (26.0 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60.0) / 60.0
+    obliq = np.radians(mean_obliq + 0.00256 * np.cos(omega))
+
+    declination = np.degrees(np.arcsin(np.sin(obliq) * np.sin(np.radians(app_long))))
+
+    y = np.tan(obliq / 2) ** 2
+    l0 = np.radians(mean_long)
+    eq_time = 4 * np.degrees(
+        y * np.sin(2 * l0)
+        - 2 * eccent * np.sin(m)
+        + 4 * eccent * y * np.sin(m) * np.cos(2 * l0)
+        - 0.5 * y * y * np.sin(4 * l0)
+        - 1.25 * eccent * eccent * np.sin(2 * m)
+    )
+    return declination, eq_time
+
+
+def solar_elevation(lat, lon, timestamp):
+    """
+    Solar elevation above the horizon in degrees (no refraction correction)
+    `timestamp` is a UNIX timestamp or array of them; lat/lon may be arrays too.
+    """
+    timestamp = np.asarray(timestamp, dtype=float)
+    lat_r = np.radians(np.asarray(lat, dtype=float))
+
+    jd = UNIX_EPOCH_JD + timestamp / 86400.0
+    declination, eq_time = _sun_geometry(_julian_century(jd))
+
+    minutes_utc = np.mod(timestamp, 86400.0) / 60.0
+    true_solar_time = np.mod(minutes_utc + eq_time + 4.0 * np.asarray(lon, dtype=float), 1440.0)
+    hour_angle = np.radians(true_solar_time / 4.0 - 180.0)
+
+    decl_r = np.radians(declination)
+    cos_zenith = np.sin(lat_r) * np.sin(decl_r) + np.cos(lat_r) * np.cos(decl_r) * np.cos(hour_angle)
+    return 90.0 - np.degrees(np.arccos(np.clip(cos_zenith, -1.0, 1.0)))
+
+
+def solar_zenith(lat, lon, timestamp):
+    """Solar zenith angle in degrees (90 minus the elevation)"""
+    return 90.0 - solar_elevation(lat, lon, timestamp)
+
+
+def _event_offsets(lat, declination, zenith):
+    """
+    Minutes between solar noon and the event at `zenith`
+    Returns: NaN where the sun never reaches that zenith (polar day or night)
+    """
+    lat_r = np.radians(lat)
+    decl_r = np.radians(declination)
+    cos_ha = (np.cos(np.radians(zenith)) / (np.cos(lat_r) * np.cos(decl_r))
+              - np.tan(lat_r) * np.tan(decl_r))
+    with np.errstate(invalid='ignore'):
+        return 4.0 * np.degrees(np.where(np.abs(cos_ha) <= 1.0, np.arccos(cos_ha), np.nan))
+
+
+def compute_sun_times(lat, lon, day):
+    """
+    Sun events for a calendar day at a location, as timezone-aware UTC datetimes
+    `day` is the local calendar date; events without a crossing are None.
+    Returns: dict of solar_noon, sunrise, sunset, civil/nautical/astronomical
+    dawn and dusk, and day_length in seconds
+    """
+    midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    jd = UNIX_EPOCH_JD + midnight.timestamp() / 86400.0
+
+    # Evaluate the geometry at the approximate local noon, then refine once
+    noon_minutes = 720.0 - 4.0 * lon
+    for _ in range(2):
+        declination, eq_time = _sun_geometry(_julian_century(jd + noon_minutes / 1440.0))
+        noon_minutes = 720.0 - 4.0 * lon - float(eq_time)
+
+    def at(minutes):
+        if minutes is None or np.isnan(minutes):
+            return None
+        return midnight + timedelta(minutes=float(minutes))
+
+    zeniths = {
+        '': ZENITH_SUNRISE,
+        'civil_': ZENITH_CIVIL,
+        'nautical_': ZENITH_NAUTICAL,
+        'astronomical_': ZENITH_ASTRONOMICAL,
+    }
+    offsets = _event_offsets(lat, declination, np.array(list(zeniths.values())))
+
+    times = {'solar_noon': at(noon_minutes)}
+    for (prefix, _), offset in zip(zeniths.items(), offsets):
+        rise, set_ = ('sunrise', 'sunset') if prefix == '' else (f'{prefix}dawn', f'{prefix}dusk')
+        times[rise] = at(noon_minutes - offset)
+        times[set_] = at(noon_minutes + offset)
+
+    if times['sunrise'] and times['sunset']:
+        times['day_length'] = int((times['sunset'] - times['sunrise']).total_seconds())
+    else:
+        # Polar day (sun always up) or polar night
+        times['day_length'] = 86400 if float(solar_elevation(lat, lon, times['solar_noon'].timestamp())) > 0 else 0
+    return times
+
+
+@lru_cache(maxsize=SOLAR_CACHE_SIZE)
+def _sun_times_for_cell(cell_lat, cell_lon, day):
+    return compute_sun_times(cell_lat * SOLAR_CELL_SIZE, cell_lon * SOLAR_CELL_SIZE, day)
+
+
+def get_sun_times(lat, lon, day):
+    """Sun events for a location and date, memoized per (grid cell, date)"""
+    cell_lat = round(float(lat) / SOLAR_CELL_SIZE)
+    cell_lon = round(float(lon) / SOLAR_CELL_SIZE)
+    return dict(_sun_times_for_cell(cell_lat, cell_lon, day))
@@ -0,0 +1,214 @@
+"""
+Time ranges and adaptive resolution for the analytics endpoints
+A range comes from a preset (`timeframe=week`, `timeframe=year`, ...) or from
+explicit `start`/`end` dates. The bucket size follows the span - raw
+readings for a day, hourly for up to two weeks, daily for up to a year, then
+weekly and monthly - and each bucket size reads from the coarsest table that
+can serve it: hourly and daily rollups, with weeks and months merged from the
+daily rollups, so even a multi-year range reads one row per metric and day.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select
+
+from app import db
+from app.utils.rollups import ROLLUP_SOURCES, daily_rollups, day_range, hourly_rollups, metric_column
+
+# Preset name -> days before today the range starts
+PRESETS = {
+    'day': 0,
+    'week': 7,
+    'month': 30,
+    'quarter': 90,
+    'year': 365,
+    '2y': 730,
+    '5y': 1825,
+}
+
+RESOLUTIONS = ('raw', 'hourly', 'daily', 'weekly', 'monthly')
+
+# Longest span (in days, both ends included) each resolution is picked for automatically
+AUTO_MAX_DAYS = {'raw': 1, 'hourly': 14, 'daily': 366, 'weekly': 1096}
+
+# Longest span a client may ask for explicitly at the fine resolutions
+REQUEST_MAX_DAYS = {'raw': 7, 'hourly': 92}
+
+# Longest range accepted at all
+MAX_RANGE_DAYS = 3660
+
+
+class TimeRange:
+    """Inclusive date range with the bucket size used to read it"""
+
+    def __init__(self, start, end, resolution, preset=None):
+        self.start = start
+        self.end = end
+        self.resolution = resolution
+        self.preset = preset
+
+    @property
+    def days(self):
+        return (self.end - self.start).days + 1
+
+    def to_dict(self):
+        return {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'resolution': self.resolution,
+            'preset': self.preset
+        }
+
+
+def auto_resolution(days):
+    """Finest resolution that keeps a span of `days` days to a chartable number of buckets"""
+    for resolution in RESOLUTIONS[:-1]:
+        if days <= AUTO_MAX_DAYS[resolution]:
+            return resolution
+    return 'monthly'
+
+
+def parse_range(args, default='day', today=None):
+    """
+    Time range from query parameters: `start` and optional `end` (YYYY-MM-DD,
+    end defaults to today) or a `timeframe` preset, plus an optional
+    `resolution` that overrides the automatic bucket size
+    Raises ValueError with a message for the client on invalid input.
+    Returns: TimeRange
+    """
+    today = today or date.today()
+    preset = None
+
+    if args.get('start'):
+        try:
+            start = date.fromisoformat(args['start'])
+            end = date.fromisoformat(args['end']) if args.get('end') else today
+        except ValueError:
+            raise ValueError('start and end must be dates in YYYY-MM-DD format')
+        if start > end:
+            raise ValueError('start must not be after end')
+    else:
+        preset = args.get('timeframe') or default
+        if preset not in PRESETS:
+            raise ValueError(f"Invalid timeframe, expected one of: {', '.join(PRESETS)}")
+        start, end = today - timedelta(days=PRESETS[preset]), today
+
+    days = (end - start).days + 1
+    if days > MAX_RANGE_DAYS:
+        raise ValueError(f'Ranges are limited to {MAX_RANGE_DAYS} days')
+
+    resolution = args.get('resolution') or auto_resolution(days)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Invalid resolution, expected one of: {', '.join(RESOLUTIONS)}")
+    if days > REQUEST_MAX_DAYS.get(resolution, MAX_RANGE_DAYS):
+        raise ValueError(f'{resolution} resolution is limited to {REQUEST_MAX_DAYS[resolution]} days')
+
+    return TimeRange(start, end, resolution, preset)
+
+
+def previous_range(time_range):
+    """The range of the same length that ends the day before time_range starts"""
+    length = timedelta(days=time_range.days)
+    return TimeRange(time_range.start - length, time_range.start - timedelta(days=1),
+                     time_range.resolution)
+
+
+def _raw_readings(metrics, user_id, start_date, end_date):
+    """Individual readings in the rollup shape (count 1, every aggregate equal to the value)"""
+    buckets = {}
+    for model, table_metrics in ROLLUP_SOURCES.values():
+        wanted = [metric for metric in table_metrics if metric in metrics]
+        if not wanted:
+            continue
+        if hasattr(model, 'recorded_at'):
+            when = [model.recorded_at]
+        else:
+            when = [model.date, model.time]
+        rows = db.session.execute(
+            select(*when, *[metric_column(model, metric).label(metric) for metric in wanted])
+            .where(model.user_id == user_id, *day_range(model, start_date, end_date))
+            .order_by(*when)
+        ).all()
+        for row in rows:
+            if hasattr(model, 'recorded_at'):
+                at = row.recorded_at
+            else:
+                at = datetime.combine(row.date, row.time or time())
+            bucket = buckets.setdefault(at, {'start': at})
+            for metric in wanted:
+                value = getattr(row, metric)
+                if value is None:
+                    continue
+                bucket.update({
+                    f'{metric}_count': 1, f'{metric}_sum': value, f'{metric}_avg': value,
+                    f'{metric}_min': value, f'{metric}_max': value
+                })
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def _merge_days(rows, metrics, bucket_start):
+    """Combine daily rollup rows into coarser buckets keyed by bucket_start(day)"""
+    buckets = {}
+    for row in rows:
+        key = bucket_start(row['date'])
+        bucket = buckets.setdefault(key, {'start': datetime.combine(key, time())})
+        for metric in metrics:
+            count = row.get(f'{metric}_count')
+            if not count:
+                continue
+            if f'{metric}_count' not in bucket:
+                bucket.update({
+                    f'{metric}_count': 0, f'{metric}_sum': 0.0,
+                    f'{metric}_min': row[f'{metric}_min'], f'{metric}_max': row[f'{metric}_max']
+                })
+            bucket[f'{metric}_count'] += count
+            bucket[f'{metric}_sum'] += row[f'{metric}_sum']
+            bucket[f'{metric}_min'] = min(bucket[f'{metric}_min'], row[f'{metric}_min'])
+            bucket[f'{metric}_max'] = max(bucket[f'{metric}_max'], row[f'{metric}_max'])
+
+    for bucket in buckets.values():
+        for metric in metrics:
+            if bucket.get(f'{metric}_count'):
+                bucket[f'{metric}_avg'] = bucket[f'{metric}_sum'] / bucket[f'{metric}_count']
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def bucket_label(start, resolution):
+    """Label of the bucket starting at `start` (a datetime) at a resolution"""
+    if resolution == 'raw':
+        return start.strftime('%Y-%m-%dT%H:%M')
+    if resolution == 'hourly':
+        return start.strftime('%Y-%m-%dT%H:00')
+    if resolution == 'monthly':
+        return start.strftime('%Y-%m')
+    return start.strftime('%Y-%m-%d')
+
+
+def series(metrics, user_id, time_range):
+    """
+    Aggregated readings over a range at its resolution
+    Weekly buckets start on Monday and monthly buckets on the 1st; the first
+    and last bucket only cover the part inside the range.
+    Returns: list of dicts ordered by time with 'start' (datetime), 'label'
+    and '<metric>_<count|sum|avg|min|max>' keys
+    """
+    resolution = time_range.resolution
+    if resolution == 'raw':
+        buckets = _raw_readings(metrics, user_id, time_range.start, time_range.end)
+    elif resolution == 'hourly':
+        buckets = hourly_rollups(metrics, user_id, time_range.start, time_range.end)
+        for bucket in buckets:
+            bucket['start'] = datetime.combine(bucket['date'], time(bucket['hour']))
+    else:
+        rows = daily_rollups(metrics, user_id, time_range.start, time_range.end)
+        if resolution == 'daily':
+            buckets = rows
+            for bucket in buckets:
+                bucket['start'] = datetime.combine(bucket['date'], time())
+        elif resolution == 'weekly':
+            buckets = _merge_days(rows, metrics, lambda day: day - timedelta(days=day.weekday()))
+        else:
+            buckets = _merge_days(rows, metrics, lambda day: day.replace(day=1))
+
+    for bucket in buckets:
+        bucket['label'] = bucket_label(bucket['start'], resolution)
+    return buckets
@@ -0,0 +1,160 @@
+"""
+Environmental trends: the user's logged carbon footprint against the weather
+The weather buckets of a range (from timerange.series) and the user's
+CarbonLog entries, summed into the same buckets, are joined into one
+pandas frame, and every series is computed on whole columns: a linear model
+of each footprint on temperature and humidity, fitted by least squares on
+the buckets with a log, fills the buckets without one; then come rolling
+means, bucket-to-bucket deltas and a linear trend over time. Nothing is
+random, so the same readings and logs always give the same response.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from app import db
+from app.models import CarbonLog
+from app.utils.timerange import bucket_label
+
+# Buckets averaged by the rolling series
+ROLLING_WINDOW = 7
+
+# Logged buckets (with weather) needed before a user's own model replaces the default one
+MIN_FIT_POINTS = 3
+
+# Footprint at 20 °C and 50 % humidity, and its change per °C and per % humidity, used to
+# estimate buckets for users with no carbon logs yet
+DEFAULT_MODELS = {
+    'carbon': (150.0, 0.5, 0.1),
+    'energy': (200.0, 0.7, 0.2),
+}
+
+METRICS = tuple(DEFAULT_MODELS)
+
+
+def carbon_frame(user_id, start_date, end_date):
+    """
+    A user's carbon logs between two dates (inclusive)
+    Returns: DataFrame with logged_at, carbon (transport + food + energy) and energy columns
+    """
+    rows = db.session.execute(
+        select(CarbonLog.logged_at, CarbonLog.transport, CarbonLog.food, CarbonLog.energy)
+        .where(CarbonLog.user_id == user_id,
+               CarbonLog.logged_at >= datetime.combine(start_date, time()),
+               CarbonLog.logged_at < datetime.combine(end_date + timedelta(days=1), time()))
+        .order_by(CarbonLog.logged_at)
+    ).all()
+    frame = pd.DataFrame(rows, columns=['logged_at', 'transport', 'food', 'energy'])
+    parts = frame[['transport', 'food', 'energy']].astype(float).fillna(0.0)
+    return pd.DataFrame({
+        'logged_at': pd.to_datetime(frame['logged_at']),
+        'carbon': parts.sum(axis=1),
+        'energy': parts['energy']
+    })
+
+
+def bucket_starts(times, resolution):
+    """Start of the timerange bucket each timestamp of a Series falls in"""
+    if resolution == 'raw':
+        return times.dt.floor('min')
+    if resolution == 'hourly':
+        return times.dt.floor('h')
+    days = times.dt.normalize()
+    if resolution == 'weekly':
+        return days - pd.to_timedelta(days.dt.weekday, unit='D')
+    if resolution == 'monthly':
+        return days - pd.to_timedelta(days.dt.day - 1, unit='D')
+    return days
+
+
+def fit_model(values, temperature, humidity, default):
+    """
+    Least-squares fit of values = intercept + a * (temperature - 20) + b * (humidity - 50)
+    over the buckets where all three are known. Below MIN_FIT_POINTS buckets the
+    logged mean (or the default model if nothing is logged) is used instead.
+    Returns: ((intercept, a, b), fitted)
+    """
+    known = np.isfinite(values) & np.isfinite(temperature) & np.isfinite(humidity)
+    if known.sum() >= MIN_FIT_POINTS:
+        design = np.column_stack([np.ones(known.sum()), temperature[known] - 20, humidity[known] - 50])
+        coefficients = np.linalg.lstsq(design, values[known], rcond=None)[0]
+        return tuple(float(c) for c in coefficients), True
+    logged = values[np.isfinite(values)]
+    if len(logged):
+        return (float(logged.mean()), 0.0, 0.0), False
+    return default, False
+
+
+def linear_trend(days, values):
+    """
+    Straight-line fit of values over time
+    Returns: dict with slope_per_day, change_pct (fitted first to last bucket) and r2, or None
+    """
+    known = np.isfinite(values)
+    if known.sum() < 2 or np.ptp(days[known]) == 0:
+        return None
+    slope, intercept = np.polyfit(days[known], values[known], 1)
+    fitted = slope * days[known] + intercept
+    residual = ((values[known] - fitted) ** 2).sum()
+    total = ((values[known] - values[known].mean()) ** 2).sum()
+    first, last = fitted[0], fitted[-1]
+    # + 0.0 turns the -0.0 that rounding a tiny negative gives into 0.0
+    return {
+        'slope_per_day': round(float(slope), 3) + 0.0,
+        'change_pct': round(float((last - first) / first * 100), 1) + 0.0 if first else None,
+        'r2': round(float(1 - residual / total), 3) if total else 1.0
+    }
+
+
+def _rounded(values):
+    return [None if np.isnan(value) else round(float(value), 1) for value in values]
+
+
+def environmental_trends(buckets, carbon, resolution):
+    """
+    Footprint series on the buckets of a range
+    buckets are timerange.series() buckets with temperature and humidity;
+    carbon is a carbon_frame() for the same range.
+    Returns: dict of aligned lists (dates, carbon_values, energy_values, their
+    _rolling and _delta series, and estimated: True where no log exists) plus
+    the per-metric trend and model
+    """
+    weather = pd.DataFrame(
+        [(b['start'], b['temperature_avg'], b['humidity_avg']) for b in buckets
+         if b.get('temperature_count') and b.get('humidity_count')],
+        columns=['start', 'temperature', 'humidity']
+    ).set_index('start')
+    weather.index = pd.to_datetime(weather.index)
+    logged = carbon.groupby(bucket_starts(carbon['logged_at'], resolution))[list(METRICS)].sum()
+    frame = weather.join(logged, how='outer').sort_index()
+
+    temperature = frame['temperature'].to_numpy(dtype=float)
+    humidity = frame['humidity'].to_numpy(dtype=float)
+    days = ((frame.index - frame.index[0]) / pd.Timedelta(days=1)).to_numpy(dtype=float) if len(frame) else np.array([])
+
+    result = {
+        'dates': [bucket_label(start, resolution) for start in frame.index],
+        'estimated': (~frame[list(METRICS)].notna().any(axis=1)).tolist(),
+        'trend': {},
+        'model': {}
+    }
+    for metric in METRICS:
+        values = frame[metric].to_numpy(dtype=float)
+        (intercept, per_degree, per_percent), fitted = fit_model(values, temperature, humidity, DEFAULT_MODELS[metric])
+        estimate = intercept + per_degree * (temperature - 20) + per_percent * (humidity - 50)
+        values = np.maximum(np.where(np.isnan(values), estimate, values), 0)
+
+        series = pd.Series(values)
+        result[f'{metric}_values'] = _rounded(values)
+        result[f'{metric}_rolling'] = _rounded(series.rolling(ROLLING_WINDOW, min_periods=1).mean().to_numpy())
+        result[f'{metric}_delta'] = _rounded(series.diff().to_numpy())
+        result['trend'][metric] = linear_trend(days, values)
+        result['model'][metric] = {
+            'intercept': round(intercept, 3),
+            'per_degree': round(per_degree, 3),
+            'per_percent_humidity': round(per_percent, 3),
+            'fitted': fitted
+        }
+    return result
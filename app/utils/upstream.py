@@ -0,0 +1,102 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_FACTOR,
+    UPSTREAM_BACKOFF_JITTER,
+    UPSTREAM_POOL_MAXSIZE,
+    UPSTREAM_PROVIDERS,
+)
+
+# Status codes worth retrying; anything else is returned to the caller as-is
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class UpstreamError(Exception):
+    """Raised when a provider answers with a non-success status"""
+
+    def __init__(self, provider, status_code, details=None, message=None):
+        super().__init__(message or f"{provider} API error: {status_code}")
+        self.provider = provider
+        self.status_code = status_code
+        self.details = details
+
+
+def provider_settings(provider):
+    """
+    Resolve the effective settings for a provider
+    Returns: dict with base_url, timeouts, retry and pool settings
+    """
+    if provider not in UPSTREAM_PROVIDERS:
+        raise KeyError(f"Unknown upstream provider: {provider}")
+
+    settings = {
+        'connect_timeout': UPSTREAM_CONNECT_TIMEOUT,
+        'read_timeout': UPSTREAM_READ_TIMEOUT,
+        'max_retries': UPSTREAM_MAX_RETRIES,
+        'backoff_factor': UPSTREAM_BACKOFF_FACTOR,
+        'backoff_jitter': UPSTREAM_BACKOFF_JITTER,
+        'pool_maxsize': UPSTREAM_POOL_MAXSIZE,
+    }
+    settings.update(UPSTREAM_PROVIDERS[provider])
+    return settings
+
+
+def _build_session(settings):
+    retry = Retry(
+        total=settings['max_retries'],
+        backoff_factor=settings['backoff_factor'],
+        backoff_jitter=settings['backoff_jitter'],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    # One host per provider, so a single pool per session is enough
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings['pool_maxsize'],
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider):
+    """Return the pooled keep-alive session for a provider, creating it on first use"""
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                session = _build_session(provider_settings(provider))
+                _sessions[provider] = session
+    return session
+
+
+def get(provider, path, params=None, headers=None, timeout=None):
+    """
+    Issue a GET against an upstream provider through its pooled session
+    `path` is appended to the provider's base_url unless it is already absolute.
+    Returns: requests.Response (raises requests.RequestException on network failure)
+    """
+    settings = provider_settings(provider)
+    url = path if path.startswith('http') else settings['base_url'] + path
+
+    if timeout is None:
+        timeout = (settings['connect_timeout'], settings['read_timeout'])
+
+    return get_session(provider).get(url, params=params, headers=headers, timeout=timeout)
+
@@ -0,0 +1,49 @@
+"""
+Offline UV index estimate from sun geometry
+Clear-sky UV index follows the parameterisation UVI = 12.5 * mu0^2.42 * (O3/300)^-1.23
+(Madronich), scaled for Earth-Sun distance, altitude (+8% per km) and cloud
+cover (Kasten-Czeplak style attenuation). Works on floats or NumPy arrays.
+"""
+import time
+
+import numpy as np
+
+from app.utils.solar import solar_zenith
+
+# Column ozone (Dobson units) assumed when no measurement is available
+DEFAULT_OZONE_DU = 300.0
+ALTITUDE_GAIN_PER_KM = 0.08
+
+
+def _earth_sun_factor(timestamp):
+    day_of_year = np.floor(np.mod(np.asarray(timestamp, dtype=float) / 86400.0, 365.25))
+    return 1.0 + 0.034 * np.cos(2.0 * np.pi * (day_of_year - 3.0) / 365.25)
+
+
+def cloud_modification_factor(cloud_cover):
+    """Fraction of clear-sky UV reaching the ground for a cloud cover percentage"""
+    fraction = np.clip(np.asarray(cloud_cover, dtype=float) / 100.0, 0.0, 1.0)
+    return 1.0 - 0.75 * fraction ** 3.4
+
+
+def estimate_uv_index(lat, lon, timestamp=None, altitude_m=0.0, cloud_cover=None, ozone_du=DEFAULT_OZONE_DU):
+    """
+    Estimated UV index at a location and time (defaults to now)
+    cloud_cover is a percentage (0-100); None means clear sky.
+    Returns: float, or an array when any argument is an array
+    """
+    if timestamp is None:
+        timestamp = time.time()
+
+    zenith = np.radians(solar_zenith(lat, lon, timestamp))
+    mu0 = np.clip(np.cos(zenith), 0.0, None)
+
+    uvi = 12.5 * mu0 ** 2.42 * (np.asarray(ozone_du, dtype=float) / 300.0) ** -1.23
+    uvi = uvi * _earth_sun_factor(timestamp)
+    uvi = uvi * (1.0 + ALTITUDE_GAIN_PER_KM * np.asarray(altitude_m, dtype=float) / 1000.0)
+
+    if cloud_cover is not None:
+        uvi = uvi * cloud_modification_factor(cloud_cover)
+
+    uvi = np.round(uvi, 1)
+    return float(uvi) if np.ndim(uvi) == 0 else uvi
@@ -0,0 +1,142 @@
+from app.utils import upstream
+from app.utils.geo_cache import GeoCache
+from app.utils.refresher import HotCellRefresher
+from app.utils.singleflight import upstream_flights
+from app.utils.upstream import UpstreamError
+from config import (
+    OPENWEATHER_API_KEY,
+    WEATHER_CACHE_CELL_SIZE,
+    WEATHER_CACHE_TTL,
+    WEATHER_CACHE_MAX_ENTRIES,
+    WEATHER_CACHE_MAX_STALE,
+    WEATHER_REFRESH_ENABLED,
+    WEATHER_REFRESH_INTERVAL,
+    WEATHER_REFRESH_LEAD,
+    WEATHER_REFRESH_TOP_N,
+    WEATHER_REFRESH_WORKERS,
+)
+
+weather_cache = GeoCache(
+    cell_size=WEATHER_CACHE_CELL_SIZE,
+    ttl=WEATHER_CACHE_TTL,
+    max_entries=WEATHER_CACHE_MAX_ENTRIES,
+    max_stale=WEATHER_CACHE_MAX_STALE
+)
+
+
+def _response_json(response):
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def _request_openweather_current(lat, lon):
+    response = upstream.get('openweather', '/data/2.5/weather', params={
+        'lat': lat,
+        'lon': lon,
+        'appid': OPENWEATHER_API_KEY,
+        'units': 'metric'
+    })
+    if response.status_code != 200:
+        raise UpstreamError('openweather', response.status_code, _response_json(response))
+    return response.json()
+
+
+def _request_weatherapi_current(lat, lon):
+    response = upstream.get('weatherapi', '/v1/current.json', params={
+        'key': OPENWEATHER_API_KEY,
+        'q': f"{lat},{lon}",
+        'aqi': 'yes'
+    })
+    if response.status_code != 200:
+        raise UpstreamError('weatherapi', response.status_code, _response_json(response))
+    return response.json()
+
+
+def cell_key(provider, lat, lon):
+    """Stable string key for a provider and grid cell, shared by cache and single-flight"""
+    return ':'.join(str(part) for part in weather_cache.key(provider, lat, lon))
+
+
+# Upstream request function per cached provider
+REQUESTERS = {
+    'openweather': _request_openweather_current,
+    'weatherapi': _request_weatherapi_current,
+}
+
+
+def _fetch_and_store(provider, lat, lon):
+    # Concurrent fetches for the same cell share one upstream request
+    request_fn = REQUESTERS[provider]
+    data = upstream_flights.do(cell_key(provider, lat, lon), lambda: request_fn(lat, lon))
+    weather_cache.set(provider, lat, lon, data)
+    return data
+
+
+weather_refresher = HotCellRefresher(
+    weather_cache,
+    _fetch_and_store,
+    interval=WEATHER_REFRESH_INTERVAL,
+    lead_time=WEATHER_REFRESH_LEAD,
+    top_n=WEATHER_REFRESH_TOP_N,
+    workers=WEATHER_REFRESH_WORKERS,
+    enabled=WEATHER_REFRESH_ENABLED
+)
+
+
+def _fetch_cached(provider, lat, lon):
+    weather_refresher.track(provider, lat, lon)
+
+    cached, fresh = weather_cache.lookup(provider, lat, lon)
+    if cached is not None:
+        if not fresh:
+            # Stale-while-revalidate: answer now, refresh in the background
+            weather_refresher.refresh_async(provider, lat, lon)
+        return cached
+
+    return _fetch_and_store(provider, lat, lon)
+
+
+def fetch_openweather_current(lat, lon):
+    """
+    Current weather from OpenWeather, served from the grid cache when possible
+    Entries past their TTL (up to WEATHER_CACHE_MAX_STALE) are returned at once
+    and refreshed in the background.
+    Returns: OpenWeather JSON payload (raises UpstreamError on a non-200 answer)
+    """
+    return _fetch_cached('openweather', lat, lon)
+
+
+def fetch_weatherapi_current(lat, lon):
+    """
+    Current weather (with air quality) from WeatherAPI.com, cached like OpenWeather
+    Returns: WeatherAPI JSON payload (raises UpstreamError on a non-200 answer)
+    """
+    return _fetch_cached('weatherapi', lat, lon)
+
+
+def get_current_weather(lat, lon):
+    """
+    Current weather from OpenWeather, falling back to WeatherAPI.com
+    Returns: (source, payload) where source is 'openweather' or 'weatherapi'
+    """
+    try:
+        return 'openweather', fetch_openweather_current(lat, lon)
+    except UpstreamError:
+        return 'weatherapi', fetch_weatherapi_current(lat, lon)
+
+
+def cached_cloud_cover(lat, lon):
+    """
+    Cloud cover percentage for a cell from the weather cache, without any network call
+    Returns: float, or None if neither provider has a fresh entry for the cell
+    """
+    openweather = weather_cache.get('openweather', lat, lon)
+    if openweather is not None:
+        return openweather.get('clouds', {}).get('all')
+
+    weatherapi = weather_cache.get('weatherapi', lat, lon)
+    if weatherapi is not None:
+        return weatherapi.get('current', {}).get('cloud')
+    return None
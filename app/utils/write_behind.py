@@ -0,0 +1,251 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app import db
+from config import (
+    WRITE_BEHIND_DEAD_LETTER, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_ATTEMPTS, WRITE_BEHIND_MAX_QUEUE,
+    WRITE_BEHIND_MAX_ROWS,
+)
+
+
+class WriteBehindBuffer:
+    """
+    Queues inserts from request handlers and writes them in batches
+    Rows are grouped by table and written with one multi-row INSERT per table
+    in a single transaction, from a background thread, once `max_rows` rows
+    are queued or `flush_interval` seconds have passed. Whatever is still
+    queued is flushed when the process exits. Column defaults are applied at
+    flush time, so callers should pass timestamps explicitly. Flush listeners
+    run inside the same transaction, after the inserts, or once it has
+    committed when registered with after_commit=True.
+
+    A failed write is narrowed down to the table, then the rows, that cause
+    it, so one bad row (a deleted user, a value the column rejects, a
+    listener that fails on it) does not hold back everyone else's readings.
+    After max_attempts such flushes a row is appended to a JSON-lines
+    dead-letter file instead of being queued again.
+    """
+
+    def __init__(self, max_rows=200, flush_interval=2.0, max_queue=10000, max_attempts=5, dead_letter_path=None):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self.app = None
+        self.queued = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.failed_rows = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = None
+        self._rows = []
+        self._listeners = []
+        self._commit_listeners = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    def add_flush_listener(self, fn, after_commit=False):
+        """Call fn(rows) with every flushed batch of (table, values) pairs before it commits (or after)"""
+        if after_commit:
+            self._commit_listeners.append(fn)
+        else:
+            self._listeners.append(fn)
+
+    def add(self, model, **values):
+        """Queue one row for `model`'s table; returns without touching the database"""
+        with self._lock:
+            self._rows.append((model.__table__, values, 0))
+            self.queued += 1
+            overflow = len(self._rows) - self.max_queue
+            if overflow > 0:
+                # The database has been unreachable for a while; keep the newest rows
+                del self._rows[:overflow]
+                self.dropped += overflow
+            pending = len(self._rows)
+
+        if self._thread is None:
+            self._start()
+        if pending >= self.max_rows:
+            self._wakeup.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _write(self, entries):
+        """Insert entries and run the flush listeners inside a savepoint; raises if anything fails"""
+        with db.session.begin_nested():
+            # executemany needs the same columns in every row of a statement
+            batches = OrderedDict()
+            for table, values, _ in entries:
+                batches.setdefault((table, tuple(sorted(values))), []).append(values)
+            for (table, _), batch in batches.items():
+                db.session.execute(table.insert(), batch)
+            rows = [(table, values) for table, values, _ in entries]
+            for listener in self._listeners:
+                listener(rows)
+
+    def _write_isolating(self, entries):
+        """
+        Write entries, narrowing a failure down to the rows that cause it:
+        everything at once, then one table at a time, then row by row
+        Returns: list of (entry, error) that could not be written
+        """
+        try:
+            self._write(entries)
+            return []
+        except Exception:
+            if not self._database_reachable():
+                raise
+
+        failed = []
+        by_table = OrderedDict()
+        for entry in entries:
+            by_table.setdefault(entry[0], []).append(entry)
+        for table_entries in by_table.values():
+            try:
+                self._write(table_entries)
+                continue
+            except Exception:
+                pass
+            for entry in table_entries:
+                try:
+                    self._write([entry])
+                except Exception as e:
+                    failed.append((entry, e))
+        return failed
+
+    def _database_reachable(self):
+        try:
+            db.session.execute(text('SELECT 1'))
+            return True
+        except Exception:
+            return False
+
+    def _retry_or_dead_letter(self, failed):
+        """Queue failed rows again, or append them to the dead-letter file once out of attempts"""
+        retry = []
+        dead = []
+        for (table, values, attempts), error in failed:
+            if attempts + 1 >= self.max_attempts:
+                dead.append({
+                    'table': table.name, 'values': values, 'attempts': attempts + 1,
+                    'error': str(error), 'failed_at': datetime.utcnow().isoformat()
+                })
+            else:
+                retry.append((table, values, attempts + 1))
+
+        with self._lock:
+            # Put the rows back in front so they are retried on the next flush
+            self._rows[:0] = retry
+            self.dead_lettered += len(dead)
+        if dead and not self.dead_letter_path:
+            print(f"Write-behind dropped {len(dead)} rows after {self.max_attempts} attempts")
+        elif dead:
+            try:
+                os.makedirs(os.path.dirname(self.dead_letter_path), exist_ok=True)
+                with open(self.dead_letter_path, 'a') as f:
+                    for record in dead:
+                        f.write(json.dumps(record, default=str) + '\n')
+                print(f"Write-behind gave up on {len(dead)} rows, written to {self.dead_letter_path}")
+            except OSError as e:
+                print(f"Write-behind dropped {len(dead)} rows, dead-letter file not writable: {str(e)}")
+
+    def flush(self):
+        """
+        Write every queued row now
+        A row that fails is retried on later flushes and dead-lettered after
+        max_attempts; rows that fail while the database is unreachable are
+        kept without using up their attempts.
+        Returns: number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                entries, self._rows = self._rows, []
+            if not entries or self.app is None:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    failed = self._write_isolating(entries)
+                    db.session.commit()
+            except Exception as e:
+                with self.app.app_context():
+                    db.session.rollback()
+                with self._lock:
+                    # The database is unreachable: keep every row, attempts untouched
+                    self._rows[:0] = entries
+                    self.failed_flushes += 1
+                print(f"Write-behind flush failed, {len(entries)} rows kept for retry: {str(e)}")
+                return 0
+
+            if failed:
+                self.failed_flushes += 1
+                self.failed_rows += len(failed)
+                print(f"Write-behind could not write {len(failed)} of {len(entries)} rows: {str(failed[0][1])}")
+                self._retry_or_dead_letter(failed)
+                failed_ids = {id(entry) for entry, _ in failed}
+                entries = [entry for entry in entries if id(entry) not in failed_ids]
+
+            rows = [(table, values) for table, values, _ in entries]
+            for listener in self._commit_listeners:
+                try:
+                    listener(rows)
+                except Exception as e:
+                    print(f"Write-behind commit listener failed: {str(e)}")
+
+            self.flushes += 1
+            self.written += len(rows)
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._rows),
+                'queued': self.queued,
+                'written': self.written,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+                'dropped': self.dropped,
+                'failed_rows': self.failed_rows,
+                'dead_lettered': self.dead_lettered,
+                'last_flush_ms': self.last_flush_ms,
+                'max_rows': self.max_rows,
+                'flush_interval': self.flush_interval
+            }
+
+
+analytics_writer = WriteBehindBuffer(
+    max_rows=WRITE_BEHIND_MAX_ROWS,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+    max_queue=WRITE_BEHIND_MAX_QUEUE,
+    max_attempts=WRITE_BEHIND_MAX_ATTEMPTS,
+    dead_letter_path=WRITE_BEHIND_DEAD_LETTER
+)
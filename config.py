@@ -14,4 +14,119 @@ SESSION_COOKIE_SECURE = True
 SESSION_COOKIE_SAMESITE = "Lax"
 CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
-CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
\ No newline at end of file
+CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
+
+# Upstream HTTP client (timeouts in seconds)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "8"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_FACTOR = float(os.getenv("UPSTREAM_BACKOFF_FACTOR", "0.3"))
+UPSTREAM_BACKOFF_JITTER = float(os.getenv("UPSTREAM_BACKOFF_JITTER", "0.2"))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "10"))
+
+# Per-provider overrides on top of the defaults above
+UPSTREAM_PROVIDERS = {
+    "openweather": {
+        "base_url": "https://api.openweathermap.org",
+    },
+    "weatherapi": {
+        "base_url": "https://api.weatherapi.com",
+    },
+    "openuv": {
+        "base_url": "https://api.openuv.io",
+        "read_timeout": float(os.getenv("OPENUV_READ_TIMEOUT", "6")),
+        # Key and quota errors (401/403/429) are final and rotate to the next key, only retry transient failures
+        "max_retries": int(os.getenv("OPENUV_MAX_RETRIES", "1")),
+    },
+}
+
+# Current-weather cache, keyed by provider and a lat/lon grid cell (degrees)
+WEATHER_CACHE_CELL_SIZE = float(os.getenv("WEATHER_CACHE_CELL_SIZE", "0.05"))
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "2048"))
+# Expired entries are still served for up to this many seconds while a background refresh runs
+WEATHER_CACHE_MAX_STALE = int(os.getenv("WEATHER_CACHE_MAX_STALE", "1800"))
+
+# Background refresher: every interval, refetch the hottest cells that expire within the lead time
+WEATHER_REFRESH_ENABLED = os.getenv("WEATHER_REFRESH_ENABLED", "true").lower() == "true"
+WEATHER_REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", "30"))
+WEATHER_REFRESH_LEAD = float(os.getenv("WEATHER_REFRESH_LEAD", "60"))
+WEATHER_REFRESH_TOP_N = int(os.getenv("WEATHER_REFRESH_TOP_N", "50"))
+WEATHER_REFRESH_WORKERS = int(os.getenv("WEATHER_REFRESH_WORKERS", "4"))
+
+# Single-flight for identical upstream fetches; set UPSTREAM_LOCK_DIR to a directory
+# shared by all gunicorn workers to also coalesce across processes
+UPSTREAM_LOCK_DIR = os.getenv("UPSTREAM_LOCK_DIR")
+UPSTREAM_LOCK_TIMEOUT = float(os.getenv("UPSTREAM_LOCK_TIMEOUT", "15"))
+UPSTREAM_SHARE_TTL = float(os.getenv("UPSTREAM_SHARE_TTL", "5"))
+
+# OpenUV key pool: per-key daily quota (resets at 00:00 UTC) and circuit breaker
+OPENUV_DAILY_QUOTA = int(os.getenv("OPENUV_DAILY_QUOTA", "50"))
+OPENUV_FAILURE_THRESHOLD = int(os.getenv("OPENUV_FAILURE_THRESHOLD", "3"))
+OPENUV_COOLDOWN = float(os.getenv("OPENUV_COOLDOWN", "60"))
+OPENUV_MAX_COOLDOWN = float(os.getenv("OPENUV_MAX_COOLDOWN", "900"))
+# OpenUV answers are cached per grid cell, so a lookup that finishes late still serves the next check
+OPENUV_CACHE_TTL = int(os.getenv("OPENUV_CACHE_TTL", "900"))
+
+# Vitamin D check: upstream lookups run concurrently under one shared deadline (seconds)
+VITAMIN_CHECK_DEADLINE = float(os.getenv("VITAMIN_CHECK_DEADLINE", "6"))
+VITAMIN_FANOUT_WORKERS = int(os.getenv("VITAMIN_FANOUT_WORKERS", "8"))
+# How long to wait for OpenUV before answering with the local UV estimate (0 = estimate first)
+VITAMIN_UV_WAIT = float(os.getenv("VITAMIN_UV_WAIT", "6"))
+
+# Local sunrise/sunset engine: results memoized per (grid cell, date)
+SOLAR_CELL_SIZE = float(os.getenv("SOLAR_CELL_SIZE", "0.05"))
+SOLAR_CACHE_SIZE = int(os.getenv("SOLAR_CACHE_SIZE", "4096"))
+
+# Write-behind buffer for analytics inserts: flushed in batches by size or age (seconds)
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "2"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+# Rows that still fail after this many flushes (with the database reachable) are appended to the
+# dead-letter file as JSON lines instead of being queued again
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+WRITE_BEHIND_DEAD_LETTER = os.getenv("WRITE_BEHIND_DEAD_LETTER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "write_behind_dead_letter.jsonl"))
+
+# Analytics export: rows fetched per server-side cursor round-trip
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+# Background export jobs: compressed files are written to EXPORT_DIR and kept for EXPORT_FILE_TTL seconds.
+# EXPORT_JOB_MODE "thread" runs jobs on a small pool inside the web process, "worker" leaves
+# them to a separate `flask export-worker` process
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "exports"))
+EXPORT_JOB_MODE = os.getenv("EXPORT_JOB_MODE", "thread")
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", "2"))
+EXPORT_FILE_TTL = int(os.getenv("EXPORT_FILE_TTL", "86400"))
+EXPORT_STALE_AFTER = int(os.getenv("EXPORT_STALE_AFTER", "300"))
+EXPORT_POLL_INTERVAL = float(os.getenv("EXPORT_POLL_INTERVAL", "2"))
+# Seconds between expiring old files and picking up abandoned jobs inside the web process (thread mode)
+EXPORT_MAINTENANCE_INTERVAL = float(os.getenv("EXPORT_MAINTENANCE_INTERVAL", "60"))
+
+# Chart series: points returned when a request has no max_points, and the most it may ask for
+CHART_DEFAULT_POINTS = int(os.getenv("CHART_DEFAULT_POINTS", "1000"))
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "5000"))
+
+# Server-side cache of per-user analytics responses. RESPONSE_CACHE_BACKEND is "filesystem"
+# (RESPONSE_CACHE_DIR, shared by every process on the host, including the CLI), "redis"
+# (RESPONSE_CACHE_REDIS_URL, needs the redis package), "simple" (in-process, single worker only) or "null"
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "filesystem")
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "response_cache"))
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+# Analytics statistics: rolling windows (in buckets), and percentiles ranked exactly up to
+# STATISTICS_EXACT_MAX_ROWS readings, beyond that streamed into a sketch with this relative accuracy
+STATISTICS_DEFAULT_WINDOW = int(os.getenv("STATISTICS_DEFAULT_WINDOW", "7"))
+STATISTICS_MAX_WINDOW = int(os.getenv("STATISTICS_MAX_WINDOW", "1000"))
+STATISTICS_EXACT_MAX_ROWS = int(os.getenv("STATISTICS_EXACT_MAX_ROWS", "100000"))
+STATISTICS_SKETCH_ACCURACY = float(os.getenv("STATISTICS_SKETCH_ACCURACY", "0.01"))
+STATISTICS_CHUNK_SIZE = int(os.getenv("STATISTICS_CHUNK_SIZE", "10000"))
+
+# Raw-reading retention: days of raw rows kept per table (0 keeps them forever). `flask compact`
+# folds older readings into the rollups and deletes them in batches, pausing between batches
+RETENTION_WEATHER_DAYS = int(os.getenv("RETENTION_WEATHER_DAYS", "365"))
+RETENTION_AIR_QUALITY_DAYS = int(os.getenv("RETENTION_AIR_QUALITY_DAYS", "365"))
+RETENTION_DASHBOARD_DAYS = int(os.getenv("RETENTION_DASHBOARD_DAYS", "90"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.05"))
@@ -0,0 +1,43 @@
+"""Add daily activity ledger
+
+Revision ID: 4b7e2c91d3a8
+Revises: da79fc93c187
+Create Date: 2026-10-18 14:05:11.402318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2c91d3a8'
+down_revision = 'da79fc93c187'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_activity',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('action_type', sa.String(length=50), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('first_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'action_type', 'day', name='uq_daily_activity_user_action_day')
+    )
+
+    # Backfill from the activity log so today's first-of-the-day checks stay correct
+    op.execute(
+        "INSERT INTO daily_activity (user_id, action_type, day, count, first_at) "
+        "SELECT user_id, action_type, DATE(timestamp), COUNT(*), MIN(timestamp) "
+        "FROM user_activity "
+        "WHERE user_id IS NOT NULL AND action_type IS NOT NULL AND timestamp IS NOT NULL "
+        "GROUP BY user_id, action_type, DATE(timestamp)"
+    )
+
+
+def downgrade():
+    op.drop_table('daily_activity')
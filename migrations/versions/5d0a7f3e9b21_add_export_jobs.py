@@ -0,0 +1,45 @@
+"""Add export_job table for background analytics exports
+
+Revision ID: 5d0a7f3e9b21
+Revises: e83f0a6b4c17
+Create Date: 2026-10-18 19:12:40.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0a7f3e9b21'
+down_revision = 'e83f0a6b4c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('export_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('format', sa.String(length=16), nullable=False),
+    sa.Column('compression', sa.String(length=16), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('rows_total', sa.Integer(), nullable=True),
+    sa.Column('rows_written', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(length=255), nullable=True),
+    sa.Column('file_size', sa.BigInteger(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_export_job_user_created_at', 'export_job', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_export_job_status_created_at', 'export_job', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_export_job_status_created_at', table_name='export_job')
+    op.drop_index('ix_export_job_user_created_at', table_name='export_job')
+    op.drop_table('export_job')
@@ -0,0 +1,30 @@
+"""Add day indexes used by the raw-reading retention job
+
+Revision ID: 7f2b4c8d1e36
+Revises: 5d0a7f3e9b21
+Create Date: 2026-10-18 20:47:15.904213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f2b4c8d1e36'
+down_revision = '5d0a7f3e9b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_weather_analytics_date', 'weather_analytics', ['date'], unique=False)
+    op.create_index('ix_air_quality_analytics_date', 'air_quality_analytics', ['date'], unique=False)
+    op.create_index('ix_dashboard_data_recorded_at', 'dashboard_data', ['recorded_at'], unique=False)
+    # dashboard_data light and pH are rolled up from now on; run `flask rollups rebuild` to
+    # backfill them (older days are rolled up by `flask compact` before their rows are deleted)
+
+
+def downgrade():
+    op.drop_index('ix_dashboard_data_recorded_at', table_name='dashboard_data')
+    op.drop_index('ix_air_quality_analytics_date', table_name='air_quality_analytics')
+    op.drop_index('ix_weather_analytics_date', table_name='weather_analytics')
@@ -0,0 +1,52 @@
+"""Add daily and hourly analytics rollups
+
+Revision ID: 9c1d5e7a2f60
+Revises: 4b7e2c91d3a8
+Create Date: 2026-10-18 16:42:37.118904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1d5e7a2f60'
+down_revision = '4b7e2c91d3a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=32), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('min_value', sa.Float(), nullable=True),
+    sa.Column('max_value', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'metric', 'day', name='uq_daily_rollup_user_metric_day')
+    )
+    op.create_table('hourly_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=32), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('hour', sa.SmallInteger(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('min_value', sa.Float(), nullable=True),
+    sa.Column('max_value', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'metric', 'day', 'hour', name='uq_hourly_rollup_user_metric_day_hour')
+    )
+    # Run `flask rollups rebuild` afterwards to backfill from existing readings
+
+
+def downgrade():
+    op.drop_table('hourly_rollup')
+    op.drop_table('daily_rollup')
@@ -0,0 +1,29 @@
+"""Add note.updated_at for conditional GET on the notes list
+
+Revision ID: b4e9a2d6c851
+Revises: 7f2b4c8d1e36
+Create Date: 2026-10-18 22:05:41.318502
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e9a2d6c851'
+down_revision = '7f2b4c8d1e36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('note', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE note SET updated_at = created_at')
+    op.create_index('ix_note_user_updated_at', 'note', ['user_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_note_user_updated_at', table_name='note')
+    with op.batch_alter_table('note', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,26 @@
+"""Add export_job.claim_token so a reclaimed job's first runner can tell it lost the job
+
+Revision ID: c7d3f1a9e428
+Revises: b4e9a2d6c851
+Create Date: 2026-10-18 23:40:12.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d3f1a9e428'
+down_revision = 'b4e9a2d6c851'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('export_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claim_token', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_job', schema=None) as batch_op:
+        batch_op.drop_column('claim_token')
@@ -0,0 +1,32 @@
+"""Add data_version, the per-user edit/delete counters of the conditional GET token
+
+Revision ID: e2a8c5f04b17
+Revises: c7d3f1a9e428
+Create Date: 2026-10-19 09:14:27.552810
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a8c5f04b17'
+down_revision = 'c7d3f1a9e428'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'table_name', name='uq_data_version_user_table')
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,48 @@
+"""Add (user_id, time) composite indexes to per-user time-series tables
+
+Revision ID: e83f0a6b4c17
+Revises: 9c1d5e7a2f60
+Create Date: 2026-10-18 18:03:52.640117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e83f0a6b4c17'
+down_revision = '9c1d5e7a2f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_notification_user_timestamp', 'notification', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_notification_user_read_timestamp', 'notification', ['user_id', 'is_read', 'timestamp'], unique=False)
+    op.create_index('ix_dashboard_data_user_recorded_at', 'dashboard_data', ['user_id', 'recorded_at'], unique=False)
+    op.create_index('ix_carbon_log_user_logged_at', 'carbon_log', ['user_id', 'logged_at'], unique=False)
+    op.create_index('ix_vitamin_log_user_created_at', 'vitamin_log', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_weather_analytics_user_date_time', 'weather_analytics', ['user_id', 'date', 'time'], unique=False)
+    op.create_index('ix_air_quality_analytics_user_date_time', 'air_quality_analytics', ['user_id', 'date', 'time'], unique=False)
+    op.create_index('ix_vitamin_d_record_user_timestamp', 'vitamin_d_record', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_vitamin_d_history_user_timestamp', 'vitamin_d_history', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_note_user_created_at', 'note', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_article_user_created_at', 'article', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_user_activity_user_timestamp', 'user_activity', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_article_comment_article_created_at', 'article_comment', ['article_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_article_comment_article_created_at', table_name='article_comment')
+    op.drop_index('ix_user_activity_user_timestamp', table_name='user_activity')
+    op.drop_index('ix_article_user_created_at', table_name='article')
+    op.drop_index('ix_note_user_created_at', table_name='note')
+    op.drop_index('ix_vitamin_d_history_user_timestamp', table_name='vitamin_d_history')
+    op.drop_index('ix_vitamin_d_record_user_timestamp', table_name='vitamin_d_record')
+    op.drop_index('ix_air_quality_analytics_user_date_time', table_name='air_quality_analytics')
+    op.drop_index('ix_weather_analytics_user_date_time', table_name='weather_analytics')
+    op.drop_index('ix_vitamin_log_user_created_at', table_name='vitamin_log')
+    op.drop_index('ix_carbon_log_user_logged_at', table_name='carbon_log')
+    op.drop_index('ix_dashboard_data_user_recorded_at', table_name='dashboard_data')
+    op.drop_index('ix_notification_user_read_timestamp', table_name='notification')
+    op.drop_index('ix_notification_user_timestamp', table_name='notification')
@@ -0,0 +1,22 @@
+import numpy as np
+
+from app.utils.aqi import BREAKPOINTS, sub_index
+
+
+def test_ozone_index_never_decreases():
+    ppb = np.arange(0, 700)
+    index = sub_index('o3', ppb, converted=True)
+    assert np.all(np.diff(index) >= 0)
+
+
+def test_ozone_index_at_band_edges():
+    index = sub_index('o3', [54, 200, 250, 404, 405, 604, 605], converted=True)
+    assert np.rint(index).tolist() == [50, 300, 300, 300, 301, 500, 500]
+
+
+def test_every_table_is_monotonic():
+    for pollutant, bands in BREAKPOINTS.items():
+        top = bands[-1][1]
+        values = np.linspace(0, top * 1.2, 2000)
+        index = sub_index(pollutant, values, converted=True)
+        assert np.all(np.diff(index) >= 0), pollutant